@@ -15,6 +15,9 @@ import time
 
 from pygame.locals import *
 
+import flippy_ai
+import flippy_bitboard
+
 FPS = 10  # frames per second to update the screen
 WINDOW_WIDTH = 640  # width of the program's window, in pixels
 WINDOW_HEIGHT = 480  # height in pixels
@@ -45,9 +48,14 @@ GRID_LINE_COLOR = BLACK
 TEXT_COLOR = WHITE
 HINT_COLOR = BROWN
 
+DEFAULT_STRENGTH = 'Medium'  # how well the computer plays, one of flippy_ai.STRENGTH_NAMES
+# The computer always takes at least this long (a random number of seconds in this range) to
+# move, so it looks like it is thinking even when it finds its move right away.
+MIN_THINKING_TIME = (0.5, 1.5)
+
 
 def main():
-    global MAIN_CLOCK, DISPLAY_SURF, FONT, BIG_FONT, BG_IMAGE
+    global MAIN_CLOCK, DISPLAY_SURF, FONT, BIG_FONT, BG_IMAGE, computer_strength
 
     pygame.init()
     MAIN_CLOCK = pygame.time.Clock()
@@ -68,6 +76,9 @@ def main():
     BG_IMAGE = pygame.transform.smoothscale(BG_IMAGE, (WINDOW_WIDTH, WINDOW_HEIGHT))
     BG_IMAGE.blit(board_image, board_image_rect)
 
+    # The computer's strength is kept from one game to the next.
+    computer_strength = DEFAULT_STRENGTH
+
     # Run the main game.
     while True:
         if run_game() is False:
@@ -76,12 +87,15 @@ def main():
 
 def run_game():
     # Plays a single game of reversi each time this function is called.
+    global computer_strength
 
     # Reset the board and game.
     main_board = get_new_board()
     reset_board(main_board)
     show_hints = False
     turn = random.choice(['computer', 'player'])
+    # The computer's searches remember positions for the whole game (see flippy_ai.py).
+    transposition_table = flippy_ai.TranspositionTable()
 
     # Draw the starting board and ask the player what color they want.
     draw_board(main_board)
@@ -94,6 +108,7 @@ def run_game():
     hints_surf = FONT.render('Hints', True, TEXT_COLOR, TEXT_BG_COLOR_2)
     hints_rect = hints_surf.get_rect()
     hints_rect.topright = (WINDOW_WIDTH - 8, 40)
+    strength_surf, strength_rect = make_strength_button()
 
     while True:  # main game loop
         # Keep looping for player and computer's turns.
@@ -123,6 +138,12 @@ def run_game():
                         elif hints_rect.collidepoint((mouse_x, mouse_y)):
                             # Toggle hints mode
                             show_hints = not show_hints
+                        elif strength_rect.collidepoint((mouse_x, mouse_y)):
+                            # Change to the next strength, going back to the first after the last.
+                            strength_index = flippy_ai.STRENGTH_NAMES.index(computer_strength)
+                            computer_strength = flippy_ai.STRENGTH_NAMES[
+                                (strength_index + 1) % len(flippy_ai.STRENGTH_NAMES)]
+                            strength_surf, strength_rect = make_strength_button()
                         # move_x_y is set to a two-item tuple XY coordinate, or None value
                         move_x_y = get_space_clicked(mouse_x, mouse_y)
                         if move_x_y != None and not is_valid_move(main_board, player_tile,
@@ -133,9 +154,10 @@ def run_game():
                 draw_board(board_to_draw)
                 draw_info(board_to_draw, player_tile, computer_tile, turn)
 
-                # Draw the "New Game" and "Hints" buttons.
+                # Draw the "New Game", "Hints" and strength buttons.
                 DISPLAY_SURF.blit(new_game_surf, new_game_rect)
                 DISPLAY_SURF.blit(hints_surf, hints_rect)
+                DISPLAY_SURF.blit(strength_surf, strength_rect)
 
                 MAIN_CLOCK.tick(FPS)
                 pygame.display.update()
@@ -152,21 +174,43 @@ def run_game():
                 # If it was set to be the computer's turn but they can't move, then end the game.
                 break
 
-            # Draw the board.
-            draw_board(main_board)
-            draw_info(main_board, player_tile, computer_tile, turn)
+            # The computer looks for its move on another thread (see flippy_ai.py), and this loop
+            # keeps the window responding until the move is found. Even if the move is found
+            # right away, it isn't made until the thinking time is over.
+            move_finder = flippy_ai.MoveFinder(main_board, computer_tile, player_tile,
+                                               computer_strength, transposition_table)
+            pause_until = time.time() + random.uniform(*MIN_THINKING_TIME)
+            while not move_finder.is_done() or time.time() < pause_until:
+                check_for_quit(move_finder)
+                for event in pygame.event.get():  # event handling loop
+                    if event.type == MOUSEBUTTONUP:
+                        # Clicks on the board are ignored while the computer is thinking.
+                        mouse_x, mouse_y = event.pos
+                        if new_game_rect.collidepoint((mouse_x, mouse_y)):
+                            # start a new game, and stop the search since it isn't needed
+                            move_finder.cancel()
+                            return True
+                        elif hints_rect.collidepoint((mouse_x, mouse_y)):
+                            # Toggle hints mode (they are shown on the player's turn)
+                            show_hints = not show_hints
+
+                # Draw the game board.
+                draw_board(main_board)
+                draw_info(main_board, player_tile, computer_tile, turn)
 
-            # Draw the "New Game" and "Hints" buttons.
-            DISPLAY_SURF.blit(new_game_surf, new_game_rect)
-            DISPLAY_SURF.blit(hints_surf, hints_rect)
+                # Draw the "New Game", "Hints" and strength buttons.
+                DISPLAY_SURF.blit(new_game_surf, new_game_rect)
+                DISPLAY_SURF.blit(hints_surf, hints_rect)
+                DISPLAY_SURF.blit(strength_surf, strength_rect)
 
-            # Make it look like the computer is thinking by pausing a bit.
-            pause_until = time.time() + random.randint(5, 15) * 0.1
-            while time.time() < pause_until:
                 pygame.display.update()
+                MAIN_CLOCK.tick(FPS)
 
-            # Make the move and end the turn.
-            x, y = get_computer_move(main_board, computer_tile)
+            # Make the move and end the turn. If the search failed, use the simple computer player.
+            if move_finder.get_move() is None:
+                x, y = get_computer_move(main_board, computer_tile)
+            else:
+                x, y = move_finder.get_move()
             make_move(main_board, computer_tile, x, y, True)
             if get_valid_moves(main_board, player_tile) != []:
                 # Only set for the player's turn if they can make a move.
@@ -224,6 +268,15 @@ def run_game():
         MAIN_CLOCK.tick(FPS)
 
 
+def make_strength_button():
+    # Returns the Surface and Rect of the button that shows (and changes) the computer's strength.
+    strength_surf = FONT.render('Computer: %s' % (computer_strength), True, TEXT_COLOR,
+                                TEXT_BG_COLOR_2)
+    strength_rect = strength_surf.get_rect()
+    strength_rect.topright = (WINDOW_WIDTH - 8, 70)
+    return strength_surf, strength_rect
+
+
 def translate_board_to_pixel_coord(x, y):
     return X_MARGIN + x * SPACE_SIZE + int(SPACE_SIZE / 2), Y_MARGIN + y * SPACE_SIZE + int(
         SPACE_SIZE / 2)
@@ -343,51 +396,23 @@ def get_new_board():
 
 def is_valid_move(board, tile, x_start, y_start):
     # Returns False if the player's move is invalid. If it is a valid move, returns a list of
-    # spaces of the captured pieces.
-    if board[x_start][y_start] != EMPTY_SPACE or not is_on_board(x_start, y_start):
+    # spaces of the captured pieces. The tiles to flip are found on bitboards (see
+    # flippy_bitboard.py), which checks all eight directions at once.
+    if not is_on_board(x_start, y_start) or board[x_start][y_start] != EMPTY_SPACE:
         return False
 
-    board[x_start][y_start] = tile  # temporarily set the tile on the board.
+    own, other = flippy_bitboard.get_bitboards(board, tile, get_other_tile(tile))
+    flips = flippy_bitboard.get_flips(own, other, flippy_bitboard.xy_to_bit(x_start, y_start))
+    if flips == 0:  # If no tiles flipped, this move is invalid
+        return False
+    return [list(flippy_bitboard.bit_to_xy(bit)) for bit in flippy_bitboard.iterate_bits(flips)]
+
 
+def get_other_tile(tile):
+    # Returns the tile of the other player.
     if tile == WHITE_TILE:
-        other_tile = BLACK_TILE
-    else:
-        other_tile = WHITE_TILE
-
-    tiles_to_flip = []
-    # check each of the eight directions:
-    for x_direction, y_direction in [[0, 1], [1, 1], [1, 0], [1, -1], [0, -1], [-1, -1], [-1, 0],
-                                     [-1, 1]]:
-        x, y = x_start, y_start
-        x += x_direction
-        y += y_direction
-        if is_on_board(x, y) and board[x][y] == other_tile:
-            # The piece belongs to the other player next to our piece.
-            x += x_direction
-            y += y_direction
-            if not is_on_board(x, y):
-                continue
-            while board[x][y] == other_tile:
-                x += x_direction
-                y += y_direction
-                if not is_on_board(x, y):
-                    break  # break out of while loop, continue in for loop
-            if not is_on_board(x, y):
-                continue
-            if board[x][y] == tile:
-                # There are pieces to flip over. Go in the reverse direction until we reach the
-                # original space, noting all the tiles along the way.
-                while True:
-                    x -= x_direction
-                    y -= y_direction
-                    if x == x_start and y == y_start:
-                        break
-                    tiles_to_flip.append([x, y])
-
-    board[x_start][y_start] = EMPTY_SPACE  # make space empty
-    if len(tiles_to_flip) == 0:  # If no tiles flipped, this move is invalid
-        return False
-    return tiles_to_flip
+        return BLACK_TILE
+    return WHITE_TILE
 
 
 def is_on_board(x, y):
@@ -405,27 +430,18 @@ def get_board_with_valid_moves(board, tile):
 
 
 def get_valid_moves(board, tile):
-    # Returns a list of (x, y) tuples of all valid moves.
-    valid_moves = []
-
-    for x in range(BOARD_WIDTH):
-        for y in range(BOARD_HEIGHT):
-            if is_valid_move(board, tile, x, y):
-                valid_moves.append((x, y))
-    return valid_moves
+    # Returns a list of (x, y) tuples of all valid moves, sorted by x and then y. They are all
+    # found at once on bitboards, instead of checking each space with is_valid_move().
+    own, other = flippy_bitboard.get_bitboards(board, tile, get_other_tile(tile))
+    moves = flippy_bitboard.get_moves(own, other)
+    return sorted(flippy_bitboard.bit_to_xy(bit) for bit in flippy_bitboard.iterate_bits(moves))
 
 
 def get_score_of_board(board):
     # Determine the score by counting the tiles.
-    x_score = 0
-    o_score = 0
-    for x in range(BOARD_WIDTH):
-        for y in range(BOARD_HEIGHT):
-            if board[x][y] == WHITE_TILE:
-                x_score += 1
-            if board[x][y] == BLACK_TILE:
-                o_score += 1
-    return {WHITE_TILE: x_score, BLACK_TILE: o_score}
+    white, black = flippy_bitboard.get_bitboards(board, WHITE_TILE, BLACK_TILE)
+    return {WHITE_TILE: flippy_bitboard.count_bits(white),
+            BLACK_TILE: flippy_bitboard.count_bits(black)}
 
 
 def enter_player_tile():
@@ -514,9 +530,13 @@ def get_computer_move(board, computer_tile):
     return best_move
 
 
-def check_for_quit():
+def check_for_quit(move_finder=None):
+    # Exits the program if the window is closed or Esc is pressed. If the computer is thinking,
+    # its move_finder is cancelled first.
     for event in pygame.event.get((QUIT, KEYUP)):  # event handling loop
         if event.type == QUIT or (event.type == KEYUP and event.key == K_ESCAPE):
+            if move_finder is not None:
+                move_finder.cancel()
             pygame.quit()
             sys.exit()
 
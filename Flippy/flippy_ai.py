@@ -0,0 +1,381 @@
+# Flippy search AI
+# A computer player that looks several moves ahead, with a time limit for each move.
+#
+# The search is a negamax search with alpha-beta pruning on bitboards (see flippy_bitboard.py):
+#   * Negamax scores every position for the player whose turn it is, so the score of a move for
+#     one player is minus the score of the position it leaves for the other player.
+#   * Alpha-beta pruning stops looking at a player's other moves once one of them is already
+#     better than what the other player would allow. It prunes the most when the best moves are
+#     looked at first, so moves are ordered from the best kinds of spaces (corners) to the worst
+#     (the spaces next to the corners).
+#   * Iterative deepening searches 1 move ahead, then 2, then 3, and so on until the time runs
+#     out, and each pass looks at the best move of the last pass first. If the time runs out in
+#     the middle of a pass, the best move of the last finished pass is used.
+# Positions are scored by the weights of the spaces each player has (corners are very good, the
+# spaces next to them are bad) and by how many moves each player can make. A finished game is
+# scored by the difference in the number of tiles, the same way get_score_of_board() counts
+# them, times FINAL_DISC_SCORE so that winning is always better than any other score.
+#
+# A transposition table remembers the result of every position searched, keyed by its Zobrist key
+# (see flippy_bitboard.py). The same position is often reached by different orders of moves, and
+# each pass of iterative deepening searches the same positions again as the last one did, so the
+# table lets the search skip positions it has already searched deep enough, and look at the best
+# move found for a position first. One table is kept for a whole game.
+#
+# Once only a few empty spaces are left, the endgame solver (see flippy_endgame.py) searches to
+# the end of the game and finds the perfect move. It gets most of the time for the move, after a
+# short normal search that finds a move to fall back on in case the solver runs out of time.
+#
+# For the first moves of the game, the stronger computers play the move from the opening book
+# (see flippy_book.py) if the position is in it, without searching at all.
+#
+# The search for the computer's move runs on a separate thread (see MoveFinder), so the game's
+# window keeps responding while the computer is thinking.
+
+import random
+import threading
+import time
+import traceback
+
+from flippy_bitboard import BOARD_WIDTH, get_bitboards, get_moves, get_flips, iterate_bits, \
+    bit_to_xy, xy_to_bit, count_bits, get_zobrist_key, get_move_keys
+from flippy_endgame import solve_endgame
+from flippy_book import OpeningBook
+
+# The settings of each strength the computer can play at, from weakest to strongest. 'depth' is
+# how many moves ahead it can look, 'time' is the most seconds it can think about a move, and
+# 'noise' is the most points of randomness added to the score of each move, so that weaker
+# computers sometimes pick worse moves. 'endgame' is how many empty spaces can be left for the
+# endgame solver to be used (0 to never use it), and 'book' is whether it plays opening book moves.
+STRENGTH_NAMES = ['Easy', 'Medium', 'Hard', 'Expert']
+STRENGTHS = {'Easy': {'depth': 1, 'time': 0.5, 'noise': 40, 'endgame': 0, 'book': False},
+             'Medium': {'depth': 3, 'time': 1.0, 'noise': 10, 'endgame': 0, 'book': False},
+             'Hard': {'depth': 6, 'time': 2.0, 'noise': 0, 'endgame': 10, 'book': True},
+             'Expert': {'depth': 60, 'time': 5.0, 'noise': 0, 'endgame': 14, 'book': True}}
+ENDGAME_SEARCH_SHARE = 0.2  # the part of the time for the normal search before the endgame solver
+
+# How good it is to have a tile on each space, as rows from top to bottom.
+SQUARE_WEIGHTS = [[100, -20, 10, 5, 5, 10, -20, 100],
+                  [-20, -50, -2, -2, -2, -2, -50, -20],
+                  [10, -2, -1, -1, -1, -1, -2, 10],
+                  [5, -2, -1, -1, -1, -1, -2, 5],
+                  [5, -2, -1, -1, -1, -1, -2, 5],
+                  [10, -2, -1, -1, -1, -1, -2, 10],
+                  [-20, -50, -2, -2, -2, -2, -50, -20],
+                  [100, -20, 10, 5, 5, 10, -20, 100]]
+MOBILITY_SCORE = 5  # points for each move a player can make
+FINAL_DISC_SCORE = 10000  # points for each tile a player is ahead by when the game is over
+INFINITY = FINAL_DISC_SCORE * 100
+
+CHECK_TIME_NODES = 1000  # the time limit is checked each time this many positions are searched
+
+TABLE_SIZE_BITS = 18  # the transposition table has 2 ** TABLE_SIZE_BITS entries
+
+# What the score stored in a transposition table entry means:
+EXACT = 0  # it is the score
+LOWER_BOUND = 1  # the score is at least this (a move was good enough to stop the search)
+UPPER_BOUND = 2  # the score is at most this (no move was better than alpha)
+
+
+def get_weight_masks():
+    # Returns a list of (weight, bitboard) pairs, one for each different weight in
+    # SQUARE_WEIGHTS, with the spaces that have that weight.
+    masks = {}
+    for y in range(len(SQUARE_WEIGHTS)):
+        for x in range(BOARD_WIDTH):
+            weight = SQUARE_WEIGHTS[y][x]
+            masks[weight] = masks.get(weight, 0) | xy_to_bit(x, y)
+    return sorted(masks.items(), reverse=True)
+
+
+WEIGHT_MASKS = get_weight_masks()
+# The order moves are looked at in: the spaces with the highest weight first.
+ORDER_MASKS = [mask for weight, mask in WEIGHT_MASKS]
+
+
+class SearchTimeout(Exception):
+    # Raised inside a search when it runs out of time or is cancelled.
+    pass
+
+
+def evaluate(own, other):
+    # Returns the score of the position for the player with the own tiles, whose turn it is.
+    score = 0
+    for weight, mask in WEIGHT_MASKS:
+        score += weight * (count_bits(own & mask) - count_bits(other & mask))
+    own_moves = count_bits(get_moves(own, other))
+    other_moves = count_bits(get_moves(other, own))
+    return score + MOBILITY_SCORE * (own_moves - other_moves)
+
+
+def get_final_score(own, other):
+    # Returns the score of a finished game for the player with the own tiles.
+    return (count_bits(own) - count_bits(other)) * FINAL_DISC_SCORE
+
+
+def order_moves(moves, first=0):
+    # Returns the moves in a bitboard as a list of one-space bitboards, with the first move (if
+    # it is one of them) at the front and the rest in ORDER_MASKS order.
+    ordered = []
+    if moves & first:
+        ordered.append(first)
+        moves ^= first
+    for mask in ORDER_MASKS:
+        ordered.extend(iterate_bits(moves & mask))
+    return ordered
+
+
+class TranspositionTable(object):
+    # A fixed-size table of search results, indexed by the low bits of the position's Zobrist
+    # key. Each entry is a tuple of (key, depth, generation, bound, score, best move).
+    #
+    # When two positions need the same entry, the new one replaces the old one if the old one
+    # is from an earlier search (an earlier move of the game), or wasn't searched any deeper.
+    # That keeps the deep results, which saved the most work, until they are out of date.
+
+    def __init__(self, size_bits=TABLE_SIZE_BITS):
+        self.mask = (1 << size_bits) - 1
+        self.entries = [None] * (1 << size_bits)
+        self.generation = 0
+
+    def new_search(self):
+        # Called at the start of each search, so older entries are replaced first.
+        self.generation += 1
+
+    def probe(self, key):
+        # Returns the entry for the position with the key, or None if there isn't one.
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, bound, score, move):
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is None or entry[2] != self.generation or depth >= entry[1]:
+            self.entries[index] = (key, depth, self.generation, bound, score, move)
+
+
+class Search(object):
+    # One search for the best move, with its time limit, transposition table and node count.
+
+    def __init__(self, time_limit=None, cancel_event=None, table=None):
+        self.deadline = None if time_limit is None else time.time() + time_limit
+        self.cancel_event = cancel_event
+        self.table = table if table is not None else TranspositionTable()
+        self.table.new_search()
+        self.nodes = 0
+        self.table_hits = 0  # how many positions were answered from the table
+
+    def check_time(self):
+        # Raises SearchTimeout if the search is out of time or has been cancelled.
+        if (self.deadline is not None and time.time() > self.deadline) or \
+           (self.cancel_event is not None and self.cancel_event.is_set()):
+            raise SearchTimeout()
+
+    def negamax(self, own, other, keys, depth, alpha, beta, passed=False):
+        # Returns the score of the position for the player with the own tiles, looking depth
+        # moves ahead. keys is the position's pair of Zobrist keys (see get_move_keys()). Scores
+        # outside alpha..beta only need to be right about which side of it they are on.
+        self.nodes += 1
+        if self.nodes % CHECK_TIME_NODES == 0:
+            self.check_time()
+
+        moves = get_moves(own, other)
+        if not moves:
+            if passed:
+                # Neither player can move, so the game is over.
+                return get_final_score(own, other)
+            # The player has to pass. Passing doesn't use up any depth.
+            return -self.negamax(other, own, (keys[1], keys[0]), depth, -beta, -alpha, True)
+        if depth == 0:
+            return evaluate(own, other)
+
+        # Use what the table knows about this position. (Positions at depth 0 aren't stored,
+        # since scoring them is about as quick as looking them up.)
+        key = keys[0]
+        table_move = 0
+        entry = self.table.probe(key)
+        if entry is not None:
+            table_move = entry[5]
+            if entry[1] >= depth:
+                bound, score = entry[3], entry[4]
+                if bound == EXACT or (bound == LOWER_BOUND and score >= beta) or \
+                   (bound == UPPER_BOUND and score <= alpha):
+                    self.table_hits += 1
+                    return score
+
+        original_alpha = alpha
+        best = -INFINITY
+        best_move = 0
+        for move in order_moves(moves, table_move):
+            flips = get_flips(own, other, move)
+            score = -self.negamax(other & ~flips, own | move | flips,
+                                  get_move_keys(keys, move, flips), depth - 1, -beta, -alpha)
+            if score > best:
+                best = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break  # the other player won't allow this position
+
+        if best <= original_alpha:
+            bound = UPPER_BOUND
+        elif best >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.table.store(key, depth, bound, best, best_move)
+        return best
+
+    def search_root(self, own, other, depth, root_moves):
+        # Searches each of the root moves (a list of (noise, move) pairs) depth moves ahead and
+        # returns a list of (score, move) pairs, best first.
+        alpha = -INFINITY
+        scored = []
+        keys = (get_zobrist_key(own, other), get_zobrist_key(other, own))
+        for move_noise, move in root_moves:
+            flips = get_flips(own, other, move)
+            # Each move only has to be searched well enough to tell if it beats the best so far
+            # (once its noise is added).
+            score = -self.negamax(other & ~flips, own | move | flips,
+                                  get_move_keys(keys, move, flips), depth - 1, -INFINITY,
+                                  move_noise - alpha)
+            score += move_noise
+            scored.append((score, move))
+            alpha = max(alpha, score)
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return scored
+
+
+def find_best_move(own, other, max_depth, time_limit=None, noise=0, rand=None,
+                   cancel_event=None, table=None, endgame_empties=0):
+    # Finds the best move for the player with the own tiles, searching up to max_depth moves
+    # ahead, and stopping after time_limit seconds (or when cancel_event is set). table is the
+    # TranspositionTable to use, which should be kept for the whole game; if it is None a new
+    # one is made just for this search. If endgame_empties or fewer spaces are empty, the
+    # endgame solver is tried as well. Returns a dict with the result:
+    #     'move'  - the (x, y) of the best move, or None if the player has no moves.
+    #     'score' - the score of the best move.
+    #     'depth' - how many moves ahead the last finished pass looked.
+    #     'exact' - True if the endgame solver found the move, and the score is exact.
+    #     'book'  - True if the move came from the opening book (only from get_search_move()).
+    #     'nodes' - how many positions were searched.
+    #     'table_hits' - how many of them were answered from the transposition table.
+    #     'time'  - how many seconds the search took.
+    start_time = time.time()
+    empties = BOARD_WIDTH * BOARD_WIDTH - count_bits(own | other)
+    use_endgame = empties <= endgame_empties
+    search_time = time_limit
+    if use_endgame and time_limit is not None:
+        search_time = time_limit * ENDGAME_SEARCH_SHARE
+    search = Search(search_time, cancel_event, table)
+    result = {'move': None, 'score': 0, 'depth': 0, 'exact': False, 'book': False, 'nodes': 0,
+              'table_hits': 0, 'time': 0.0}
+    moves = get_moves(own, other)
+    if moves:
+        if rand is None:
+            rand = random.Random()
+        # The noise for each move is picked once, so every pass agrees about it.
+        root_moves = [(rand.randint(0, noise) if noise else 0, move)
+                      for move in order_moves(moves)]
+        best = root_moves[0][1]
+        result['move'] = bit_to_xy(best)
+        if len(root_moves) > 1:
+            for depth in range(1, min(max_depth, empties) + 1):
+                try:
+                    scored = search.search_root(own, other, depth, root_moves)
+                except SearchTimeout:
+                    break  # keep the best move of the last finished pass
+                result['score'], best = scored[0]
+                result['move'] = bit_to_xy(best)
+                result['depth'] = depth
+                # Look at the best moves of this pass first in the next pass.
+                noise_of = dict((move, move_noise) for move_noise, move in root_moves)
+                root_moves = [(noise_of[move], move) for score, move in scored]
+
+            if use_endgame:
+                remaining_time = None
+                if time_limit is not None:
+                    remaining_time = max(0.0, time_limit - (time.time() - start_time))
+                solved = solve_endgame(own, other, remaining_time, cancel_event)
+                if solved is not None:
+                    result['move'] = solved['move']
+                    result['score'] = solved['score'] * FINAL_DISC_SCORE
+                    result['exact'] = True
+                    search.nodes += solved['nodes']
+    result['nodes'] = search.nodes
+    result['table_hits'] = search.table_hits
+    result['time'] = time.time() - start_time
+    return result
+
+
+opening_book = None  # the OpeningBook, opened the first time it is needed
+
+
+def get_opening_book():
+    global opening_book
+    if opening_book is None:
+        opening_book = OpeningBook()
+    return opening_book
+
+
+def get_search_move(board, tile, other_tile, strength, cancel_event=None, table=None,
+                    rand=None):
+    # Returns the find_best_move() result for the player with tile on a flippy.py board, playing
+    # at one of the STRENGTHS. If the strength uses the opening book and the position is in it,
+    # the book move is returned without searching. rand is the random.Random for the strength's
+    # noise (see find_best_move()).
+    settings = STRENGTHS[strength]
+    own, other = get_bitboards(board, tile, other_tile)
+    if settings['book']:
+        start_time = time.time()
+        book_move = get_opening_book().get_move(own, other)
+        if book_move is not None:
+            return {'move': book_move, 'score': 0, 'depth': 0, 'exact': False, 'book': True,
+                    'nodes': 0, 'table_hits': 0, 'time': time.time() - start_time}
+    return find_best_move(own, other, settings['depth'], settings['time'], settings['noise'],
+                          rand=rand, cancel_event=cancel_event, table=table,
+                          endgame_empties=settings['endgame'])
+
+
+class MoveFinder(object):
+    # Finds the computer's move on a background thread, so the game can keep drawing the window
+    # and handling events while it thinks.
+
+    def __init__(self, board, tile, other_tile, strength, table=None):
+        self.result = None
+        self.error = None  # the exception, if the search failed
+        self.cancel_event = threading.Event()
+        # The thread gets its own copy of the board, since the game might change it.
+        board = [list(column) for column in board]
+        self.thread = threading.Thread(target=self.search,
+                                       args=(board, tile, other_tile, strength, table))
+        self.thread.daemon = True  # don't keep the program running just for a search
+        self.thread.start()
+
+    def search(self, board, tile, other_tile, strength, table):
+        # If the search fails, the error is kept (and printed) instead of the thread just dying,
+        # so the game doesn't wait for a move forever.
+        try:
+            self.result = get_search_move(board, tile, other_tile, strength, self.cancel_event,
+                                          table)
+        except Exception as error:
+            traceback.print_exc()
+            self.error = error
+
+    def is_done(self):
+        # Returns True once the move has been found, or the search has failed.
+        return self.result is not None or self.error is not None
+
+    def get_move(self):
+        # Returns the (x, y) of the move that was found, or None if it isn't found yet or the
+        # search failed.
+        if self.result is None:
+            return None
+        return self.result['move']
+
+    def cancel(self):
+        # Tells the search to stop. This doesn't wait for the thread to finish.
+        self.cancel_event.set()
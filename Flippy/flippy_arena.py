@@ -0,0 +1,371 @@
+# Flippy arena
+# Plays lots of games between computer players without a window, to find out which is stronger.
+#
+# The players are:
+#   Random - picks any valid move.
+#   Greedy - get_computer_move() from flippy.py: takes a corner if it can, and otherwise the
+#            move that flips the most tiles.
+#   Easy, Medium, Hard and Expert - the search AI (see flippy_ai.py) at each of its strengths.
+# Every pair of players plays --games games against each other. The games are played on a
+# process pool, one game at a time in each process, using the same board and move functions as
+# the game (but never animate_tile_change() or anything else that draws).
+#
+# Since the stronger players always pick the same move in the same position, each game starts
+# after OPENING_PLIES random moves. Each opening is played twice, with the players swapping
+# colors, so neither player gets the better side of an opening more often.
+#
+# The results are:
+#   * For each pair of players, the wins, draws and losses, the score (a win is 1 point and a
+#     draw is half a point) with its 95% confidence interval, and the Elo rating difference that
+#     score means. The score's interval is a Wilson score interval, which stays wide when one
+#     player wins (or loses) every game, instead of claiming the score is certain.
+#   * An Elo rating for each player, fitted to every game at once, with its 95% confidence
+#     interval. The first player listed is fixed at 0. Each pair of players also gets one drawn
+#     "made up" game, so a player who wins or loses every game doesn't get an infinite rating.
+# The rating intervals are the usual normal approximations, so they are only meaningful after a
+# few dozen games per pair. A pair's Elo difference is infinite when one player won every game;
+# the JSON output writes infinite values as null, since JSON has no way to write infinity.
+#
+# Each game's random numbers (the opening and the search players' noise) come from that game's
+# seed, which comes from --seed, so a run with the same --seed and players plays the same games.
+# (A time limit per move can still change the games, since how deep a search gets in time
+# depends on the computer.)
+#
+# Usage: python flippy_arena.py [--players Random Greedy Easy Medium] [--games 100]
+#                               [--workers 4] [--time-limit 0.1] [--output results.json]
+
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+# Keep pygame's greeting out of the results (flippy.py imports pygame, but nothing here draws).
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import flippy
+import flippy_ai
+
+PLAYER_NAMES = ['Random', 'Greedy'] + flippy_ai.STRENGTH_NAMES
+DEFAULT_PLAYERS = ['Random', 'Greedy', 'Easy', 'Medium']
+DEFAULT_GAMES = 100  # games per pair of players
+OPENING_PLIES = 4  # how many random moves each game starts with
+CONFIDENCE_Z = 1.96  # how many standard errors a 95% confidence interval is on each side
+RATING_ITERATIONS = 1000  # the most passes the rating fit makes
+ELO_SCALE = 400.0  # a player rated this much higher is expected to score 10 times as much
+
+
+def init_worker(time_limit):
+    # Runs once in each process of the pool. If a time limit was given, every search strength
+    # uses it instead of its usual time per move (0 means no time limit, only the depth).
+    if time_limit is not None:
+        for strength in flippy_ai.STRENGTH_NAMES:
+            settings = dict(flippy_ai.STRENGTHS[strength])
+            settings['time'] = time_limit if time_limit > 0 else None
+            flippy_ai.STRENGTHS[strength] = settings
+
+
+def get_arena_move(player, board, tile, rand, table):
+    # Returns the (x, y) of the move the player picks for tile on the board.
+    if player == 'Random':
+        return rand.choice(flippy.get_valid_moves(board, tile))
+    if player == 'Greedy':
+        return flippy.get_computer_move(board, tile)
+    result = flippy_ai.get_search_move(board, tile, flippy.get_other_tile(tile), player,
+                                       table=table, rand=rand)
+    return result['move']
+
+
+def play_game(game):
+    # Plays one game, a (black player, white player, seed) tuple, and returns (black player,
+    # white player, black tiles, white tiles, seconds per move for black, and for white).
+    black_player, white_player, seed = game
+    rand = random.Random(seed)
+    random.seed(seed)  # get_computer_move() uses the random module for its shuffle
+
+    board = flippy.get_new_board()
+    flippy.reset_board(board)
+    players = {flippy.BLACK_TILE: black_player, flippy.WHITE_TILE: white_player}
+    tables = {flippy.BLACK_TILE: flippy_ai.TranspositionTable(),
+              flippy.WHITE_TILE: flippy_ai.TranspositionTable()}
+    think_time = {flippy.BLACK_TILE: 0.0, flippy.WHITE_TILE: 0.0}
+    move_count = {flippy.BLACK_TILE: 0, flippy.WHITE_TILE: 0}
+    tile = flippy.BLACK_TILE
+    plies = 0
+    while True:
+        if not flippy.get_valid_moves(board, tile):
+            tile = flippy.get_other_tile(tile)  # this player has to pass
+            if not flippy.get_valid_moves(board, tile):
+                break  # neither player can move, so the game is over
+        if plies < OPENING_PLIES:
+            x, y = rand.choice(flippy.get_valid_moves(board, tile))
+        else:
+            start_time = time.time()
+            x, y = get_arena_move(players[tile], board, tile, rand, tables[tile])
+            think_time[tile] += time.time() - start_time
+            move_count[tile] += 1
+        flippy.make_move(board, tile, x, y)
+        plies += 1
+        tile = flippy.get_other_tile(tile)
+
+    scores = flippy.get_score_of_board(board)
+    return (black_player, white_player, scores[flippy.BLACK_TILE], scores[flippy.WHITE_TILE],
+            think_time[flippy.BLACK_TILE] / max(1, move_count[flippy.BLACK_TILE]),
+            think_time[flippy.WHITE_TILE] / max(1, move_count[flippy.WHITE_TILE]))
+
+
+def get_schedule(players, games_per_pair, seed):
+    # Returns the list of games to play, as (black player, white player, seed) tuples. Each pair
+    # of games uses the same seed, so the same opening, with the colors swapped.
+    rand = random.Random(seed)
+    games = []
+    for first, second in itertools.combinations(players, 2):
+        for i in range((games_per_pair + 1) // 2):
+            game_seed = rand.getrandbits(32)
+            games.append((first, second, game_seed))
+            games.append((second, first, game_seed))
+    return games
+
+
+def score_to_elo(score):
+    # Returns the Elo rating difference that makes a player expect to get the score (0 to 1).
+    if score <= 0.0:
+        return -float('inf')
+    if score >= 1.0:
+        return float('inf')
+    return -ELO_SCALE * math.log10(1.0 / score - 1.0)
+
+
+def get_pair_stats(wins, draws, losses, tile_difference):
+    # Returns a dict of the statistics for one player against another, from the first player's
+    # wins, draws and losses and their total difference in tiles.
+    games = wins + draws + losses
+    score = (wins + draws * 0.5) / games
+    # The Wilson score interval, counting a draw as half a win. Unlike score +/- some standard
+    # errors, it doesn't shrink to nothing when the score is 0 or 1.
+    z_squared = CONFIDENCE_Z * CONFIDENCE_Z
+    center = (score + z_squared / (2.0 * games)) / (1.0 + z_squared / games)
+    error = CONFIDENCE_Z / (1.0 + z_squared / games) * \
+        math.sqrt(score * (1.0 - score) / games + z_squared / (4.0 * games * games))
+    low = max(0.0, center - error) if score > 0.0 else 0.0
+    high = min(1.0, center + error) if score < 1.0 else 1.0
+    return {'games': games, 'wins': wins, 'draws': draws, 'losses': losses, 'score': score,
+            'score_low': low, 'score_high': high, 'elo': score_to_elo(score),
+            'elo_low': score_to_elo(low), 'elo_high': score_to_elo(high),
+            'tile_difference': tile_difference / float(games)}
+
+
+def invert_matrix(matrix):
+    # Returns the inverse of a square matrix (a list of lists of numbers), by Gauss-Jordan
+    # elimination.
+    size = len(matrix)
+    rows = [list(row) + [1.0 if i == j else 0.0 for j in range(size)]
+            for i, row in enumerate(matrix)]
+    for column in range(size):
+        pivot = max(range(column, size), key=lambda row: abs(rows[row][column]))
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        pivot_value = rows[column][column]
+        rows[column] = [value / pivot_value for value in rows[column]]
+        for row in range(size):
+            if row != column and rows[row][column] != 0.0:
+                factor = rows[row][column]
+                rows[row] = [value - factor * column_value for value, column_value in
+                             zip(rows[row], rows[column])]
+    return [row[size:] for row in rows]
+
+
+def get_ratings(players, points, games):
+    # Fits an Elo rating for each player to the results. points[(a, b)] is how many points a
+    # scored against b, and games[(a, b)] is how many games they played. Returns a dict of
+    # player -> (rating, error), where error is the size of the 95% confidence interval on each
+    # side. The first player's rating is 0.
+    # Each pair gets one made-up drawn game, so nobody's rating is infinite.
+    points = dict(points)
+    games = dict(games)
+    for first, second in itertools.permutations(players, 2):
+        points[(first, second)] = points.get((first, second), 0.0) + 0.5
+        games[(first, second)] = games.get((first, second), 0) + 1
+
+    # Find the strengths with the Bradley-Terry "minorization-maximization" updates: each
+    # player's strength is set to what would make their expected points equal their real
+    # points. A player's expected score against another is strength / (both strengths).
+    strength = dict((player, 1.0) for player in players)
+    for i in range(RATING_ITERATIONS):
+        new_strength = {}
+        for player in players:
+            total_points = sum(points[(player, other)] for other in players if other != player)
+            total_games = sum(games[(player, other)] / (strength[player] + strength[other])
+                              for other in players if other != player)
+            new_strength[player] = total_points / total_games
+        change = max(abs(math.log(new_strength[player] / strength[player]))
+                     for player in players)
+        strength = new_strength
+        if change < 1e-9:
+            break
+    ratings = dict((player, ELO_SCALE * math.log10(strength[player] / strength[players[0]]))
+                   for player in players)
+
+    # The errors come from the curvature of the likelihood of the results (the "Fisher
+    # information"), with the first player left out since their rating is fixed.
+    scale = math.log(10) / ELO_SCALE
+    others = players[1:]
+    information = []
+    for player in others:
+        row = []
+        for other in others:
+            if other == player:
+                value = sum(games[(player, opponent)] * get_expected(ratings, player, opponent) *
+                            get_expected(ratings, opponent, player)
+                            for opponent in players if opponent != player)
+            else:
+                value = -games[(player, other)] * get_expected(ratings, player, other) * \
+                    get_expected(ratings, other, player)
+            row.append(value * scale * scale)
+        information.append(row)
+    errors = {players[0]: 0.0}
+    if others:
+        covariance = invert_matrix(information)
+        for i, player in enumerate(others):
+            errors[player] = CONFIDENCE_Z * math.sqrt(covariance[i][i])
+    return dict((player, (ratings[player], errors[player])) for player in players)
+
+
+def get_expected(ratings, player, other):
+    # Returns the score the player is expected to get against the other player.
+    return 1.0 / (1.0 + 10.0 ** ((ratings[other] - ratings[player]) / ELO_SCALE))
+
+
+def summarize(players, results):
+    # Returns the statistics of a tournament as a dict (see the top of this file), from the
+    # play_game() results.
+    records = {}  # (player, other) -> [wins, draws, losses, tile difference]
+    think_times = dict((player, []) for player in players)
+    for black_player, white_player, black_tiles, white_tiles, black_time, white_time in results:
+        for player, other, difference in ((black_player, white_player, black_tiles - white_tiles),
+                                          (white_player, black_player, white_tiles - black_tiles)):
+            record = records.setdefault((player, other), [0, 0, 0, 0])
+            record[0 if difference > 0 else (1 if difference == 0 else 2)] += 1
+            record[3] += difference
+        think_times[black_player].append(black_time)
+        think_times[white_player].append(white_time)
+
+    pairs = []
+    points = {}
+    games = {}
+    for (player, other), (wins, draws, losses, difference) in records.items():
+        points[(player, other)] = wins + draws * 0.5
+        games[(player, other)] = wins + draws + losses
+        if players.index(player) < players.index(other):
+            pair = get_pair_stats(wins, draws, losses, difference)
+            pair['player'] = player
+            pair['opponent'] = other
+            pairs.append(pair)
+    pairs.sort(key=lambda pair: (players.index(pair['player']), players.index(pair['opponent'])))
+
+    ratings = get_ratings(players, points, games)
+    ranking = []
+    for player in players:
+        player_games = sum(games.get((player, other), 0) for other in players)
+        player_points = sum(points.get((player, other), 0.0) for other in players)
+        ranking.append({'player': player, 'elo': ratings[player][0],
+                        'elo_error': ratings[player][1], 'games': player_games,
+                        'score': player_points / player_games if player_games else 0.0,
+                        'move_time': sum(think_times[player]) / max(1, len(think_times[player]))})
+    ranking.sort(key=lambda row: row['elo'], reverse=True)
+    return {'ratings': ranking, 'pairs': pairs}
+
+
+def get_json_summary(summary):
+    # Returns a copy of the summary with infinite numbers changed to None, so it can be written
+    # as valid JSON.
+    def fix(value):
+        if isinstance(value, float) and math.isinf(value):
+            return None
+        if isinstance(value, dict):
+            return dict((key, fix(item)) for key, item in value.items())
+        if isinstance(value, list):
+            return [fix(item) for item in value]
+        return value
+    return fix(summary)
+
+
+def format_elo(elo):
+    if math.isinf(elo):
+        return '+inf' if elo > 0 else '-inf'
+    return '%+.0f' % (elo)
+
+
+def print_summary(summary):
+    print()
+    print('%-8s %8s %10s %7s %8s %10s' % ('player', 'elo', '95% CI', 'games', 'score',
+                                          'ms/move'))
+    for row in summary['ratings']:
+        print('%-8s %8s %10s %7s %7.1f%% %10.1f' % (
+            row['player'], format_elo(row['elo']), '+/-%.0f' % (row['elo_error']), row['games'],
+            row['score'] * 100, row['move_time'] * 1000))
+    print()
+    print('%-17s %13s %22s %22s %7s' % ('pair', 'W-D-L', 'score (95% CI)', 'elo (95% CI)',
+                                        'tiles'))
+    for pair in summary['pairs']:
+        print('%-17s %13s %22s %22s %+7.1f' % (
+            '%s-%s' % (pair['player'], pair['opponent']),
+            '%s-%s-%s' % (pair['wins'], pair['draws'], pair['losses']),
+            '%.1f%% (%.1f..%.1f)' % (pair['score'] * 100, pair['score_low'] * 100,
+                                     pair['score_high'] * 100),
+            '%s (%s..%s)' % (format_elo(pair['elo']), format_elo(pair['elo_low']),
+                             format_elo(pair['elo_high'])),
+            pair['tile_difference']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play Flippy computer players against each '
+                                                 'other.')
+    parser.add_argument('--players', nargs='+', default=DEFAULT_PLAYERS, choices=PLAYER_NAMES,
+                        help='the players in the tournament (default: %(default)s)')
+    parser.add_argument('--games', type=int, default=DEFAULT_GAMES,
+                        help='how many games each pair of players plays (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='how many processes play games (default: one per CPU)')
+    parser.add_argument('--time-limit', type=float, default=None,
+                        help="the search strengths' seconds per move, instead of their usual "
+                             "time (0 for no limit)")
+    parser.add_argument('--seed', type=int, default=None,
+                        help='the random seed for the openings')
+    parser.add_argument('--output', default=None,
+                        help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    players = []
+    for player in args.players:  # a player listed twice would only play itself
+        if player not in players:
+            players.append(player)
+    if len(players) < 2:
+        parser.error('at least two different players are needed')
+
+    schedule = get_schedule(players, args.games, args.seed)
+    start_time = time.time()
+    results = []
+    with multiprocessing.Pool(args.workers, initializer=init_worker,
+                              initargs=(args.time_limit,)) as pool:
+        for result in pool.imap_unordered(play_game, schedule):
+            results.append(result)
+            sys.stdout.write('\rGame %s of %s (%.0f seconds)' % (len(results), len(schedule),
+                                                                 time.time() - start_time))
+            sys.stdout.flush()
+    print()
+
+    summary = summarize(players, results)
+    print_summary(summary)
+    if args.output is not None:
+        summary['time_limit'] = args.time_limit
+        summary['seconds'] = time.time() - start_time
+        with open(args.output, 'w') as output_file:
+            json.dump(get_json_summary(summary), output_file, indent=2, allow_nan=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+# Flippy bitboards
+# A fast way to store a Reversi board and find and make moves, for the computer player.
+#
+# A bitboard is one int with a bit for each of the 64 spaces on the board: the bit for the space
+# at (x, y) is bit number y * 8 + x, and it is 1 if that space has a tile on it. A whole board is
+# two bitboards, one for each player's tiles. Instead of walking through the board one space at a
+# time, every space is handled at once with shifts and masks:
+#   * Shifting a bitboard left by 1 moves every tile one space right (x + 1), and shifting it left
+#     by 8 moves every tile one space down (y + 1). The other directions are shifts by 7 and 9,
+#     and shifts to the right.
+#   * A tile in the rightmost column that moves right ends up in the leftmost column of the next
+#     row, so after shifting, the bits in the column the tiles "wrapped" into are masked off.
+# To find the valid moves, the player's tiles are shifted over the other player's tiles in each of
+# the eight directions, up to six spaces, and any empty space that is reached after at least one
+# of the other player's tiles is a valid move.
+#
+# Positions are hashed with Zobrist hashing: every space has two random 64-bit numbers, one for
+# when the player whose turn it is has a tile there and one for when the other player does, and
+# a position's key is all the numbers for its tiles XORed together. Making a move only changes
+# the numbers of the spaces that changed, so the search can update the key instead of working it
+# out again. The random numbers come from a fixed seed, so keys are the same every time the
+# program runs (the opening book depends on this).
+#
+# Running this file counts all the positions up to some number of moves from the start (a
+# "perft"), which checks the move generation and shows how fast it is.
+#
+# Usage: python flippy_bitboard.py [depth]
+
+import random
+import sys
+import time
+
+BOARD_WIDTH = 8
+BOARD_HEIGHT = 8
+FULL = (1 << 64) - 1  # a bitboard with every space set
+
+NOT_LEFT_COLUMN = 0xfefefefefefefefe  # every space except the ones where x is 0
+NOT_RIGHT_COLUMN = 0x7f7f7f7f7f7f7f7f  # every space except the ones where x is 7
+
+# The eight directions, as (shift, mask) pairs. A positive shift is a left shift (toward higher
+# bits) and a negative one is a right shift. The mask is applied after shifting to remove the
+# tiles that went off the left or right edge (and, for left shifts, off the bottom).
+LEFT_SHIFTS = ((1, NOT_LEFT_COLUMN),  # right
+               (8, FULL),  # down
+               (9, NOT_LEFT_COLUMN),  # down and right
+               (7, NOT_RIGHT_COLUMN))  # down and left
+RIGHT_SHIFTS = ((1, NOT_RIGHT_COLUMN),  # left
+                (8, FULL),  # up
+                (9, NOT_RIGHT_COLUMN),  # up and left
+                (7, NOT_LEFT_COLUMN))  # up and right
+
+# The bitboards of the two players at the start of a game. White starts on (3, 3) and (4, 4).
+START_WHITE = (1 << (3 * 8 + 3)) | (1 << (4 * 8 + 4))
+START_BLACK = (1 << (4 * 8 + 3)) | (1 << (3 * 8 + 4))
+
+ZOBRIST_SEED = 20100501  # never change this, or saved keys won't match any more
+
+if hasattr(int, 'bit_count'):
+    count_bits = int.bit_count  # Python 3.10 and later can count the 1 bits quickly
+else:
+    def count_bits(bits):
+        return bin(bits).count('1')
+
+
+def xy_to_bit(x, y):
+    # Returns the bitboard with just the space at (x, y) set.
+    return 1 << (y * BOARD_WIDTH + x)
+
+
+def bit_to_xy(bit):
+    # Returns the (x, y) of the space of a bitboard with just one space set.
+    index = bit.bit_length() - 1
+    return index % BOARD_WIDTH, index // BOARD_WIDTH
+
+
+def iterate_bits(bits):
+    # Yields a bitboard with just one space set for each space set in the bitboard, from the
+    # lowest bit to the highest.
+    while bits:
+        bit = bits & -bits
+        yield bit
+        bits ^= bit
+
+
+def make_zobrist_keys():
+    # Returns the lists of random numbers for each space (by bit number) for the tiles of the
+    # player whose turn it is and for the other player's tiles.
+    rand = random.Random(ZOBRIST_SEED)
+    own_keys = [rand.getrandbits(64) for i in range(64)]
+    other_keys = [rand.getrandbits(64) for i in range(64)]
+    return own_keys, other_keys
+
+
+ZOBRIST_OWN, ZOBRIST_OTHER = make_zobrist_keys()
+# What a position's key changes by when a tile on a space is flipped to the other player.
+ZOBRIST_FLIP = [own_key ^ other_key for own_key, other_key in zip(ZOBRIST_OWN, ZOBRIST_OTHER)]
+
+
+def get_zobrist_key(own, other):
+    # Returns the Zobrist key of the position where it is the turn of the player with the own
+    # tiles.
+    key = 0
+    for bit in iterate_bits(own):
+        key ^= ZOBRIST_OWN[bit.bit_length() - 1]
+    for bit in iterate_bits(other):
+        key ^= ZOBRIST_OTHER[bit.bit_length() - 1]
+    return key
+
+
+def get_move_keys(keys, move, flips):
+    # keys is the (key, swapped key) pair of a position: its Zobrist key, and the key it would
+    # have if it were the other player's turn. Returns the pair for the position after the player
+    # whose turn it is makes the move (which flips the flips tiles), with the other player to
+    # move.
+    key, swapped_key = keys
+    index = move.bit_length() - 1
+    flip_key = 0
+    for bit in iterate_bits(flips):
+        flip_key ^= ZOBRIST_FLIP[bit.bit_length() - 1]
+    # After the move it is the other player's turn, so the new key is the swapped one.
+    return swapped_key ^ ZOBRIST_OTHER[index] ^ flip_key, key ^ ZOBRIST_OWN[index] ^ flip_key
+
+
+def get_bitboards(board, tile, other_tile):
+    # Returns the (own, other) bitboards of the spaces with tile and other_tile on them, for a
+    # board made by flippy.py's get_new_board().
+    own = 0
+    other = 0
+    for x in range(BOARD_WIDTH):
+        column = board[x]
+        for y in range(BOARD_HEIGHT):
+            if column[y] == tile:
+                own |= 1 << (y * BOARD_WIDTH + x)
+            elif column[y] == other_tile:
+                other |= 1 << (y * BOARD_WIDTH + x)
+    return own, other
+
+
+def get_moves(own, other):
+    # Returns the bitboard of every valid move for the player with the own tiles.
+    empty = ~(own | other) & FULL
+    moves = 0
+    for shift, mask in LEFT_SHIFTS:
+        # Only the other player's tiles that can't have wrapped around can be jumped over.
+        jumpable = other & mask
+        line = (own << shift) & jumpable
+        line |= (line << shift) & jumpable
+        line |= (line << shift) & jumpable
+        line |= (line << shift) & jumpable
+        line |= (line << shift) & jumpable
+        line |= (line << shift) & jumpable
+        moves |= (line << shift) & mask & empty
+    for shift, mask in RIGHT_SHIFTS:
+        jumpable = other & mask
+        line = (own >> shift) & jumpable
+        line |= (line >> shift) & jumpable
+        line |= (line >> shift) & jumpable
+        line |= (line >> shift) & jumpable
+        line |= (line >> shift) & jumpable
+        line |= (line >> shift) & jumpable
+        moves |= (line >> shift) & mask & empty
+    return moves
+
+
+def get_flips(own, other, move):
+    # Returns the bitboard of the other player's tiles that are flipped if the player with the own
+    # tiles puts a tile on the move space (a bitboard with one space set). It is 0 if the move
+    # isn't valid.
+    flips = 0
+    for shift, mask in LEFT_SHIFTS:
+        line = 0
+        bit = (move << shift) & mask
+        while bit & other:
+            line |= bit
+            bit = (bit << shift) & mask
+        if bit & own:
+            flips |= line
+    for shift, mask in RIGHT_SHIFTS:
+        line = 0
+        bit = (move >> shift) & mask
+        while bit & other:
+            line |= bit
+            bit = (bit >> shift) & mask
+        if bit & own:
+            flips |= line
+    return flips
+
+
+def make_move(own, other, move):
+    # Returns the (own, other) bitboards after the player with the own tiles puts a tile on the
+    # move space. The move must be valid.
+    flips = get_flips(own, other, move)
+    return own | move | flips, other & ~flips
+
+
+def perft(own, other, depth, passed=False):
+    # Returns the number of different move sequences of the given length from the position where
+    # it is the player with the own tiles' turn. A pass counts as a move, and the game ends when
+    # both players have to pass.
+    if depth == 0:
+        return 1
+    moves = get_moves(own, other)
+    if not moves:
+        if passed:
+            return 1  # the game is over
+        return perft(other, own, depth - 1, True)
+    if depth == 1:
+        return count_bits(moves)
+    total = 0
+    for move in iterate_bits(moves):
+        flips = get_flips(own, other, move)
+        total += perft(other & ~flips, own | move | flips, depth - 1)
+    return total
+
+
+def main():
+    max_depth = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    for depth in range(1, max_depth + 1):
+        start_time = time.time()
+        count = perft(START_BLACK, START_WHITE, depth)
+        seconds = time.time() - start_time
+        print('depth %s: %s positions in %.2f seconds (%.0f positions per second)' % (
+            depth, count, seconds, count / seconds if seconds > 0 else 0))
+
+
+if __name__ == '__main__':
+    main()
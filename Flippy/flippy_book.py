@@ -0,0 +1,322 @@
+# Flippy opening book
+# Remembers good moves for the first moves of the game, so the computer doesn't have to search.
+#
+# The book is built ahead of time from finished games: ones the computer plays against itself
+# (with some randomness, so the games are different), and/or game records imported from a text
+# file. For every position in the first BOOK_PLIES moves of each game, the book counts how many
+# games played each move from it, and the average final score of those games for the player who
+# made the move. When the computer is in a position that is in the book, it plays the move with
+# the best average score (out of the moves played in at least BOOK_MIN_GAMES games).
+#
+# Positions are looked up by their Zobrist key (see flippy_bitboard.py). A position can be
+# turned and mirrored 8 ways without changing the game, so the book only stores the version of
+# each position with the smallest key, and turns the move back to match the real board. (This
+# also means a book built from games where black moves first works for games where white does.)
+#
+# The book file is sorted by key so it can be searched with a binary search, straight from the
+# file through mmap, without reading the whole file. The file layout (little-endian) is:
+#   header:  magic b'FLPB', version (uint16), entry size (uint16), number of entries (uint32)
+#   entries: for each position and move, the position's key (uint64), the move's bit number
+#            (uint8), the average final score (int8) and the number of games (uint16), sorted by
+#            key.
+#
+# Game records have one game per line, as the spaces of the moves in order, like "f5d6c3d3c4".
+# The columns are a to h from left to right and the rows are 1 to 8 from top to bottom, black
+# moves first from the usual starting position, and passes are skipped. Lines starting with # or
+# ; are ignored.
+#
+# Usage: python flippy_book.py flippybook.bin [--self-play 200] [--games records.txt]
+
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+
+from flippy_bitboard import START_BLACK, START_WHITE, get_moves, get_flips, count_bits, \
+    get_zobrist_key, xy_to_bit, bit_to_xy
+
+BOOK_FILENAME = 'flippybook.bin'
+BOOK_MAGIC = b'FLPB'
+BOOK_VERSION = 1
+HEADER = struct.Struct('<4sHHI')
+ENTRY = struct.Struct('<QBbH')
+
+BOOK_PLIES = 12  # how many moves into each game are added to the book
+BOOK_MIN_GAMES = 2  # a move has to be played in this many games to be used
+SELF_PLAY_DEPTH = 4  # how many moves ahead the computer looks in self-play games
+SELF_PLAY_NOISE = 30  # the randomness of the moves in the book part of self-play games
+
+# Masks for turning bitboards (see flip_vertical() and the others).
+K1 = 0x5555555555555555
+K2 = 0x3333333333333333
+K4 = 0x0f0f0f0f0f0f0f0f
+D1 = 0x5500550055005500
+D2 = 0x3333000033330000
+D4 = 0x0f0f0f0f00000000
+
+
+def flip_vertical(bits):
+    # Returns the bitboard flipped top to bottom (each row of 8 bits is one byte).
+    return int.from_bytes(bits.to_bytes(8, 'little'), 'big')
+
+
+def mirror_horizontal(bits):
+    # Returns the bitboard flipped left to right, by reversing the bits in each byte.
+    bits = ((bits >> 1) & K1) | ((bits & K1) << 1)
+    bits = ((bits >> 2) & K2) | ((bits & K2) << 2)
+    return ((bits >> 4) & K4) | ((bits & K4) << 4)
+
+
+def flip_diagonal(bits):
+    # Returns the bitboard flipped along the diagonal from the top left corner to the bottom
+    # right one, so (x, y) becomes (y, x).
+    swap = D4 & (bits ^ (bits << 28))
+    bits ^= swap ^ (swap >> 28)
+    swap = D2 & (bits ^ (bits << 14))
+    bits ^= swap ^ (swap >> 14)
+    swap = D1 & (bits ^ (bits << 7))
+    return bits ^ swap ^ (swap >> 7)
+
+
+def transform(bits, symmetry):
+    # Returns the bitboard after one of the 8 symmetries (a number from 0 to 7).
+    if symmetry & 4:
+        bits = flip_diagonal(bits)
+    if symmetry & 2:
+        bits = flip_vertical(bits)
+    if symmetry & 1:
+        bits = mirror_horizontal(bits)
+    return bits
+
+
+def untransform(bits, symmetry):
+    # Returns the bitboard from before transform() with the symmetry. (Each step undoes itself,
+    # so they just have to be done in the opposite order.)
+    if symmetry & 1:
+        bits = mirror_horizontal(bits)
+    if symmetry & 2:
+        bits = flip_vertical(bits)
+    if symmetry & 4:
+        bits = flip_diagonal(bits)
+    return bits
+
+
+def get_book_key(own, other):
+    # Returns (key, symmetry): the smallest Zobrist key of the 8 versions of the position where
+    # it is the turn of the player with the own tiles, and the symmetry that makes it.
+    return min((get_zobrist_key(transform(own, symmetry), transform(other, symmetry)), symmetry)
+               for symmetry in range(8))
+
+
+class OpeningBook(object):
+    # An opening book file, opened with mmap. If the file doesn't exist, can't be read, or isn't
+    # a book this version can use (say, one from an older version, or one that was cut short),
+    # the book is just empty, so the computer searches as if it had no book.
+
+    def __init__(self, filename=BOOK_FILENAME):
+        self.count = 0
+        self.data = None
+        self.book_file = None
+        if not os.path.exists(filename) or os.path.getsize(filename) <= HEADER.size:
+            return
+        try:
+            self.book_file = open(filename, 'rb')
+            self.data = mmap.mmap(self.book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as error:
+            sys.stderr.write('Not using the opening book %s: %s\n' % (filename, error))
+            self.close()
+            return
+        magic, version, entry_size, count = HEADER.unpack_from(self.data, 0)
+        if magic != BOOK_MAGIC or version != BOOK_VERSION or entry_size != ENTRY.size:
+            problem = 'it is not a Flippy opening book of version %s' % (BOOK_VERSION)
+        elif HEADER.size + count * ENTRY.size > len(self.data):
+            problem = 'it is cut short'
+        else:
+            self.count = count
+            return
+        sys.stderr.write('Not using the opening book %s: %s.\n' % (filename, problem))
+        self.close()
+
+    def get_entry(self, index):
+        return ENTRY.unpack_from(self.data, HEADER.size + index * ENTRY.size)
+
+    def get_entries(self, key):
+        # Returns the (move bit number, average score, games) of every entry for the key.
+        low = 0
+        high = self.count
+        while low < high:  # find the first entry with a key that isn't less than key
+            middle = (low + high) // 2
+            if self.get_entry(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        while low < self.count:
+            entry_key, move, score, games = self.get_entry(low)
+            if entry_key != key:
+                break
+            entries.append((move, score, games))
+            low += 1
+        return entries
+
+    def get_move(self, own, other, min_games=BOOK_MIN_GAMES):
+        # Returns the (x, y) of the book move for the player with the own tiles, or None if the
+        # position isn't in the book.
+        if self.count == 0:
+            return None
+        key, symmetry = get_book_key(own, other)
+        best = None
+        for move, score, games in self.get_entries(key):
+            if games >= min_games and (best is None or (score, games) > best[:2]):
+                best = (score, games, move)
+        if best is None:
+            return None
+        move = untransform(1 << best[2], symmetry)
+        if not move & get_moves(own, other):
+            return None  # this can only happen if two positions have the same key
+        return bit_to_xy(move)
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        if self.book_file is not None:
+            self.book_file.close()
+            self.book_file = None
+        self.count = 0
+
+
+def add_game(stats, moves, plies=BOOK_PLIES):
+    # Plays a game (a list of one-space bitboards, with passes left out) from the start, and
+    # adds its first plies moves to stats, a dict of (key, move bit number) -> [games, total
+    # score]. Returns False (and adds nothing) if the moves aren't a valid, finished game.
+    own, other = START_BLACK, START_WHITE
+    played = []  # (key, canonical move bit number, True if it is black's move)
+    black_to_move = True
+    for move in moves:
+        if not get_moves(own, other):
+            own, other = other, own  # the player has to pass
+            black_to_move = not black_to_move
+        if not move & get_moves(own, other):
+            return False
+        if len(played) < plies:
+            key, symmetry = get_book_key(own, other)
+            played.append((key, transform(move, symmetry).bit_length() - 1, black_to_move))
+        flips = get_flips(own, other, move)
+        own, other = other & ~flips, own | move | flips
+        black_to_move = not black_to_move
+    if get_moves(own, other) or get_moves(other, own):
+        return False  # the game isn't finished
+
+    black, white = (own, other) if black_to_move else (other, own)
+    black_score = count_bits(black) - count_bits(white)
+    for key, move, black_moved in played:
+        entry = stats.setdefault((key, move), [0, 0])
+        entry[0] += 1
+        entry[1] += black_score if black_moved else -black_score
+    return True
+
+
+def parse_game_record(line):
+    # Returns the moves of a game record line as a list of one-space bitboards.
+    line = line.strip().lower()
+    moves = []
+    for i in range(0, len(line) - 1, 2):
+        column, row = line[i], line[i + 1]
+        if column not in 'abcdefgh' or row not in '12345678':
+            raise ValueError('Not a move: %r' % (line[i:i + 2]))
+        moves.append(xy_to_bit('abcdefgh'.index(column), int(row) - 1))
+    return moves
+
+
+def play_self_play_game(rand, plies=BOOK_PLIES):
+    # Returns the moves (one-space bitboards) of a game the computer plays against itself. The
+    # first plies moves have noise added, so the games are different.
+    import flippy_ai  # only needed for building books, and flippy_ai imports this module
+    own, other = START_BLACK, START_WHITE
+    table = flippy_ai.TranspositionTable()
+    moves = []
+    while get_moves(own, other) or get_moves(other, own):
+        if not get_moves(own, other):
+            own, other = other, own
+            continue
+        result = flippy_ai.find_best_move(own, other, SELF_PLAY_DEPTH,
+                                          noise=SELF_PLAY_NOISE if len(moves) < plies else 0,
+                                          rand=rand, table=table)
+        move = xy_to_bit(*result['move'])
+        moves.append(move)
+        flips = get_flips(own, other, move)
+        own, other = other & ~flips, own | move | flips
+    return moves
+
+
+def write_book(filename, stats):
+    # Writes the book file from stats (see add_game()). Like the Star Pusher caches, it is
+    # written to a temporary file first and then renamed.
+    entries = []
+    for (key, move), (games, total) in stats.items():
+        score = max(-64, min(64, int(round(total / float(games)))))
+        entries.append((key, move, score, min(games, 0xffff)))
+    entries.sort()
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'wb') as book_file:
+        book_file.write(HEADER.pack(BOOK_MAGIC, BOOK_VERSION, ENTRY.size, len(entries)))
+        for entry in entries:
+            book_file.write(ENTRY.pack(*entry))
+    os.replace(temp_filename, filename)
+    return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a Flippy opening book.')
+    parser.add_argument('book', help='the book file to write')
+    parser.add_argument('--self-play', type=int, default=0,
+                        help='how many games the computer plays against itself for the book')
+    parser.add_argument('--games', nargs='*', default=[],
+                        help='text files of game records to add to the book')
+    parser.add_argument('--plies', type=int, default=BOOK_PLIES,
+                        help='how many moves into each game go in the book (default: '
+                             '%(default)s)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='the random seed for the self-play games')
+    args = parser.parse_args()
+
+    stats = {}
+    added = 0
+    skipped = 0
+    for filename in args.games:
+        with open(filename) as records_file:
+            for line in records_file:
+                if not line.strip() or line.lstrip()[0] in '#;':
+                    continue
+                try:
+                    moves = parse_game_record(line)
+                except ValueError:
+                    moves = None
+                if moves is not None and add_game(stats, moves, args.plies):
+                    added += 1
+                else:
+                    skipped += 1
+    if args.games:
+        print('Imported %s games (%s records skipped as invalid or unfinished).' % (added,
+                                                                                    skipped))
+
+    rand = random.Random(args.seed)
+    start_time = time.time()
+    for game_num in range(args.self_play):
+        add_game(stats, play_self_play_game(rand, args.plies), args.plies)
+        sys.stdout.write('\rSelf-play game %s of %s (%.0f seconds)' % (
+            game_num + 1, args.self_play, time.time() - start_time))
+        sys.stdout.flush()
+    if args.self_play:
+        print()
+
+    count = write_book(args.book, stats)
+    print('Wrote %s positions and moves to %s.' % (count, args.book))
+
+
+if __name__ == '__main__':
+    main()
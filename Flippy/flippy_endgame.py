@@ -0,0 +1,214 @@
+# Flippy endgame solver
+# Plays perfectly once only a few empty spaces are left on the board.
+#
+# Near the end of the game there are few enough moves left that every one of them can be searched
+# all the way to the end of the game. Instead of guessing how good a position is, the solver
+# works out exactly how many tiles each player ends up with if both play perfectly, counted the
+# same way as get_score_of_board() (empty spaces don't count for anyone).
+#
+# The search is an alpha-beta negamax search on bitboards (see flippy_bitboard.py). Since it has
+# to get to the end of the game, the order moves are looked at in matters even more than in the
+# normal search:
+#   * Mobility: while many spaces are left, the moves that leave the other player with the
+#     fewest moves of their own are looked at first. These tend to be the best moves, and the
+#     positions after them are the quickest to search.
+#   * Parity: the board is split into four 4x4 quadrants. It is usually best to move in a
+#     quadrant with an odd number of empty spaces, so that the player gets the last move there.
+#     Moves in odd quadrants are looked at first, then the rest by the kind of space they are on.
+# The solver has a time limit, and returns None if it runs out of time, so the computer can use
+# the move from its normal search instead.
+
+import time
+
+from flippy_bitboard import FULL, get_moves, get_flips, iterate_bits, count_bits, bit_to_xy, \
+    get_zobrist_key, get_move_keys
+
+ENDGAME_EMPTIES = 14  # the solver is used once this many empty spaces are left, or fewer
+MOBILITY_ORDER_EMPTIES = 7  # moves are ordered by mobility when more spaces than this are empty
+TABLE_EMPTIES = 7  # positions with more empty spaces than this are kept in the solver's table
+CHECK_TIME_NODES = 2000  # the time limit is checked each time this many positions are searched
+
+# The four 4x4 quadrants of the board, as bitboards.
+QUADRANTS = [0x0f0f0f0f, 0xf0f0f0f0, 0x0f0f0f0f << 32, 0xf0f0f0f0 << 32]
+
+# The order the moves inside a parity group are looked at in: corners first, then the edges
+# that aren't next to a corner, then the middle, then the spaces next to the corners.
+CORNERS = 0x8100000000000081
+X_SQUARES = 0x0042000000004200  # the spaces diagonally next to the corners
+C_SQUARES = 0x4281000000008142  # the edge spaces next to the corners
+EDGES = 0xff818181818181ff & ~(CORNERS | C_SQUARES)
+ORDER_MASKS = [CORNERS, EDGES, FULL & ~(CORNERS | X_SQUARES | C_SQUARES | EDGES), C_SQUARES,
+               X_SQUARES]
+
+
+class EndgameTimeout(Exception):
+    # Raised inside the solver when it runs out of time or is cancelled.
+    pass
+
+
+def get_parity_moves(moves, empty):
+    # Returns the moves as a list of one-space bitboards, with the moves in quadrants with an
+    # odd number of empty spaces first.
+    odd = 0
+    for quadrant in QUADRANTS:
+        if count_bits(empty & quadrant) & 1:
+            odd |= quadrant
+    ordered = []
+    for parity_moves in (moves & odd, moves & ~odd):
+        for mask in ORDER_MASKS:
+            ordered.extend(iterate_bits(parity_moves & mask))
+    return ordered
+
+
+class EndgameSolver(object):
+    # One exact search to the end of the game, with its time limit and node count.
+
+    def __init__(self, time_limit=None, cancel_event=None):
+        self.deadline = None if time_limit is None else time.time() + time_limit
+        self.cancel_event = cancel_event
+        self.nodes = 0
+        # The bounds found so far for positions with more than TABLE_EMPTIES empty spaces, as a
+        # dict of Zobrist key -> (lowest score, highest score, best move).
+        self.table = {}
+
+    def check_time(self):
+        if (self.deadline is not None and time.time() > self.deadline) or \
+           (self.cancel_event is not None and self.cancel_event.is_set()):
+            raise EndgameTimeout()
+
+    def order_moves(self, own, other, moves, empties, first=0):
+        # Returns the moves (a bitboard) as a list of (move, flips) pairs, in the order they
+        # should be searched, with the first move (if it is one of them) at the front.
+        ordered = get_parity_moves(moves, ~(own | other) & FULL)
+        if moves & first:
+            ordered.remove(first)
+            ordered.insert(0, first)
+        if empties <= MOBILITY_ORDER_EMPTIES:
+            return [(move, get_flips(own, other, move)) for move in ordered]
+        # Sort by how many moves the other player has afterwards. sort() keeps the parity order
+        # for moves that leave the same number.
+        scored = []
+        for move in ordered:
+            flips = get_flips(own, other, move)
+            other_moves = get_moves(other & ~flips, own | move | flips)
+            scored.append((count_bits(other_moves), move, flips))
+        if moves & first:
+            scored[0] = (-1, first, scored[0][2])  # keep it at the front
+        scored.sort(key=lambda item: item[0])
+        return [(move, flips) for mobility, move, flips in scored]
+
+    def solve(self, own, other, keys, alpha, beta, passed=False):
+        # Returns the final difference in tiles (own minus other) if both players play
+        # perfectly from the position where it is the turn of the player with the own tiles.
+        # keys is the position's pair of Zobrist keys (see flippy_bitboard.get_move_keys()).
+        # Scores outside alpha..beta only need to be right about which side of it they are on.
+        self.nodes += 1
+        if self.nodes % CHECK_TIME_NODES == 0:
+            self.check_time()
+
+        moves = get_moves(own, other)
+        if not moves:
+            if passed:
+                return count_bits(own) - count_bits(other)  # the game is over
+            return -self.solve(other, own, (keys[1], keys[0]), -beta, -alpha, True)
+
+        empties = 64 - count_bits(own | other)
+        if empties == 1:
+            # The only move left; after it the game is over.
+            flips = get_flips(own, other, moves)
+            return count_bits(own) - count_bits(other) + 2 * count_bits(flips) + 1
+
+        table_move = 0
+        use_table = empties > TABLE_EMPTIES
+        if use_table:
+            entry = self.table.get(keys[0])
+            if entry is not None:
+                lowest, highest, table_move = entry
+                if lowest >= beta:
+                    return lowest
+                if highest <= alpha:
+                    return highest
+                alpha = max(alpha, lowest)
+                beta = min(beta, highest)
+        original_alpha = alpha
+
+        best = -64
+        best_move = 0
+        first = True
+        for move, flips in self.order_moves(own, other, moves, empties, table_move):
+            child_keys = get_move_keys(keys, move, flips) if use_table else keys
+            if first:
+                score = -self.solve(other & ~flips, own | move | flips, child_keys, -beta,
+                                    -alpha)
+                first = False
+            else:
+                # The first move is usually the best, so the others are first searched with a
+                # "null window", which only finds out if they are better than it, and only
+                # searched again with the full window if they are.
+                score = -self.solve(other & ~flips, own | move | flips, child_keys,
+                                    -alpha - 1, -alpha)
+                if alpha < score < beta:
+                    score = -self.solve(other & ~flips, own | move | flips, child_keys, -beta,
+                                        -score)
+            if score > best:
+                best = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break  # the other player won't allow this position
+
+        if use_table:
+            lowest, highest = -64, 64
+            if best > original_alpha:
+                lowest = best
+            if best < beta:
+                highest = best
+            entry = self.table.get(keys[0])
+            if entry is not None:
+                lowest = max(lowest, entry[0])
+                highest = min(highest, entry[1])
+            self.table[keys[0]] = (lowest, highest, best_move)
+        return best
+
+
+def solve_endgame(own, other, time_limit=None, cancel_event=None):
+    # Finds the perfect move for the player with the own tiles. Returns a dict with the result:
+    #     'move'  - the (x, y) of the best move, or None if the player has no moves.
+    #     'score' - the final difference in tiles (the player's minus the other player's) with
+    #               perfect play.
+    #     'nodes' - how many positions were searched.
+    #     'time'  - how many seconds the search took.
+    # Returns None if the time runs out (or cancel_event is set) before it is done.
+    start_time = time.time()
+    solver = EndgameSolver(time_limit, cancel_event)
+    result = {'move': None, 'score': 0, 'nodes': 0, 'time': 0.0}
+    moves = get_moves(own, other)
+    keys = (get_zobrist_key(own, other), get_zobrist_key(other, own))
+    try:
+        if not moves:
+            result['score'] = -solver.solve(other, own, (keys[1], keys[0]), -64, 64, True)
+        else:
+            alpha = -65
+            empties = 64 - count_bits(own | other)
+            for move, flips in solver.order_moves(own, other, moves, empties):
+                child_keys = get_move_keys(keys, move, flips)
+                if alpha == -65:
+                    score = -solver.solve(other & ~flips, own | move | flips, child_keys, -64,
+                                          64)
+                else:
+                    # Only a better move matters, so first check with a null window.
+                    score = -solver.solve(other & ~flips, own | move | flips, child_keys,
+                                          -alpha - 1, -alpha)
+                    if score > alpha:
+                        score = -solver.solve(other & ~flips, own | move | flips, child_keys,
+                                              -64, -score)
+                if score > alpha:
+                    alpha = score
+                    result['move'] = bit_to_xy(move)
+                    result['score'] = score
+    except EndgameTimeout:
+        return None
+    result['nodes'] = solver.nodes
+    result['time'] = time.time() - start_time
+    return result
@@ -0,0 +1,187 @@
+# Star Pusher level packs
+# A pre-parsed binary copy of a level file, so the game doesn't have to parse all the text every
+# time it starts.
+#
+# A level pack is made from a level file the first time the game reads it, and saved next to it
+# with ".pack" added to the name. The pack remembers the level file's modification time and SHA-1
+# hash, so it is remade whenever the level file changes. The game opens the pack with mmap, so
+# starting up only reads the small header, and each level object is only made from the packed
+# bytes when the game asks for that level.
+#
+# The file layout (all numbers are little-endian):
+#   header:  magic b'SPLP', version (uint16), level file mtime (float64), level file SHA-1 (20
+#            bytes), number of levels (uint32), file position of the offsets (uint64)
+#   records: width, height, player x, player y, number of goals, number of stars (uint16 each),
+#            then the (x, y) of each goal and each star (uint16 each), then the map's characters,
+#            one byte each, column by column (the same order as map_obj[x][y]).
+#   offsets: one uint64 per level, the file position of that level's record
+
+import array, collections, hashlib, mmap, os, struct, sys
+
+LEVEL_PACK_MAGIC = b'SPLP'
+LEVEL_PACK_VERSION = 1
+PACK_EXTENSION = '.pack'
+
+HEADER = struct.Struct('<4sHd20sIQ')
+RECORD_HEADER = struct.Struct('<6H')
+
+
+def get_pack_filename(level_filename):
+    """Returns the filename the level pack for a level file is saved to."""
+    return level_filename + PACK_EXTENSION
+
+
+def hash_file(filename):
+    """Returns the SHA-1 digest of the file's contents."""
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as source_file:
+        for chunk in iter(lambda: source_file.read(1 << 16), b''):
+            sha1.update(chunk)
+    return sha1.digest()
+
+
+def pack_level(level_obj):
+    """Returns the bytes of the packed record for a level object."""
+    map_obj = level_obj['map_obj']
+    start_state = level_obj['start_state']
+    numbers = [len(map_obj), len(map_obj[0]), start_state['player'][0], start_state['player'][1],
+               len(level_obj['goals']), len(start_state['stars'])]
+    for x, y in level_obj['goals'] + list(start_state['stars']):
+        numbers.extend((x, y))
+    record = array.array('H', numbers)
+    if sys.byteorder != 'little':
+        record.byteswap()
+    return record.tobytes() + ''.join(''.join(column) for column in map_obj).encode('latin-1')
+
+
+def write_level_pack(levels, level_filename, pack_filename=None):
+    """Writes the level objects to a level pack for level_filename. levels can be any iterable
+    of level objects; each one is written as soon as it is packed, so the levels don't all have
+    to be in memory at the same time.
+
+    The pack is written to a temporary file first and then renamed, so a game starting at the
+    same time never sees a half written pack."""
+    if pack_filename is None:
+        pack_filename = get_pack_filename(level_filename)
+    mtime = os.stat(level_filename).st_mtime
+    digest = hash_file(level_filename)
+
+    temp_filename = pack_filename + '.tmp'
+    offsets = array.array('Q')
+    with open(temp_filename, 'wb') as pack_file:
+        # The header is written last, once the number of levels is known.
+        pack_file.write(b'\0' * HEADER.size)
+        position = HEADER.size
+        for level_obj in levels:
+            record = pack_level(level_obj)
+            offsets.append(position)
+            pack_file.write(record)
+            position += len(record)
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        pack_file.write(offsets.tobytes())
+        pack_file.seek(0)
+        pack_file.write(HEADER.pack(LEVEL_PACK_MAGIC, LEVEL_PACK_VERSION, mtime, digest,
+                                    len(offsets), position))
+    os.replace(temp_filename, pack_filename)
+
+
+def is_pack_current(level_filename, pack_filename=None):
+    """Returns True if the level pack exists and was made from the current contents of the
+    level file. The file's modification time is checked first; the (slower) hash is only checked
+    if the time has changed, and if the hash still matches the new time is saved in the pack."""
+    if pack_filename is None:
+        pack_filename = get_pack_filename(level_filename)
+    try:
+        with open(pack_filename, 'rb') as pack_file:
+            header = pack_file.read(HEADER.size)
+    except OSError:
+        return False
+    if len(header) != HEADER.size:
+        return False
+    magic, version, mtime, digest, count, offsets_position = HEADER.unpack(header)
+    if magic != LEVEL_PACK_MAGIC or version != LEVEL_PACK_VERSION:
+        return False
+    new_mtime = os.stat(level_filename).st_mtime
+    if new_mtime == mtime:
+        return True
+    if hash_file(level_filename) != digest:
+        return False
+    # The file was touched but not changed. Save its new time in the header, so the next check
+    # doesn't have to hash it again.
+    try:
+        with open(pack_filename, 'r+b') as pack_file:
+            pack_file.write(HEADER.pack(magic, version, new_mtime, digest, count,
+                                        offsets_position))
+    except OSError:
+        pass  # the pack is still good, it just gets hashed again next time
+    return True
+
+
+class LevelPack(object):
+    """A read-only list of the level objects in a level pack. The pack file is memory mapped,
+    and each level object is made from its packed record when it is asked for. The most recently
+    used level objects are kept, so anything the game saves in them (like the inside mask from
+    get_inside_mask()) is still there when the level is played again."""
+
+    def __init__(self, pack_filename, cache_size=32):
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()  # level_num -> level object, oldest first
+        self.pack_file = open(pack_filename, 'rb')
+        self.data = mmap.mmap(self.pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.mtime, self.digest, self.count, offsets_position = \
+            HEADER.unpack_from(self.data, 0)
+        assert magic == LEVEL_PACK_MAGIC and version == LEVEL_PACK_VERSION, \
+            '%s is not a version %s level pack.' % (pack_filename, LEVEL_PACK_VERSION)
+        self.offsets_position = offsets_position
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, level_num):
+        if level_num < 0:
+            level_num += self.count
+        if not 0 <= level_num < self.count:
+            raise IndexError('level number out of range')
+        if level_num in self.cache:
+            self.cache.move_to_end(level_num)
+            return self.cache[level_num]
+
+        offset = struct.unpack_from('<Q', self.data, self.offsets_position + level_num * 8)[0]
+        level_obj = self.unpack_level(offset)
+
+        self.cache[level_num] = level_obj
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)  # forget the least recently used level
+        return level_obj
+
+    def __iter__(self):
+        for level_num in range(self.count):
+            yield self[level_num]
+
+    def unpack_level(self, offset):
+        """Makes a level object from the packed record at the offset."""
+        data = self.data
+        width, height, start_x, start_y, num_goals, num_stars = \
+            RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        points = struct.unpack_from('<%sH' % ((num_goals + num_stars) * 2), data, offset)
+        offset += len(points) * 2
+        goals = list(zip(points[0:num_goals * 2:2], points[1:num_goals * 2:2]))
+        stars = list(zip(points[num_goals * 2::2], points[num_goals * 2 + 1::2]))
+
+        map_text = data[offset:offset + width * height].decode('latin-1')
+        map_obj = [list(map_text[x * height:(x + 1) * height]) for x in range(width)]
+
+        game_state_obj = {'player': (start_x, start_y),
+                          'step_counter': 0,
+                          'stars': stars}
+        return {'width': width,
+                'height': width,  # read_levels_file() sets both of these to the map's width
+                'map_obj': map_obj,
+                'goals': goals,
+                'start_state': game_state_obj}
+
+    def close(self):
+        self.data.close()
+        self.pack_file.close()
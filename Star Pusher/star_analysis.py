@@ -0,0 +1,170 @@
+# Star Pusher level analysis
+# Tables about a level's map that never change while it is played, worked out once per level.
+#
+# get_level_analysis(level_obj) returns a dict with:
+#   'grid'           - the level's LevelGrid (see star_state.py). All the lists below are
+#                      indexed by grid index, and use the grid's border of walls, so looking up
+#                      a space never needs a bounds check.
+#   'goals'          - the grid index of each goal, in order.
+#   'goal_distances' - one list per goal (in the same order as 'goals') with the fewest pushes
+#                      needed to get a star from each space onto that goal, or None if a star
+#                      can't be pushed from that space onto it.
+#   'nearest_goal'   - the fewest pushes from each space to any goal (0 for dead squares).
+#   'dead'           - True for dead squares: floor spaces that a star can never be pushed off
+#                      of onto a goal. A star on a dead square means the level can't be solved.
+#   'inside'         - the set of floor spaces the player can walk to (ignoring stars).
+#   'tunnels'        - HORIZONTAL or VERTICAL for inside spaces with walls on both sides (the
+#                      direction the player can walk through them), otherwise None.
+#   'corridors'      - a list of corridors, each a list of the grid indexes of a straight run
+#                      of tunnel spaces, in order.
+#   'rooms'          - the room number of each floor space the player can get to, or None.
+#                      Rooms are the open areas left when the tunnel spaces are taken out.
+#   'room_count'     - how many rooms there are.
+# The analysis is saved in level_obj['analysis'], so the solver, hints and deadlock warnings can
+# all share it.
+
+from star_state import LevelGrid
+
+HORIZONTAL = 'horizontal'
+VERTICAL = 'vertical'
+
+
+def get_level_analysis(level_obj):
+    """Returns the analysis of the level, working it out the first time and saving it in
+    level_obj['analysis'] for the next time."""
+    if 'analysis' not in level_obj:
+        level_obj['analysis'] = analyze_level(level_obj)
+    return level_obj['analysis']
+
+
+def analyze_level(level_obj):
+    """Works out all the tables described at the top of this file and returns them in a dict."""
+    grid = LevelGrid(level_obj)
+    goals = sorted(grid.goals)
+    goal_distances = [compute_goal_distances(grid, goal) for goal in goals]
+
+    dead = [True] * grid.size
+    nearest_goal = [0] * grid.size
+    for cell in range(grid.size):
+        reachable_goals = [distances[cell] for distances in goal_distances
+                           if distances[cell] is not None]
+        if reachable_goals:
+            dead[cell] = False
+            nearest_goal[cell] = min(reachable_goals)
+
+    inside = find_inside(grid)
+    tunnels = find_tunnels(grid, inside)
+    rooms, room_count = find_rooms(grid, inside, tunnels)
+
+    return {'grid': grid,
+            'goals': goals,
+            'goal_distances': goal_distances,
+            'nearest_goal': nearest_goal,
+            'dead': dead,
+            'inside': inside,
+            'tunnels': tunnels,
+            'corridors': find_corridors(grid, tunnels),
+            'rooms': rooms,
+            'room_count': room_count}
+
+
+def compute_goal_distances(grid, goal):
+    """Returns a list with the fewest number of pushes needed to get a star from each space onto
+    the goal space, or None for the spaces a star can't be pushed from onto the goal.
+
+    This works backwards from the goal by "pulling" the star away from it: a star can be pulled
+    from space c to space c+d only if the player has room to stand at c+2d."""
+    walls = grid.walls
+    distances = [None] * grid.size
+    distances[goal] = 0
+    queue = [goal]
+    for cell in queue:  # the queue grows while we loop over it, making this a breadth first search
+        for offset in grid.offsets.values():
+            pulled_to = cell + offset
+            if walls[pulled_to] or walls[pulled_to + offset]:
+                continue
+            if distances[pulled_to] is None:
+                distances[pulled_to] = distances[cell] + 1
+                queue.append(pulled_to)
+    return distances
+
+
+def find_inside(grid):
+    """Returns the set of floor spaces the player can walk to from the start, ignoring stars."""
+    walls = grid.walls
+    offsets = tuple(grid.offsets.values())
+    player = grid.index(grid.level_obj['start_state']['player'])
+    inside = {player}
+    stack = [player]
+    while stack:
+        cell = stack.pop()
+        for offset in offsets:
+            next_cell = cell + offset
+            if not walls[next_cell] and next_cell not in inside:
+                inside.add(next_cell)
+                stack.append(next_cell)
+    return inside
+
+
+def find_tunnels(grid, inside):
+    """Returns a list that is HORIZONTAL for inside spaces with walls above and below them,
+    VERTICAL for inside spaces with walls to the left and right, and None for everything else."""
+    walls = grid.walls
+    width = grid.width
+    tunnels = [None] * grid.size
+    for cell in inside:
+        if walls[cell - width] and walls[cell + width] and \
+           not (walls[cell - 1] and walls[cell + 1]):
+            tunnels[cell] = HORIZONTAL
+        elif walls[cell - 1] and walls[cell + 1] and \
+             not (walls[cell - width] and walls[cell + width]):
+            tunnels[cell] = VERTICAL
+    return tunnels
+
+
+def find_corridors(grid, tunnels):
+    """Returns a list of corridors: straight runs of tunnel spaces going the same way, each as a
+    list of grid indexes from left to right or top to bottom."""
+    corridors = []
+    for direction, step in ((HORIZONTAL, 1), (VERTICAL, grid.width)):
+        for cell in range(grid.size):
+            if tunnels[cell] != direction or tunnels[cell - step] == direction:
+                continue  # not the first space of a corridor
+            corridor = [cell]
+            while tunnels[corridor[-1] + step] == direction:
+                corridor.append(corridor[-1] + step)
+            corridors.append(corridor)
+    return corridors
+
+
+def find_rooms(grid, inside, tunnels):
+    """Splits the inside floor into rooms: the areas that are joined together without going
+    through a tunnel space. Returns a list with the room number of each space (None for walls,
+    tunnels and spaces the player can't get to) and the number of rooms."""
+    offsets = tuple(grid.offsets.values())
+    rooms = [None] * grid.size
+    room_count = 0
+    for start in sorted(inside):
+        if rooms[start] is not None or tunnels[start] is not None:
+            continue
+        rooms[start] = room_count
+        stack = [start]
+        while stack:
+            cell = stack.pop()
+            for offset in offsets:
+                next_cell = cell + offset
+                if next_cell in inside and rooms[next_cell] is None and \
+                   tunnels[next_cell] is None:
+                    rooms[next_cell] = room_count
+                    stack.append(next_cell)
+        room_count += 1
+    return rooms, room_count
+
+
+def is_dead_square(level_obj, x, y):
+    """Returns True if a star on the (x, y) map position could never be pushed onto a goal."""
+    analysis = get_level_analysis(level_obj)
+    grid = analysis['grid']
+    if x < 0 or x >= grid.map_width or y < 0 or y >= grid.map_height:
+        return True  # x and y aren't actually on the map.
+    return analysis['dead'][grid.index((x, y))]
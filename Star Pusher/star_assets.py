@@ -0,0 +1,177 @@
+# Star Pusher image atlas
+# Loads all of the game's images as one texture atlas, converted to the window's pixel format.
+#
+# Images straight from pygame.image.load() are in whatever pixel format the PNG file used, so
+# every blit of them has to convert each pixel to the window's format. Here all the images are
+# packed into one big Surface (the atlas), which is converted once with convert_alpha(), and each
+# image is a subsurface of it. Blitting a subsurface is just as fast as blitting a Surface, and
+# nothing is converted while the game is running.
+#
+# The packed atlas is also saved as raw pixels in a cache file, so after the first run the game
+# doesn't have to decode any PNG files at all. The cache remembers the size and modification time
+# of every image file, and is remade whenever any of them change.
+#
+# The cache file layout (all numbers are little-endian):
+#   header:  magic b'SPAT', version (uint16), SHA-1 of the image files' names, sizes and
+#            modification times (20 bytes), atlas width, atlas height (uint16 each), number of
+#            images (uint16)
+#   images:  for each image, the length of its name (uint16), the name (UTF-8), and its x, y,
+#            width and height in the atlas (uint16 each)
+#   pixels:  the atlas's pixels, 4 bytes (RGBA) each, row by row
+
+import hashlib, os, struct, time
+
+import pygame
+
+ATLAS_MAGIC = b'SPAT'
+ATLAS_VERSION = 1
+ATLAS_CACHE_FILENAME = 'starPusherAtlas.cache'
+ATLAS_WIDTH = 512  # images are packed into rows no wider than this
+
+HEADER = struct.Struct('<4sH20s3H')
+IMAGE_RECORD = struct.Struct('<4H')
+
+# The name in IMAGE_DICT and the file of every image the game uses.
+IMAGE_FILES = {'uncovered goal': 'RedSelector.png',
+               'covered goal': 'Selector.png',
+               'star': 'Star.png',
+               'corner': 'Wall_Block_Tall.png',
+               'wall': 'Wood_Block_Tall.png',
+               'inside floor': 'Plain_Block.png',
+               'outside floor': 'Grass_Block.png',
+               'title': 'star_title.png',
+               'solved': 'star_solved.png',
+               'princess': 'princess.png',
+               'boy': 'boy.png',
+               'catgirl': 'catgirl.png',
+               'horngirl': 'horngirl.png',
+               'pinkgirl': 'pinkgirl.png',
+               'rock': 'Rock.png',
+               'short tree': 'Tree_Short.png',
+               'tall tree': 'Tree_Tall.png',
+               'ugly tree': 'Tree_Ugly.png'}
+
+
+def get_files_signature(image_files):
+    """Returns the SHA-1 digest of the names, filenames, sizes and modification times of the
+    image files, which changes whenever any of the files do."""
+    sha1 = hashlib.sha1()
+    for name in sorted(image_files):
+        file_stat = os.stat(image_files[name])
+        sha1.update(('%s\0%s\0%s\0%s\0' % (name, image_files[name], file_stat.st_size,
+                                           file_stat.st_mtime_ns)).encode('utf-8'))
+    return sha1.digest()
+
+
+def pack_atlas(images):
+    """Packs the images (a dict of name -> Surface) into one atlas Surface. Returns the atlas and
+    a dict of name -> Rect with where each image is in it.
+
+    The images are placed tallest first, left to right in rows ("shelves") no wider than
+    ATLAS_WIDTH, which wastes little space when most images are the same size, like the tiles."""
+    rects = {}
+    shelf_x = 0
+    shelf_y = 0
+    shelf_height = 0
+    atlas_width = max([ATLAS_WIDTH] + [image.get_width() for image in images.values()])
+    for name in sorted(images, key=lambda name: (-images[name].get_height(), name)):
+        width, height = images[name].get_size()
+        if shelf_x + width > atlas_width:
+            # Start a new shelf under this one.
+            shelf_y += shelf_height
+            shelf_x = 0
+            shelf_height = 0
+        rects[name] = pygame.Rect(shelf_x, shelf_y, width, height)
+        shelf_x += width
+        shelf_height = max(shelf_height, height)
+
+    atlas = pygame.Surface((atlas_width, shelf_y + shelf_height), pygame.SRCALPHA, 32)
+    atlas.fill((0, 0, 0, 0))
+    for name, rect in rects.items():
+        # Adding onto the clear atlas copies the pixels exactly, where a normal blit would blend
+        # the image's see-through pixels with the atlas's.
+        atlas.blit(images[name], rect, special_flags=pygame.BLEND_RGBA_ADD)
+    return atlas, rects
+
+
+def write_atlas_cache(cache_filename, signature, atlas, rects):
+    """Saves the atlas's pixels and image Rects to the cache file. Like level packs, the cache
+    is written to a temporary file first and then renamed."""
+    width, height = atlas.get_size()
+    temp_filename = cache_filename + '.tmp'
+    with open(temp_filename, 'wb') as cache_file:
+        cache_file.write(HEADER.pack(ATLAS_MAGIC, ATLAS_VERSION, signature, width, height,
+                                     len(rects)))
+        for name, rect in rects.items():
+            name_bytes = name.encode('utf-8')
+            cache_file.write(struct.pack('<H', len(name_bytes)) + name_bytes)
+            cache_file.write(IMAGE_RECORD.pack(rect.x, rect.y, rect.width, rect.height))
+        cache_file.write(pygame.image.tobytes(atlas, 'RGBA'))
+    os.replace(temp_filename, cache_filename)
+
+
+def read_atlas_cache(cache_filename, signature):
+    """Returns the (atlas, rects) saved in the cache file, or None if there is no cache file or
+    it was made from different image files."""
+    try:
+        with open(cache_filename, 'rb') as cache_file:
+            data = cache_file.read()
+    except OSError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    magic, version, cache_signature, width, height, count = HEADER.unpack_from(data, 0)
+    if magic != ATLAS_MAGIC or version != ATLAS_VERSION or cache_signature != signature:
+        return None
+
+    offset = HEADER.size
+    rects = {}
+    for i in range(count):
+        name_length = struct.unpack_from('<H', data, offset)[0]
+        offset += 2
+        name = data[offset:offset + name_length].decode('utf-8')
+        offset += name_length
+        rects[name] = pygame.Rect(IMAGE_RECORD.unpack_from(data, offset))
+        offset += IMAGE_RECORD.size
+    if len(data) - offset != width * height * 4:
+        return None  # the file was cut short
+    atlas = pygame.image.frombuffer(data[offset:], (width, height), 'RGBA')
+    return atlas, rects
+
+
+def load_images(image_files=IMAGE_FILES, cache_filename=ATLAS_CACHE_FILENAME):
+    """Returns a dict of name -> Surface with every image in image_files, as subsurfaces of one
+    converted atlas, and a dict with how long loading took:
+        'cached'  - True if the atlas came from the cache file, False if the PNGs were decoded.
+        'read'    - seconds spent reading the cache or decoding the PNG files.
+        'pack'    - seconds spent packing the atlas and writing the cache (0 if it was cached).
+        'convert' - seconds spent converting the atlas to the window's pixel format.
+    The window must already be made with pygame.display.set_mode(), since convert_alpha()
+    needs to know its pixel format."""
+    timing = {'cached': True, 'read': 0.0, 'pack': 0.0, 'convert': 0.0}
+    start_time = time.perf_counter()
+    signature = get_files_signature(image_files)
+    cached = read_atlas_cache(cache_filename, signature)
+    timing['read'] = time.perf_counter() - start_time
+
+    if cached is None:
+        timing['cached'] = False
+        start_time = time.perf_counter()
+        images = dict((name, pygame.image.load(filename))
+                      for name, filename in image_files.items())
+        timing['read'] += time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        cached = pack_atlas(images)
+        try:
+            write_atlas_cache(cache_filename, signature, *cached)
+        except OSError:
+            pass  # the game can run without the cache, it just starts slower next time
+        timing['pack'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    atlas, rects = cached
+    atlas = atlas.convert_alpha()
+    image_dict = dict((name, atlas.subsurface(rect)) for name, rect in rects.items())
+    timing['convert'] = time.perf_counter() - start_time
+    return image_dict, timing
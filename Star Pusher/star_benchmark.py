@@ -0,0 +1,238 @@
+# Star Pusher benchmarks
+# Times the game's hot paths and writes the results as JSON, so runs can be compared.
+#
+# The benchmarks are:
+#   * read_levels_file - parsing the whole bundled level file.
+#   * decorate_map     - decorating the map of each level in BENCHMARK_LEVELS, the way it is done
+#                        the first time a level is played (the inside mask isn't cached yet).
+#   * inside_mask      - just the flood fill that finds the inside floor (compute_inside_mask()),
+#                        which is part of decorate_map.
+#   * make_move        - playing the moves of recorded replays with make_move(), in moves/second.
+#                        The replays are the solver's solutions to BENCHMARK_LEVELS (so every run
+#                        plays the same moves), plus any replays from --replays for those levels.
+#   * draw_map         - drawing the whole map of each level in BENCHMARK_LEVELS, in frames/second.
+#   * solver           - solving each level in BENCHMARK_LEVELS, in nodes/second.
+# Each benchmark is run --repeat times and the fastest and median times are reported; the fastest
+# time is the one least disturbed by whatever else the computer was doing. The random decorations
+# are seeded, so every run does exactly the same work.
+#
+# With --compare old.json, each benchmark is also compared with an earlier run, and the ones that
+# got more than --threshold percent slower are listed (and the exit code is 1).
+#
+# Usage: python star_benchmark.py [--output bench.json] [--compare old.json]
+
+import argparse, json, os, platform, random, statistics, sys, time
+
+# draw_map() needs a window to convert the images for, but the benchmarks shouldn't open one.
+# Also keep pygame's greeting out of the JSON printed to stdout.
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame
+
+import level_pack
+import star_pusher
+from star_engine import read_levels_file, decorate_map, make_move, get_inside_mask, \
+    compute_inside_mask, LURD_TO_DIRECTION, LEVELS_FILENAME
+from star_replay import read_replays
+from star_solver import solve
+
+BENCHMARK_VERSION = 2  # change this when the benchmarks change so old results aren't compared
+
+# The bundled levels that are benchmarked. They are the ones the solver can solve in a few
+# seconds, so the solver benchmark doesn't take too long.
+BENCHMARK_LEVELS = (0, 1, 2, 8, 11, 14)
+SOLVER_NODES = 100000
+SOLVER_TIME = 60.0  # only a safety net; the node limit is what stops an unsolved search
+REPEAT = 5
+# The quick benchmarks go through their levels this many times in each run, so that each run
+# takes long enough to be timed accurately.
+LOOPS = 100
+DECORATION_SEED = 42
+
+
+def time_runs(function, repeat):
+    """Calls function() repeat times and returns the list of how many seconds each call took."""
+    times = []
+    for i in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+    return times
+
+
+def summarize(times, operations, unit):
+    """Returns the result dict for a benchmark that did the given number of operations (of the
+    kind named by unit) in each of the times."""
+    best = min(times)
+    return {'runs': len(times),
+            'min_seconds': best,
+            'median_seconds': statistics.median(times),
+            'operations': operations,
+            'unit': unit,
+            'per_second': operations / best if best > 0 else None}
+
+
+def bench_read_levels_file(filename, repeat):
+    levels = []
+    times = time_runs(lambda: levels.append(read_levels_file(filename)), repeat)
+    return summarize(times, len(levels[-1]), 'levels')
+
+
+def bench_decorate_map(levels, repeat):
+    # The inside mask isn't passed, so every call does the flood fill too (get_inside_mask()
+    # would only do it the first time).
+    def decorate_all():
+        random.seed(DECORATION_SEED)
+        for i in range(LOOPS):
+            for level_obj in levels:
+                decorate_map(level_obj['map_obj'], level_obj['start_state']['player'])
+    return summarize(time_runs(decorate_all, repeat), LOOPS * len(levels), 'maps')
+
+
+def bench_inside_mask(levels, repeat):
+    def compute_all():
+        for i in range(LOOPS):
+            for level_obj in levels:
+                compute_inside_mask(level_obj['map_obj'], level_obj['start_state']['player'])
+    return summarize(time_runs(compute_all, repeat), LOOPS * len(levels), 'maps')
+
+
+def bench_make_move(replays, repeat):
+    """replays is a list of (level_obj, list of directions)."""
+    def play_all():
+        for i in range(LOOPS):
+            for level_obj, directions in replays:
+                start_state = level_obj['start_state']
+                game_state_obj = {'player': start_state['player'],
+                                  'step_counter': 0,
+                                  'stars': list(start_state['stars'])}
+                for direction in directions:
+                    make_move(level_obj['map_obj'], game_state_obj, direction)
+    moves = sum(len(directions) for level_obj, directions in replays)
+    return summarize(time_runs(play_all, repeat), LOOPS * moves, 'moves')
+
+
+def bench_draw_map(levels, repeat):
+    random.seed(DECORATION_SEED)
+    maps = [(decorate_map(level_obj['map_obj'], level_obj['start_state']['player'],
+                          get_inside_mask(level_obj)), level_obj) for level_obj in levels]
+
+    def draw_all():
+        for i in range(LOOPS // 10):
+            for map_obj, level_obj in maps:
+                star_pusher.draw_map(map_obj, level_obj['start_state'], level_obj['goals'])
+    return summarize(time_runs(draw_all, repeat), LOOPS // 10 * len(maps), 'frames')
+
+
+def bench_solver(levels, repeat):
+    """Returns the benchmark result and the solutions found, one list of directions (or None) per
+    level. The node count is the same every run, so only the time changes."""
+    results = []
+
+    def solve_all():
+        del results[:]
+        for level_obj in levels:
+            results.append(solve(level_obj, max_nodes=SOLVER_NODES, time_limit=SOLVER_TIME))
+    times = time_runs(solve_all, repeat)
+    summary = summarize(times, sum(result['nodes'] for result in results), 'nodes')
+    summary['solved'] = sum(1 for result in results if result['solved'])
+    return summary, [result['solution'] if result['solved'] else None for result in results]
+
+
+def run_benchmarks(levels_filename=LEVELS_FILENAME, replays_filename=None, repeat=REPEAT):
+    """Runs every benchmark and returns the results as a dict that can be saved as JSON."""
+    pygame.init()
+    star_pusher.DISPLAY_SURF = pygame.display.set_mode((star_pusher.WIN_WIDTH,
+                                                        star_pusher.WIN_HEIGHT))
+    star_pusher.set_up_images()
+
+    all_levels = read_levels_file(levels_filename)
+    levels = [all_levels[level_num] for level_num in BENCHMARK_LEVELS]
+    levels_hash = level_pack.hash_file(levels_filename).hex()
+
+    results = {}
+    results['read_levels_file'] = bench_read_levels_file(levels_filename, repeat)
+    results['decorate_map'] = bench_decorate_map(levels, repeat)
+    results['inside_mask'] = bench_inside_mask(levels, repeat)
+    results['draw_map'] = bench_draw_map(levels, repeat)
+    # The solver only needs to run once to find the replays, but it is timed like the rest.
+    results['solver'], solutions = bench_solver(levels, max(1, repeat // 2))
+
+    replays = [(level_obj, solution) for level_obj, solution in zip(levels, solutions)
+               if solution is not None]
+    if replays_filename is not None and os.path.exists(replays_filename):
+        for replay in read_replays(replays_filename):
+            if replay['levels_hash'] == levels_hash and replay['level'] in BENCHMARK_LEVELS:
+                directions = [LURD_TO_DIRECTION.get(letter.lower()) for letter in replay['moves']]
+                if None not in directions:
+                    replays.append((all_levels[replay['level']], directions))
+    results['make_move'] = bench_make_move(replays, repeat)
+    results['make_move']['replays'] = len(replays)
+
+    return {'version': BENCHMARK_VERSION,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'pygame': pygame.version.ver,
+            'platform': platform.platform(),
+            'levels_file': levels_filename,
+            'levels_hash': levels_hash,
+            'levels': list(BENCHMARK_LEVELS),
+            'repeat': repeat,
+            'benchmarks': results}
+
+
+def compare_results(old, new, threshold):
+    """Returns a list of (name, old seconds, new seconds, percent change) for every benchmark in
+    both results, and the list of names that got more than threshold percent slower."""
+    changes = []
+    slower = []
+    for name, result in sorted(new['benchmarks'].items()):
+        old_result = old['benchmarks'].get(name)
+        if old_result is None or old_result['operations'] != result['operations']:
+            continue  # the benchmark didn't do the same work, so the times can't be compared
+        change = (result['min_seconds'] / old_result['min_seconds'] - 1) * 100
+        changes.append((name, old_result['min_seconds'], result['min_seconds'], change))
+        if change > threshold:
+            slower.append(name)
+    return changes, slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time Star Pusher's hot paths.")
+    parser.add_argument('--levels', default=LEVELS_FILENAME,
+                        help='the level file to benchmark (default: %(default)s)')
+    parser.add_argument('--replays', default=None,
+                        help='a replay file with more replays for the make_move benchmark')
+    parser.add_argument('--repeat', type=int, default=REPEAT,
+                        help='how many times to run each benchmark (default: %(default)s)')
+    parser.add_argument('--output', default=None,
+                        help='the JSON file to write the results to (default: print them)')
+    parser.add_argument('--compare', default=None,
+                        help='the JSON results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='how many percent slower counts as a regression (default: '
+                             '%(default)s)')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.levels, args.replays, args.repeat)
+    if args.output is None:
+        print(json.dumps(results, indent=2))
+    else:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as compare_file:
+            old = json.load(compare_file)
+        if old.get('version') != BENCHMARK_VERSION:
+            sys.exit('%s was made by a different version of the benchmarks.' % (args.compare))
+        changes, slower = compare_results(old, results, args.threshold)
+        for name, old_seconds, new_seconds, change in changes:
+            sys.stderr.write('%-17s %9.4f s -> %9.4f s  %+6.1f%%\n' % (name, old_seconds,
+                                                                      new_seconds, change))
+        if slower:
+            sys.exit('Slower by more than %s%%: %s' % (args.threshold, ', '.join(slower)))
+
+
+if __name__ == '__main__':
+    main()
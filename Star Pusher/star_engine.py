@@ -0,0 +1,452 @@
+# Star Pusher engine
+# The rules of Star Pusher and the code for reading level files, without any Pygame code.
+#
+# star_pusher.py draws the game and handles the keyboard, and uses this module for everything
+# else. Since nothing here imports Pygame or needs a window, the solver, validator, replay
+# checker and benchmarks can import this module cheaply, including in worker processes.
+#
+# The data structures are the ones star_pusher.py has always used:
+#   map_obj        - a list of columns, so map_obj[x][y] is the character at (x, y).
+#   game_state_obj - a dict with 'player' (an (x, y) tuple), 'step_counter' and 'stars' (a list
+#                    of (x, y) tuples).
+#   level_obj      - a dict with 'width', 'height', 'map_obj', 'goals' (a list of (x, y)
+#                    tuples) and 'start_state' (the starting game_state_obj).
+
+import array, collections, copy, itertools, os, random
+
+import level_pack
+
+LEVEL_CACHE_SIZE = 32  # how many parsed levels a LevelCollection keeps in memory
+
+# The percentage of outdoor tiles that have additional decoration on them, such
+# as a tree or rock.
+OUTSIDE_DECORATION_PCT = 20
+# The map characters for the decorations. star_pusher.py's OUTSIDE_DECO_MAPPING has an image for
+# each of these.
+OUTSIDE_DECORATIONS = ('1', '2', '3', '4')
+
+UP = 'up'
+DOWN = 'down'
+LEFT = 'left'
+RIGHT = 'right'
+
+# The LURD notation used by most Sokoban programs. Lowercase letters are moves, uppercase
+# letters are pushes.
+DIRECTION_TO_LURD = {LEFT: 'l', UP: 'u', RIGHT: 'r', DOWN: 'd'}
+LURD_TO_DIRECTION = {'l': LEFT, 'u': UP, 'r': RIGHT, 'd': DOWN}
+
+LEVELS_FILENAME = 'starPusherLevels.txt'
+# Every time the player leaves a level, the moves they made are added to this file as a line of
+# "<SHA-1 of the level file> <level index> <moves in LURD notation>". See star_replay.py.
+REPLAY_FILENAME = 'starPusherReplays.txt'
+
+
+def is_wall(map_obj, x, y):
+    """Returns True if the (x, y) position on the map is a wall, otherwise return False."""
+    if x < 0 or x >= len(map_obj) or y < 0 or y >= len(map_obj[x]):
+        return False  # x and y aren't actually on the map.
+    elif map_obj[x][y] in ('#', 'x'):
+        return True  # wall is blocking
+    return False
+
+
+def is_floor(map_obj, x, y):
+    """Returns True if the player or a star can be on the (x, y) position: it is on the map and
+    isn't a wall. Spaces off the edge of the map count as walls. make_move() and LevelGrid in
+    star_state.py both use this, so the game and the solver always agree on the rules."""
+    if x < 0 or x >= len(map_obj) or y < 0 or y >= len(map_obj[x]):
+        return False  # x and y aren't actually on the map.
+    return map_obj[x][y] not in ('#', 'x')
+
+
+def is_blocked(map_obj, game_state_obj, x, y):
+    """Returns True if the (x, y) position on the map is blocked by a wall or star, otherwise
+    return False."""
+
+    if is_wall(map_obj, x, y):
+        return True
+
+    elif x < 0 or x >= len(map_obj) or y < 0 or y >= len(map_obj[x]):
+        return True  # x and y aren't actually on the map.
+
+    elif (x, y) in game_state_obj['stars']:
+        return True  # a star is blocking
+
+    return False
+
+
+def make_move(map_obj, game_state_obj, player_move_to):
+    """Given a map and game state object, see if it is possible for the player to make the given
+    move. If it is, then change the player's position (and the position of any pusher star). If
+    not, do nothing.
+
+    Returns True if the player moved, otherwise False."""
+
+    # Make sure the player can move in the direction they want.
+    player_x, player_y = game_state_obj['player']
+
+    # This variable is "syntactic sugar". Typing "stars" is more readable than typing
+    # "game_state_obj['stars']" in our code.
+    stars = game_state_obj['stars']
+
+    # The code for handling each of the directions is so similar aside from adding or subtracting
+    # 1 to the x/y coordinates. We can simplify it by using the x_offset and y_offset variables.
+    if player_move_to == UP:
+        x_offset = 0
+        y_offset = -1
+    elif player_move_to == RIGHT:
+        x_offset = 1
+        y_offset = 0
+    elif player_move_to == DOWN:
+        x_offset = 0
+        y_offset = 1
+    elif player_move_to == LEFT:
+        x_offset = -1
+        y_offset = 0
+
+    # See if the player can move in that direction. (Not is_wall(), which says spaces off the
+    # map aren't walls, so the player could walk off the edge of a map without walls around it.)
+    if not is_floor(map_obj, player_x + x_offset, player_y + y_offset):
+        return False
+    else:
+        if (player_x + x_offset, player_y + y_offset) in stars:
+            # There is a star in the way, see if the player can push it.
+            if not is_blocked(map_obj, game_state_obj, player_x + (x_offset*2), player_y + (
+                    y_offset*2)):
+                # Move the star.
+                ind = stars.index((player_x + x_offset, player_y + y_offset))
+                stars[ind] = (stars[ind][0] + x_offset, stars[ind][1] + y_offset)
+            else:
+                return False
+        # Move the player upwards.
+        game_state_obj['player'] = (player_x + x_offset, player_y + y_offset)
+        return True
+
+
+def is_level_finished(level_obj, game_state_obj):
+    """Returns True if all the goals have stars in them."""
+    for goal in level_obj['goals']:
+        if goal not in game_state_obj['stars']:
+            # Found a space with a goal but no star on it.
+            return False
+    return True
+
+
+def get_delta_lurd(level_grid, delta):
+    """Returns the LURD letter for a move delta: uppercase if it pushed a star."""
+    player_from, player_to, star_from, star_to = delta
+    for direction, offset in level_grid.offsets.items():
+        if player_from + offset == player_to:
+            letter = DIRECTION_TO_LURD[direction]
+    if star_from is not None:
+        return letter.upper()
+    return letter
+
+
+def save_replay(filename, levels_hash, level_num, moves):
+    """Adds a replay line for the moves made on a level to the replay file."""
+    with open(filename, 'a') as replay_file:
+        replay_file.write('%s %s %s\n' % (levels_hash, level_num, moves))
+
+
+def decorate_map(map_obj, startxy, inside_mask=None):
+    """Makes a copy of the given map object and modifies it.
+    Here is what is done to it:
+        * Walls that are corners are turned into corner pieces.
+        * The outside/inside floor tile distinction is make.
+        * Tree/rock decorations are randomly added to the outside tiles.
+
+    inside_mask is the value returned by compute_inside_mask() for this map and start position.
+    If it isn't passed it is computed here.
+
+    Returns the decorated map object."""
+
+    if inside_mask is None:
+        inside_mask = compute_inside_mask(map_obj, startxy)
+
+    # Copy the map object so we don't modify the original passed
+    map_obj_copy = copy.deepcopy(map_obj)
+
+    # Remove the non-wall characters from the map data, and mark the inside floor tiles.
+    for x in range(len(map_obj_copy)):
+        for y in range(len(map_obj_copy[0])):
+            if inside_mask[x][y]:
+                map_obj_copy[x][y] = 'o'
+            elif map_obj_copy[x][y] in ('$', '.', '@', '+', '*'):
+                map_obj_copy[x][y] = ' '
+
+    # Convert the adjoined walls into corner tiles.
+    for x in range(len(map_obj_copy)):
+        for y in range(len(map_obj_copy[0])):
+
+            if map_obj_copy[x][y] == '#':
+                if (is_wall(map_obj_copy, x, y-1) and is_wall(map_obj_copy, x+1, y)) or \
+                   (is_wall(map_obj_copy, x+1, y) and is_wall(map_obj_copy, x, y+1)) or \
+                   (is_wall(map_obj_copy, x, y+1) and is_wall(map_obj_copy, x-1, y)) or \
+                   (is_wall(map_obj_copy, x-1, y) and is_wall(map_obj_copy, x, y-1)):
+                    map_obj_copy[x][y] = 'x'
+                elif map_obj_copy[x][y] == ' ' and random.randint(0, 99) < OUTSIDE_DECORATION_PCT:
+                    map_obj_copy[x][y] = random.choice(OUTSIDE_DECORATIONS)
+
+    return map_obj_copy
+
+
+def compute_inside_mask(map_obj, startxy):
+    """Returns a list of lists (indexed [x][y] like map_obj) that is True for the floor tiles
+    the player can walk to from startxy, which are drawn as inside floor tiles."""
+    start_x, start_y = startxy  # Syntactic sugar
+
+    # Make a copy of the map with all the floor spaces blank, then flood fill to determine
+    # inside/outside floor tiles.
+    fill_map = []
+    for x in range(len(map_obj)):
+        fill_map.append([])
+        for y in range(len(map_obj[x])):
+            if map_obj[x][y] in ('$', '.', '@', '+', '*'):
+                fill_map[x].append(' ')
+            else:
+                fill_map[x].append(map_obj[x][y])
+    flood_fill(fill_map, start_x, start_y, ' ', 'o')
+
+    return [[character == 'o' for character in column] for column in fill_map]
+
+
+def get_inside_mask(level_obj):
+    """Returns compute_inside_mask() for the level's map. It is only computed the first time,
+    and then kept in level_obj['inside_mask'] for the next time the level is played."""
+    if 'inside_mask' not in level_obj:
+        level_obj['inside_mask'] = compute_inside_mask(level_obj['map_obj'],
+                                                       level_obj['start_state']['player'])
+    return level_obj['inside_mask']
+
+
+def flood_fill(map_obj, x, y, old_character, new_character):
+    """Changes any values matching old_character on the map object to new_character at the
+    (x,y) position, and does the same for the positions to the left, right, down and up of
+    (x, y), and theirs, until the whole connected area has changed.
+
+    In this game, the flood fill algorithm creates the inside/outside floor distinction. This is
+    a "scanline" flood fill: it changes a whole run of a column at once, and keeps a list of
+    the spaces still to be filled instead of calling itself, so large maps can't hit Python's
+    recursion limit. Every space is looked at a fixed number of times."""
+    if old_character == new_character:
+        return  # nothing would change
+
+    # Start from (x, y), or from its neighbors if (x, y) itself isn't old_character.
+    to_fill = [(x, y), (x+1, y), (x-1, y), (x, y+1), (x, y-1)]
+    if map_obj[x][y] == old_character:
+        to_fill = to_fill[:1]
+
+    while len(to_fill) > 0:
+        x, y = to_fill.pop()
+        if x < 0 or x >= len(map_obj) or y < 0 or y >= len(map_obj[x]):
+            continue  # x and y aren't actually on the map.
+        column = map_obj[x]
+        if column[y] != old_character:
+            continue  # this space was already filled
+
+        # Find the top and bottom of the run of old_character in this column, and fill it.
+        top = y
+        while top > 0 and column[top - 1] == old_character:
+            top -= 1
+        bottom = y
+        while bottom < len(column) - 1 and column[bottom + 1] == old_character:
+            bottom += 1
+        for row in range(top, bottom + 1):
+            column[row] = new_character
+
+        # Add the first space of each run of old_character next to this run, in the columns to
+        # the left and right, to the spaces still to be filled.
+        for side_x in (x - 1, x + 1):
+            if side_x < 0 or side_x >= len(map_obj):
+                continue
+            side_column = map_obj[side_x]
+            in_run = False
+            for row in range(top, min(bottom + 1, len(side_column))):
+                if side_column[row] == old_character:
+                    if not in_run:
+                        to_fill.append((side_x, row))
+                    in_run = True
+                else:
+                    in_run = False
+
+
+def load_levels(filename):
+    """Returns the levels in the level file as a list-like object of level objects.
+
+    The first time a level file is loaded (or after it changes) it is read one level at a time
+    with a LevelCollection and saved as a level pack (see level_pack.py). After that the pack is
+    opened instead, which doesn't parse anything, and only makes a level object when the game
+    asks for that level."""
+    assert os.path.exists(filename), 'Cannot find the level file: %s' % (filename)
+    pack_filename = level_pack.get_pack_filename(filename)
+    if not level_pack.is_pack_current(filename, pack_filename):
+        levels = LevelCollection(filename)
+        try:
+            level_pack.write_level_pack(levels, filename, pack_filename)
+        except OSError:
+            return levels  # the pack couldn't be saved, so read the level file as needed
+    return level_pack.LevelPack(pack_filename, LEVEL_CACHE_SIZE)
+
+
+def read_levels_file(filename):
+    assert os.path.exists(filename), 'Cannot find the level file: %s' % (filename)
+    map_file = open(filename, 'r')
+    # Each level must end with a blank line
+    content = map_file.readlines() + ['\r\n']
+    map_file.close()
+
+    levels = []  # Will contain a list of level objects.
+    level_num = 0
+    map_text_lines = []  # contains the lines for a single level's map.
+    for line_num in range(len(content)):
+        # Process each line that was in the level file.
+        line = content[line_num].rstrip('\r\n')
+
+        if ';' in line:
+            # Ignore the ; lines, they're comments in the level file.
+            line = line[:line.find(';')]
+
+        if line != '':
+            # This line is part of the map.
+            map_text_lines.append(line)
+        elif line == '' and len(map_text_lines) > 0:
+            # A blank line indicates the end of a level's map in the file. Convert the text in
+            # map_text_lines into a level object.
+            levels.append(parse_level(map_text_lines, level_num, line_num, filename))
+
+            # Reset the variables for reading the next map.
+            map_text_lines = []
+            level_num += 1
+    return levels
+
+
+def parse_level(map_text_lines, level_num, line_num, filename):
+    """Converts the lines of text for a single level's map into a level object. level_num,
+    line_num and filename are only used in the error messages."""
+
+    # Find the longest row in the map.
+    max_width = -1
+    for i in range(len(map_text_lines)):
+        if len(map_text_lines[i]) > max_width:
+            max_width = len(map_text_lines[i])
+    # Add spaces to the ends of the shorter rows. This ensures the map will be rectangular.
+    map_text_lines = [line + ' ' * (max_width - len(line)) for line in map_text_lines]
+
+    # Convert map_text_lines to a map object.
+    map_obj = []  # the map object made from the data in map_text_lines
+    for x in range(len(map_text_lines[0])):
+        map_obj.append([])
+    for y in range(len(map_text_lines)):
+        for x in range(max_width):
+            map_obj[x].append(map_text_lines[y][x])
+
+    # Loop through the spaces in the map and find the @, ., and $ characters for the
+    # starting game state.
+    start_x = None  # The x and y for the player's starting position
+    start_y = None
+    goals = []  # list of (x, y) tuples for each goal.
+    stars = []  # list of (x, y) for each star's starting position.
+    for x in range(max_width):
+        for y in range(len(map_obj[x])):
+            if map_obj[x][y] in ('@', '+'):
+                # '@' is player, '+' is player & goal
+                start_x = x
+                start_y = y
+            if map_obj[x][y] in ('.', '+', '*'):
+                # '.' is goal, '*' is star & goal
+                goals.append((x, y))
+            if map_obj[x][y] in ('$', '*'):
+                # '$' is star
+                stars.append((x, y))
+    # Basic level design sanity checks:
+    assert start_x != None and start_y != None, 'Level %s (around line %s) in %s is ' \
+                                                'missing a "@" or "+" to mark the start ' \
+                                                'point.' % (level_num + 1, line_num, filename)
+    assert len(goals) > 0, 'Level %s (around line %s) in %s must have at least one goal.'\
+                           % (level_num + 1, line_num, filename)
+    assert len(stars) >= len(goals), 'Level %s (around line %s) in %s is impossible to ' \
+                                     'solve. It has %s goals but only %s stars.' % (
+        level_num + 1, line_num, filename, len(goals), len(stars))
+
+    # Create level object and starting game state object.
+    game_state_obj = {'player': (start_x, start_y),
+                      'step_counter': 0,
+                      'stars': stars}
+    level_obj = {'width': max_width,
+                 'height': len(map_obj),
+                 'map_obj': map_obj,
+                 'goals': goals,
+                 'start_state': game_state_obj}
+    return level_obj
+
+
+class LevelCollection(object):
+    """A read-only list of the levels in a level file that only parses a level when it is asked
+    for. Making the collection scans the file once to find where each level's lines start and
+    end (using the same blank line and ; comment rules as read_levels_file()), and only those
+    file positions are kept. The most recently used level objects are kept in a small cache, so
+    going back and forth between levels doesn't parse them again."""
+
+    def __init__(self, filename, cache_size=LEVEL_CACHE_SIZE):
+        assert os.path.exists(filename), 'Cannot find the level file: %s' % (filename)
+        self.filename = filename
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()  # level_num -> level object, oldest first
+        self.starts = array.array('Q')  # file position of each level's first line
+        self.ends = array.array('Q')  # file position just after each level's last line
+        self.end_line_nums = array.array('L')  # line number of the blank line after each level
+
+        with open(filename, 'rb') as level_file:
+            position = 0
+            level_start = None
+            # Each level must end with a blank line, so add one at the end of the file.
+            for line_num, line in enumerate(itertools.chain(level_file, [b'\r\n'])):
+                if self.is_map_line(line):
+                    if level_start is None:
+                        level_start = position
+                    level_end = position + len(line)
+                elif level_start is not None:
+                    self.starts.append(level_start)
+                    self.ends.append(level_end)
+                    self.end_line_nums.append(line_num)
+                    level_start = None
+                position += len(line)
+
+    def is_map_line(self, line):
+        """Returns True if the line (as bytes) is part of a level's map."""
+        return line.split(b';', 1)[0].rstrip(b'\r\n') != b''
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, level_num):
+        if level_num < 0:
+            level_num += len(self)
+        if not 0 <= level_num < len(self):
+            raise IndexError('level number out of range')
+
+        if level_num in self.cache:
+            self.cache.move_to_end(level_num)
+            return self.cache[level_num]
+
+        with open(self.filename, 'rb') as level_file:
+            level_file.seek(self.starts[level_num])
+            text = level_file.read(self.ends[level_num] - self.starts[level_num])
+        map_text_lines = []
+        for line in text.decode('latin-1').splitlines():
+            if ';' in line:
+                line = line[:line.find(';')]
+            if line != '':
+                map_text_lines.append(line)
+        level_obj = parse_level(map_text_lines, level_num, self.end_line_nums[level_num],
+                                self.filename)
+
+        self.cache[level_num] = level_obj
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)  # forget the least recently used level
+        return level_obj
+
+    def __iter__(self):
+        for level_num in range(len(self)):
+            yield self[level_num]
@@ -0,0 +1,343 @@
+# Star Pusher level generator
+# Makes new levels by playing the game backwards, and keeps the ones that are the right difficulty.
+#
+# Each new level is made like this:
+#   1. A room is built out of random 3x3 room templates (each one turned or mirrored at random),
+#      and only the biggest connected area of floor is kept.
+#   2. The stars are put on random goals, and the player on a random floor space.
+#   3. The game is played backwards: the player "pulls" stars away from the goals, picking a
+#      random pull each time. Every pull can be undone by a push, so the stars can always be
+#      pushed back onto the goals, which means the level can always be solved.
+#      The position along the way that is farthest from the goals becomes the level.
+#   4. The solver (see star_solver.py) finds the fewest pushes needed to solve the level, and how
+#      many pushes the player could choose between along the way (the "branching"). A level is
+#      kept only if these are inside the difficulty band asked for.
+# The work is spread over a pool of worker processes, and each level is added to the output file
+# in the normal level file format as soon as it is found. Levels with the same layout as one
+# already in the output file (even turned or mirrored) are skipped.
+#
+# Usage: python star_generator.py newLevels.txt [--count 100] [--difficulty medium]
+
+import argparse, concurrent.futures, os, random, sys, time
+
+from star_engine import parse_level, LevelCollection
+from star_analysis import get_level_analysis
+from star_solver import solve, find_reachable
+from star_solutions import get_layout_key, transform_xy, SYMMETRIES
+
+# The 3x3 pieces rooms are built from. '#' is wall and ' ' is floor.
+ROOM_TEMPLATES = [['   ', '   ', '   '],
+                  ['#  ', '   ', '   '],
+                  ['## ', '   ', '   '],
+                  ['###', '   ', '   '],
+                  ['###', '#  ', '#  '],
+                  ['#  ', '   ', '  #'],
+                  ['#  ', '#  ', '#  '],
+                  ['   ', ' # ', '   '],
+                  ['## ', '#  ', '   '],
+                  ['## ', '## ', '   '],
+                  ['#  ', '## ', '   '],
+                  [' # ', '   ', '   ']]
+
+# The settings for each difficulty. 'blocks' is the range of the room's width and height in
+# templates, and 'pulls' is the range of how many pulls are made when playing backwards.
+DIFFICULTY_BANDS = {'easy': {'min_pushes': 4, 'max_pushes': 8, 'min_branching': 1.5,
+                             'stars': 2, 'blocks': (2, 3), 'pulls': (10, 40)},
+                    'medium': {'min_pushes': 9, 'max_pushes': 16, 'min_branching': 2.0,
+                               'stars': 3, 'blocks': (3, 3), 'pulls': (30, 100)},
+                    'hard': {'min_pushes': 17, 'max_pushes': 60, 'min_branching': 2.5,
+                             'stars': 4, 'blocks': (3, 4), 'pulls': (60, 200)}}
+
+ATTEMPTS_PER_TASK = 50  # how many levels a worker tries before reporting back
+SOLVER_NODES = 20000  # levels that take more nodes than this to solve are thrown away
+SOLVER_TIME = 5.0  # likewise for seconds
+
+OFFSETS = ((0, -1), (0, 1), (-1, 0), (1, 0))
+
+
+def make_room(rand, blocks_wide, blocks_high):
+    """Returns a room built from random room templates, as a list of lists indexed [x][y] that
+    is True for walls. The room has a border of walls, and only its biggest area of connected
+    floor is kept."""
+    width = blocks_wide * 3 + 2
+    height = blocks_high * 3 + 2
+    walls = [[True] * height for x in range(width)]
+    for block_x in range(blocks_wide):
+        for block_y in range(blocks_high):
+            template = rand.choice(ROOM_TEMPLATES)
+            symmetry = rand.choice(SYMMETRIES)
+            for x in range(3):
+                for y in range(3):
+                    new_x, new_y = transform_xy(x, y, 3, 3, symmetry)
+                    walls[block_x * 3 + 1 + new_x][block_y * 3 + 1 + new_y] = \
+                        template[y][x] == '#'
+
+    # Find each area of connected floor, and turn all but the biggest back into wall.
+    areas = []
+    seen = set()
+    for x in range(width):
+        for y in range(height):
+            if walls[x][y] or (x, y) in seen:
+                continue
+            area = [(x, y)]
+            seen.add((x, y))
+            for area_x, area_y in area:  # area grows while we loop over it
+                for offset_x, offset_y in OFFSETS:
+                    next_xy = (area_x + offset_x, area_y + offset_y)
+                    if not walls[next_xy[0]][next_xy[1]] and next_xy not in seen:
+                        seen.add(next_xy)
+                        area.append(next_xy)
+            areas.append(area)
+    areas.sort(key=len)
+    for area in areas[:-1]:
+        for x, y in area:
+            walls[x][y] = True
+    return walls
+
+
+def pull_stars(rand, walls, goals, player, pulls, distances):
+    """Plays the game backwards from the stars sitting on the goals, making the given number of
+    random pulls. Returns the (player, stars) it went through that is farthest from being solved,
+    where stars is a set of (x, y). distances has the fewest pushes from each floor space to the
+    nearest goal, and how far a position is from being solved is measured by adding them up for
+    every star. (Random pulls often undo each other, so the last position isn't always the
+    farthest.)"""
+    stars = set(goals)
+    best = (0, player, frozenset(stars))
+    for i in range(pulls):
+        # Find every space the player can walk to without moving a star.
+        reach = set([player])
+        stack = [player]
+        while stack:
+            x, y = stack.pop()
+            for offset_x, offset_y in OFFSETS:
+                next_xy = (x + offset_x, y + offset_y)
+                if next_xy not in reach and not walls[next_xy[0]][next_xy[1]] and \
+                   next_xy not in stars:
+                    reach.add(next_xy)
+                    stack.append(next_xy)
+
+        # A star next to the player can be pulled if there is room for the player to step
+        # back. The player ends up on that space, and the star where the player was.
+        choices = []
+        for x, y in reach:
+            for offset_x, offset_y in OFFSETS:
+                star = (x + offset_x, y + offset_y)
+                back = (x - offset_x, y - offset_y)
+                if star in stars and not walls[back[0]][back[1]] and back not in stars:
+                    choices.append(((x, y), star, back))
+        if not choices:
+            break
+        space, star, back = rand.choice(choices)
+        stars.remove(star)
+        stars.add(space)
+        player = back
+        distance = sum(distances[star] for star in stars)
+        if distance >= best[0]:
+            best = (distance, player, frozenset(stars))
+    return best[1], set(best[2])
+
+
+def make_level_text(walls, goals, player, stars):
+    """Returns the lines of a level file map for the level. Walls that don't touch any floor
+    (not even diagonally) are left out, like in the hand made levels. Rows that end up blank
+    are left out too (a blank line would end the level in a level file), so the rows of the
+    level can start higher up than the rows of walls."""
+    width = len(walls)
+    height = len(walls[0])
+    lines = []
+    for y in range(height):
+        line = []
+        for x in range(width):
+            if walls[x][y]:
+                touches_floor = any(0 <= x + dx < width and 0 <= y + dy < height and
+                                    not walls[x + dx][y + dy]
+                                    for dx in (-1, 0, 1) for dy in (-1, 0, 1))
+                line.append('#' if touches_floor else ' ')
+            elif (x, y) == player:
+                line.append('+' if (x, y) in goals else '@')
+            elif (x, y) in stars:
+                line.append('*' if (x, y) in goals else '$')
+            elif (x, y) in goals:
+                line.append('.')
+            else:
+                line.append(' ')
+        lines.append(''.join(line).rstrip())
+    return [line for line in lines if line != '']
+
+
+def measure_branching(level_obj, solution):
+    """Returns the average number of pushes the player could choose from (not counting pushes
+    onto dead squares) at each push along the solution."""
+    analysis = get_level_analysis(level_obj)
+    grid = analysis['grid']
+    dead = analysis['dead']
+    state = grid.start_state()
+    choices = []
+    for direction in solution:
+        new_state = grid.move(state, direction)
+        if new_state.stars != state.stars:
+            reach = find_reachable(grid, state.player, state.stars)
+            count = 0
+            for star in grid.star_cells(state.stars):
+                for offset in grid.offsets.values():
+                    push_to = star + offset
+                    if star - offset in reach and not grid.walls[push_to] and \
+                       not grid.has_star(state, push_to) and \
+                       (not dead[push_to] or push_to in grid.goals):
+                        count += 1
+            choices.append(count)
+        state = new_state
+    return sum(choices) / float(len(choices))
+
+
+def generate_level(seed, band):
+    """Tries up to ATTEMPTS_PER_TASK random levels (starting from the random seed) and returns
+    the first one inside the difficulty band, as a dict with 'lines' (the map's lines), 'seed',
+    'pushes', 'moves', 'branching', 'nodes' and 'attempts'. Returns a dict with just 'attempts'
+    if none of them were. This runs in a worker process."""
+    rand = random.Random(seed)
+    for attempt in range(1, ATTEMPTS_PER_TASK + 1):
+        walls = make_room(rand, rand.randint(*band['blocks']), rand.randint(*band['blocks']))
+        floor = [(x, y) for x in range(len(walls)) for y in range(len(walls[0]))
+                 if not walls[x][y]]
+        if len(floor) < band['stars'] * 4:
+            continue  # too cramped to be interesting
+        spaces = rand.sample(floor, band['stars'] + 1)
+        goals = spaces[:-1]
+
+        # Work out how many pushes it takes to get a star from each space to a goal. The level
+        # is missing any blank rows at the top of walls, so its y coordinates are shifted by
+        # that many rows; the player's start shows by how much.
+        solved_level = parse_level(make_level_text(walls, set(goals), spaces[-1], set(goals)),
+                                   0, 0, 'generated level')
+        shift_y = spaces[-1][1] - solved_level['start_state']['player'][1]
+        analysis = get_level_analysis(solved_level)
+        distances = dict((xy, analysis['nearest_goal'][analysis['grid'].index((xy[0],
+                                                                              xy[1] - shift_y))])
+                         for xy in floor)
+
+        player, stars = pull_stars(rand, walls, goals, spaces[-1],
+                                   rand.randint(*band['pulls']), distances)
+        if stars == set(goals):
+            continue  # the stars couldn't be pulled anywhere
+
+        lines = make_level_text(walls, set(goals), player, stars)
+        level_obj = parse_level(lines, 0, 0, 'generated level')
+        result = solve(level_obj, max_nodes=SOLVER_NODES, time_limit=SOLVER_TIME)
+        if not result['solved'] or \
+           not band['min_pushes'] <= result['pushes'] <= band['max_pushes']:
+            continue
+        branching = measure_branching(level_obj, result['solution'])
+        if branching < band['min_branching']:
+            continue
+        return {'lines': lines, 'seed': seed, 'pushes': result['pushes'],
+                'moves': result['moves'], 'branching': branching, 'nodes': result['nodes'],
+                'attempts': attempt}
+    return {'attempts': ATTEMPTS_PER_TASK}
+
+
+def write_level(level_file, level_num, level):
+    """Adds a generated level to the open level file, and makes sure it is written to disk."""
+    level_file.write('; Generated level %s (seed %s): %s pushes, %s moves, branching %.1f\n' % (
+        level_num, level['seed'], level['pushes'], level['moves'], level['branching']))
+    for line in level['lines']:
+        level_file.write(line + '\n')
+    level_file.write('\n')
+    level_file.flush()
+
+
+def generate_levels(filename, count, band, workers=None, seed=None, time_limit=None,
+                    progress=None):
+    """Generates count new levels in the difficulty band across a pool of worker processes, and
+    adds each one to the level file as soon as it is found. Returns the number of levels added.
+    progress, if given, is called with each level that is added."""
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    workers = workers or os.cpu_count() or 1
+
+    # Remember the layouts already in the file so they aren't added again.
+    layouts = set()
+    level_num = 0
+    if os.path.exists(filename):
+        for level_obj in LevelCollection(filename):
+            layouts.add(get_layout_key(level_obj)[0])
+            level_num += 1
+
+    start_time = time.time()
+    added = 0
+    next_seed = seed
+    with open(filename, 'a') as level_file, \
+         concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        # Keep two tasks per worker waiting, so no worker ever sits idle.
+        running = set()
+        task_seeds = {}  # future -> the seed its task started from
+        while added < count and (time_limit is None or time.time() - start_time < time_limit):
+            while len(running) < workers * 2:
+                future = executor.submit(generate_level, next_seed, band)
+                task_seeds[future] = next_seed
+                running.add(future)
+                next_seed += 1
+            done, running = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                seed_of_task = task_seeds.pop(future)
+                try:
+                    level = future.result()
+                except Exception as error:
+                    # A bug in one task shouldn't throw away a long run, so just report it.
+                    sys.stderr.write('The task for seed %s failed: %r\n' % (seed_of_task, error))
+                    continue
+                if 'lines' not in level or added >= count:
+                    continue
+                layout_hash = get_layout_key(parse_level(level['lines'], 0, 0, filename))[0]
+                if layout_hash in layouts:
+                    continue
+                layouts.add(layout_hash)
+                level_num += 1
+                added += 1
+                write_level(level_file, level_num, level)
+                if progress is not None:
+                    progress(level_num, level)
+        for future in running:
+            future.cancel()
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate new Star Pusher levels.')
+    parser.add_argument('file', help='the level file to add the new levels to')
+    parser.add_argument('--count', type=int, default=100, help='how many levels to make')
+    parser.add_argument('--difficulty', choices=sorted(DIFFICULTY_BANDS), default='medium',
+                        help='which difficulty band to make levels in')
+    parser.add_argument('--min-pushes', type=int, help='change the band\'s fewest pushes')
+    parser.add_argument('--max-pushes', type=int, help='change the band\'s most pushes')
+    parser.add_argument('--stars', type=int, help='change the band\'s number of stars')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='how many processes to use (default: one per CPU core)')
+    parser.add_argument('--seed', type=int, default=None, help='the first random seed to use')
+    parser.add_argument('--time', type=float, default=None,
+                        help='stop after this many seconds, even if not enough levels were made')
+    args = parser.parse_args()
+
+    band = dict(DIFFICULTY_BANDS[args.difficulty])
+    for key in ('min_pushes', 'max_pushes', 'stars'):
+        if getattr(args, key) is not None:
+            band[key] = getattr(args, key)
+    if band['min_pushes'] > band['max_pushes']:
+        sys.exit('--min-pushes must not be more than --max-pushes.')
+
+    def show_progress(level_num, level):
+        print('Level %s: %s pushes, %s moves, branching %.1f (seed %s)' % (
+            level_num, level['pushes'], level['moves'], level['branching'], level['seed']))
+
+    start_time = time.time()
+    added = generate_levels(args.file, args.count, band, args.workers, args.seed, args.time,
+                            show_progress)
+    seconds = time.time() - start_time
+    print('Added %s levels to %s in %.1f seconds (%.0f levels per hour).' % (
+        added, args.file, seconds, added * 3600 / max(seconds, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
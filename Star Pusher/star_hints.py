@@ -0,0 +1,153 @@
+# Star Pusher hints
+# Finds the next push toward the solution with the fewest pushes, on a background thread.
+#
+# Searching for a solution can take seconds, and if run_level() did it the window would stop
+# responding until it finished. A HintFinder runs the solver on a separate thread instead, and
+# run_level() just checks each frame if the hint is ready. If the player moves while the search
+# is running the search is cancelled, since its answer would be for the wrong position.
+#
+# Every hint found is kept, for every position along the solution the solver found (the rest of
+# a solution with the fewest pushes is itself a solution with the fewest pushes), so a player who
+# follows the hints gets each of the next ones right away. A hint is the next push, so walking
+# around without pushing doesn't change it: hints are kept by the stars and the area the player
+# can walk to (named by its lowest numbered space, like the solver's positions), not the
+# player's exact space. Searches also go through the solution database (see star_solutions.py),
+# so positions solved in an earlier game are just looked up.
+#
+# The hints are written by the search thread and read by the game's thread, so they are only
+# touched while holding the HintFinder's lock.
+
+import threading
+
+from star_solver import solve_cached, find_reachable
+from star_solutions import SolutionDB, SOLUTION_DB_FILENAME
+
+HINT_TIME_LIMIT = 30.0  # the most seconds to search for a hint
+HINT_MAX_NODES = 2000000  # the most positions to search for a hint
+
+# What a hint can be, besides a dict with the next push:
+NO_SOLUTION = 'no solution'  # the level can't be solved from this position any more
+GAVE_UP = 'gave up'  # the solver ran out of time or nodes before it could tell
+
+
+def get_position_key(level_grid, state):
+    """Returns the key hints are kept by for the GameState: (stars, lowest numbered space the
+    player can walk to)."""
+    return (state.stars, min(find_reachable(level_grid, state.player, state.stars)))
+
+
+class HintFinder(object):
+    """Finds hints for the positions of one level on a background thread.
+
+    A hint is a dict with 'star' (the (x, y) of the star to push next), 'direction' (the
+    direction to push it) and 'pushes' (how many pushes are left to solve the level), or
+    NO_SOLUTION or GAVE_UP. Positions are the GameStates from the level's LevelGrid."""
+
+    def __init__(self, level_grid, db_filename=SOLUTION_DB_FILENAME):
+        self.level_grid = level_grid
+        self.db_filename = db_filename
+        self.lock = threading.Lock()  # held while using hints, cancel_event and searching_for
+        self.hints = {}  # position key -> hint, for every position a hint is known for
+        self.cancel_event = None  # the threading.Event of the search that is running, if any
+        self.searching_for = None  # the position key that search is for
+        self.last_key = (None, None)  # the last (GameState, key) from get_key()
+
+    def get_key(self, state):
+        """Returns get_position_key() for the GameState, remembering the last one since the
+        game asks for the same position every frame. Only the game's thread uses this."""
+        if self.last_key[0] != state:
+            self.last_key = (state, get_position_key(self.level_grid, state))
+        return self.last_key[1]
+
+    def get_hint(self, state):
+        """Returns the hint for the GameState, or None if it isn't known (yet)."""
+        key = self.get_key(state)
+        with self.lock:
+            return self.hints.get(key)
+
+    def is_searching(self):
+        """Returns True if a search is running."""
+        with self.lock:
+            return self.searching_for is not None
+
+    def start(self, state):
+        """Starts looking for the hint for the GameState, unless it is already known or being
+        looked for. Returns the hint if it is already known, otherwise None."""
+        key = self.get_key(state)
+        with self.lock:
+            if key in self.hints:
+                return self.hints[key]
+            if key == self.searching_for:
+                return None  # the search for it is already running
+
+        self.cancel()
+        cancel_event = threading.Event()
+        with self.lock:
+            self.cancel_event = cancel_event
+            self.searching_for = key
+        thread = threading.Thread(target=self.search, args=(state, cancel_event))
+        thread.daemon = True  # don't keep the program running just for a search
+        thread.start()
+        return None
+
+    def cancel(self):
+        """Stops the search that is running, if there is one. This doesn't wait for the thread
+        to finish, it only tells it to stop."""
+        with self.lock:
+            if self.cancel_event is not None:
+                self.cancel_event.set()
+            self.cancel_event = None
+            self.searching_for = None
+
+    def search(self, state, cancel_event):
+        """Runs on the background thread: solves the level from the GameState and saves the
+        hints it finds, unless the search is cancelled first."""
+        level_grid = self.level_grid
+        level_obj = level_grid.level_obj
+        game_state_obj = level_grid.to_game_state_obj(state)
+        # SQLite connections can only be used on the thread that made them.
+        db = SolutionDB(self.db_filename)
+        try:
+            result = solve_cached(db, level_obj, game_state_obj, HINT_MAX_NODES, HINT_TIME_LIMIT,
+                                  cancel_event=cancel_event)
+        finally:
+            db.close()
+        if cancel_event.is_set():
+            return
+
+        if result['solved']:
+            hints = self.get_solution_hints(state, result['solution'])
+        elif result['solved'] is False:
+            hints = {get_position_key(self.level_grid, state): NO_SOLUTION}
+        else:
+            hints = {get_position_key(self.level_grid, state): GAVE_UP}
+        with self.lock:
+            for key, hint in hints.items():
+                self.hints.setdefault(key, hint)
+            if self.cancel_event is cancel_event:
+                self.cancel_event = None
+                self.searching_for = None
+
+    def get_solution_hints(self, state, solution):
+        """Returns a dict of position key -> hint for every position along the solution (a list
+        of directions) from the GameState. Going backwards from the end, each push becomes the
+        hint for itself and for the moves walking up to it."""
+        level_grid = self.level_grid
+        hints = {}
+        moves = []
+        for direction in solution:
+            new_state = level_grid.move(state, direction)
+            moves.append((state, new_state, direction))
+            state = new_state
+
+        hint = None
+        pushes = 0
+        for state, new_state, direction in reversed(moves):
+            if new_state.stars != state.stars:
+                # The player moves onto the space the pushed star was on.
+                pushes += 1
+                hint = {'star': level_grid.xy(new_state.player),
+                        'direction': direction,
+                        'pushes': pushes}
+            hints.setdefault(get_position_key(level_grid, state), hint)
+        return hints
@@ -0,0 +1,132 @@
+# Star Pusher frame profiler
+# Measures how long each part of every frame takes, for the profiling HUD and log.
+#
+# run_level() marks the end of each part of a frame as it goes, and the time since the last mark
+# is added to that part. The parts are:
+#   events - handling the keyboard and window events
+#   logic  - moving the player, undo/redo, the camera, the hint and deciding what to redraw
+#   map    - redrawing the tiles with draw_map_area()
+#   blit   - drawing the text, hint arrow, "Solved!" image and the HUD on top of the map
+#   update - pygame.display.update()
+#   wait   - waiting in FPS_CLOCK.tick() for the next frame
+# The last PROFILE_WINDOW frames are kept to work out percentiles. Each frame also counts how
+# many times draw_map_area() ran, and whether it redrew the whole window, part of it, or nothing.
+#
+# When logging is on, each frame is written as a line of the CSV log file, so a slow frame can be
+# found afterwards.
+
+import collections, time
+
+PROFILE_WINDOW = 300  # how many of the latest frames the percentiles are worked out from
+PROFILE_LOG_FILENAME = 'starPusherProfile.csv'
+
+PHASES = ('events', 'logic', 'map', 'blit', 'update', 'wait')
+PERCENTILES = (50, 95, 99)
+
+# How much of the window a frame redrew:
+FULL_REDRAW = 'full'
+PARTIAL_REDRAW = 'partial'
+NO_REDRAW = 'none'
+REDRAW_KINDS = (FULL_REDRAW, PARTIAL_REDRAW, NO_REDRAW)
+
+
+def get_percentile(sorted_values, percent):
+    """Returns the nearest-rank percentile of the sorted list of numbers."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(percent / 100.0 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+class FrameProfiler(object):
+    """Keeps the timing of the latest frames. If enabled is False, mark() and end_frame() do
+    nothing, so the game loop can call them all the time."""
+
+    def __init__(self, enabled=False, log_filename=None):
+        self.enabled = enabled
+        self.frames = collections.deque(maxlen=PROFILE_WINDOW)
+        self.frame_count = 0
+        self.map_draw_total = 0  # how many times draw_map_area() ran, in every frame so far
+        self.log_file = None
+        if log_filename is not None:
+            self.log_file = open(log_filename, 'w')
+            self.log_file.write('frame,%s,total,map_draws,redraw\n' % (','.join(PHASES)))
+        self.start_frame()
+
+    def start_frame(self):
+        self.current = dict((phase, 0.0) for phase in PHASES)
+        self.map_draws = 0
+        self.last_mark = time.perf_counter()
+
+    def mark(self, phase):
+        """Adds the time since the last mark to the phase of this frame."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.current[phase] += now - self.last_mark
+        self.last_mark = now
+
+    def count_map_draw(self):
+        """Counts one call to draw_map_area() in this frame."""
+        self.map_draws += 1
+
+    def end_frame(self, redraw):
+        """Finishes this frame, which redrew FULL_REDRAW, PARTIAL_REDRAW or NO_REDRAW of the
+        window, and starts the next one."""
+        if self.enabled:
+            self.frame_count += 1
+            total = sum(self.current.values())
+            frame = (self.current, total, self.map_draws, redraw)
+            self.frames.append(frame)
+            self.map_draw_total += self.map_draws
+            if self.log_file is not None:
+                self.log_file.write('%s,%s,%.3f,%s,%s\n' % (
+                    self.frame_count,
+                    ','.join('%.3f' % (self.current[phase] * 1000) for phase in PHASES),
+                    total * 1000, self.map_draws, redraw))
+        self.start_frame()
+
+    def get_stats(self):
+        """Returns a dict with the statistics of the frames in the window:
+            'frames'  - how many frames the statistics are for.
+            'phases'  - a dict of phase (and 'total') -> dict of percentile -> milliseconds, with
+                        'max' -> milliseconds as well.
+            'redraws' - a dict of redraw kind -> how many frames redrew that much.
+            'map_draws' - how many times draw_map_area() ran in those frames."""
+        stats = {'frames': len(self.frames), 'phases': {},
+                 'redraws': dict((kind, 0) for kind in REDRAW_KINDS), 'map_draws': 0}
+        for phase in PHASES + ('total',):
+            if phase == 'total':
+                values = sorted(total for times, total, map_draws, redraw in self.frames)
+            else:
+                values = sorted(times[phase] for times, total, map_draws, redraw in self.frames)
+            phase_stats = dict((percent, get_percentile(values, percent) * 1000)
+                               for percent in PERCENTILES)
+            phase_stats['max'] = values[-1] * 1000 if values else 0.0
+            stats['phases'][phase] = phase_stats
+        for times, total, map_draws, redraw in self.frames:
+            stats['redraws'][redraw] += 1
+            stats['map_draws'] += map_draws
+        return stats
+
+    def get_report(self):
+        """Returns the statistics for the HUD, as (rows, notes). rows is a table (a list of lists
+        of strings) with a heading row and then the milliseconds of each phase, and notes is a
+        list of lines of text about the redraws."""
+        stats = self.get_stats()
+        rows = [['ms'] + ['p%s' % (percent) for percent in PERCENTILES] + ['max']]
+        for phase in PHASES + ('total',):
+            phase_stats = stats['phases'][phase]
+            rows.append([phase] + ['%.2f' % (phase_stats[percent]) for percent in PERCENTILES] +
+                        ['%.2f' % (phase_stats['max'])])
+        notes = ['last %s frames: %s full, %s partial, %s idle' % (
+                     stats['frames'], stats['redraws'][FULL_REDRAW],
+                     stats['redraws'][PARTIAL_REDRAW], stats['redraws'][NO_REDRAW]),
+                 'map draws: %s recent, %s in %s frames' % (
+                     stats['map_draws'], self.map_draw_total, self.frame_count)]
+        return rows, notes
+
+    def close(self):
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
@@ -3,9 +3,22 @@
 # http://inventwithpython.com/pygame
 # Creative Commons BY-NC-SA 3.0 US
 
-import random, sys, copy, os, pygame
+import sys, time, pygame
 from pygame.locals import *
 
+import level_pack, star_assets
+from star_state import LevelGrid, MoveHistory
+from star_hints import HintFinder, NO_SOLUTION, GAVE_UP
+from star_profile import FrameProfiler, PROFILE_LOG_FILENAME, FULL_REDRAW, PARTIAL_REDRAW, \
+    NO_REDRAW
+# The game rules and level reading are in star_engine.py. They are imported here so that
+# star_pusher.make_move() and the rest still work for code written before they moved there.
+from star_engine import UP, DOWN, LEFT, RIGHT, DIRECTION_TO_LURD, LURD_TO_DIRECTION, \
+    LEVELS_FILENAME, REPLAY_FILENAME, LEVEL_CACHE_SIZE, OUTSIDE_DECORATION_PCT, is_wall, \
+    is_blocked, make_move, is_level_finished, get_delta_lurd, save_replay, decorate_map, \
+    compute_inside_mask, get_inside_mask, flood_fill, load_levels, read_levels_file, \
+    parse_level, LevelCollection
+
 FPS = 30  # frames per second to update the screen
 WIN_WIDTH = 800  # width of the program's window, in pixels
 WIN_HEIGHT = 600  # height in pixels
@@ -16,29 +29,33 @@ HALF_WIN_HEIGHT = int(WIN_HEIGHT / 2)
 TILE_WIDTH = 50
 TILE_HEIGHT = 85
 TILE_FLOOR_HEIGHT = 45
+# Each row of tiles is drawn this many pixels below the one above it, so a tile overlaps the tiles
+# in the OVERLAP_ROWS rows above and below it.
+TILE_ROW_HEIGHT = TILE_HEIGHT - TILE_FLOOR_HEIGHT
+OVERLAP_ROWS = (TILE_HEIGHT - 1) // TILE_ROW_HEIGHT
 
 CAM_MOVE_SPEED = 5  # how many pixels per frame the camera moves
 
-# The percentage of outdoor tiles that have additional decoration on them, such
-# as a tree or rock.
-OUTSIDE_DECORATION_PCT = 20
-
 BRIGHT_BLUE = (0, 170, 255)
 WHITE = (255, 255, 255)
+YELLOW = (255, 255, 0)
+BLACK = (0, 0, 0)
 BG_COLOR = BRIGHT_BLUE
 TEXT_COLOR = WHITE
+HINT_COLOR = YELLOW
+HUD_COLOR = WHITE
+HUD_BG_COLOR = (0, 0, 0, 180)  # the see-through black behind the profiling HUD
 
-UP = 'up'
-DOWN = 'down'
-LEFT = 'left'
-RIGHT = 'right'
+HUD_REFRESH_SECONDS = 0.5  # how often the profiling HUD's numbers are remade
 
 
 def main():
-    global FPS_CLOCK, DISPLAY_SURF, IMAGE_DICT, TILE_MAPPING, OUTSIDE_DECO_MAPPING, BASIC_FONT, \
-        PLAYER_IMAGES, current_image
+    global FPS_CLOCK, DISPLAY_SURF, BASIC_FONT, HUD_FONT, PROFILER
 
-    # Pygame initialization and basic set up of the global variables.
+    # Pygame initialization and basic set up of the global variables. How long each part of
+    # starting up takes is added to startup_times, and shown if the game is run with --timing.
+    startup_times = []
+    phase_start = time.perf_counter()
     pygame.init()
     FPS_CLOCK = pygame.time.Clock()
 
@@ -49,62 +66,49 @@ def main():
 
     pygame.display.set_caption('Star Pusher')
     BASIC_FONT = pygame.font.Font('freesansbold.ttf', 36)
+    HUD_FONT = pygame.font.SysFont('couriernew,dejavusansmono,monospace', 14)
 
-    # A global dict value that will contain all the Pygame Surface objects
-    # returned by pygame.image.load()
-    IMAGE_DICT = {'uncovered goal': pygame.image.load('RedSelector.png'),
-                  'covered goal': pygame.image.load('Selector.png'),
-                  'star': pygame.image.load('Star.png'),
-                  'corner': pygame.image.load('Wall_Block_Tall.png'),
-                  'wall': pygame.image.load('Wood_Block_Tall.png'),
-                  'inside floor': pygame.image.load('Plain_Block.png'),
-                  'outside floor': pygame.image.load('Grass_Block.png'),
-                  'title': pygame.image.load('star_title.png'),
-                  'solved': pygame.image.load('star_solved.png'),
-                  'princess': pygame.image.load('princess.png'),
-                  'boy': pygame.image.load('boy.png'),
-                  'catgirl': pygame.image.load('catgirl.png'),
-                  'horngirl': pygame.image.load('horngirl.png'),
-                  'pinkgirl': pygame.image.load('pinkgirl.png'),
-                  'rock': pygame.image.load('Rock.png'),
-                  'short tree': pygame.image.load('Tree_Short.png'),
-                  'tall tree': pygame.image.load('Tree_Tall.png'),
-                  'ugly tree': pygame.image.load('Tree_Ugly.png')}
-
-    # These dict values are global, and map the character that appears in the
-    # level file to the surface object it represents
-    TILE_MAPPING = {'x': IMAGE_DICT['corner'],
-                    '#': IMAGE_DICT['wall'],
-                    'o': IMAGE_DICT['inside floor'],
-                    ' ': IMAGE_DICT['outside floor']}
-    OUTSIDE_DECO_MAPPING = {'1': IMAGE_DICT['rock'],
-                            '2': IMAGE_DICT['short tree'],
-                            '3': IMAGE_DICT['tall tree'],
-                            '4': IMAGE_DICT['ugly tree']}
+    # The profiling HUD (see star_profile.py) is shown with F3, or from the start if the game is
+    # run with --profile, which also logs the timing of every frame to PROFILE_LOG_FILENAME.
+    if '--profile' in sys.argv[1:]:
+        PROFILER = FrameProfiler(True, PROFILE_LOG_FILENAME)
+    else:
+        PROFILER = FrameProfiler()
+    startup_times.append(('pygame and window', time.perf_counter() - phase_start))
+    phase_start = time.perf_counter()
 
-    # PLAYER_IMAGES is a list of all possible characters that player can be.
-    # current_image is the index of the player's current player image.
-    current_image = 0
-    PLAYER_IMAGES = [IMAGE_DICT['princess'],
-                     IMAGE_DICT['boy'],
-                     IMAGE_DICT['catgirl'],
-                     IMAGE_DICT['horngirl'],
-                     IMAGE_DICT['pinkgirl']]
+    image_timing = set_up_images()
+    startup_times.append(('images (%s)' % ('from atlas cache' if image_timing['cached']
+                                           else 'decoded PNGs, atlas cache written'),
+                          time.perf_counter() - phase_start))
 
     start_screen()  # show the title screen until the user presses a key
 
     # Read in the levels from the text file. See the read_levels_file() for
     # details on the format of this file and how to make your own levels.
-    levels = read_levels_file('starPusherLevels.txt')
+    phase_start = time.perf_counter()
+    levels = load_levels(LEVELS_FILENAME)
+    if isinstance(levels, level_pack.LevelPack):
+        levels_hash = levels.digest.hex()  # the pack's header already has the file's hash
+    else:
+        levels_hash = level_pack.hash_file(LEVELS_FILENAME).hex()
+    startup_times.append(('levels', time.perf_counter() - phase_start))
+    if '--timing' in sys.argv[1:]:
+        print_startup_report(startup_times)
     current_level_index = 0
 
     # The main game loop. This loop runs a single level, when the user finishes
     # that level, the next/previous level is loaded.
     while True:  # main game loop
         # Run the level to actually start playing the game:
-        result = run_level(levels, current_level_index)
-
-        if result in ('solved', 'next'):
+        replay_moves = []
+        result = run_level(levels, current_level_index, replay_moves)
+        if len(replay_moves) > 0:
+            save_replay(REPLAY_FILENAME, levels_hash, current_level_index, ''.join(replay_moves))
+
+        if result == 'quit':
+            terminate()  # the replay of the level being played is saved first
+        elif result in ('solved', 'next'):
             # Go to the next level.
             current_level_index += 1
             if current_level_index >= len(levels):
@@ -120,21 +124,94 @@ def main():
             pass  # Do nothing. Loop re-calls run_level() to reset the level
 
 
-def run_level(levels, level_num):
+def set_up_images():
+    """Loads the images and sets up the global variables that draw_tile() uses to draw them.
+    Returns the timing dict from star_assets.load_images(). The window must already be made."""
+    global IMAGE_DICT, TILE_MAPPING, OUTSIDE_DECO_MAPPING, PLAYER_IMAGES, current_image
+
+    # A global dict value that will contain all the Pygame Surface objects for the images. They
+    # are all parts of one atlas image that is already converted to the window's pixel format,
+    # which is loaded from a cache file after the first run (see star_assets.py).
+    IMAGE_DICT, image_timing = star_assets.load_images()
+
+    # These dict values are global, and map the character that appears in the
+    # level file to the surface object it represents
+    TILE_MAPPING = {'x': IMAGE_DICT['corner'],
+                    '#': IMAGE_DICT['wall'],
+                    'o': IMAGE_DICT['inside floor'],
+                    ' ': IMAGE_DICT['outside floor']}
+    OUTSIDE_DECO_MAPPING = {'1': IMAGE_DICT['rock'],
+                            '2': IMAGE_DICT['short tree'],
+                            '3': IMAGE_DICT['tall tree'],
+                            '4': IMAGE_DICT['ugly tree']}
+
+    # PLAYER_IMAGES is a list of all possible characters that player can be.
+    # current_image is the index of the player's current player image.
+    current_image = 0
+    PLAYER_IMAGES = [IMAGE_DICT['princess'],
+                     IMAGE_DICT['boy'],
+                     IMAGE_DICT['catgirl'],
+                     IMAGE_DICT['horngirl'],
+                     IMAGE_DICT['pinkgirl']]
+    return image_timing
+
+
+def print_startup_report(startup_times):
+    """Prints how long each part of starting up took. (The time spent on the title screen isn't
+    counted.)"""
+    print('Star Pusher startup times:')
+    for label, seconds in startup_times:
+        print('  %-45s %8.1f ms' % (label, seconds * 1000))
+    print('  %-45s %8.1f ms' % ('total', sum(seconds for label, seconds in startup_times) * 1000))
+
+
+def run_level(levels, level_num, replay_moves=None):
+    """Plays the level until the player solves it or leaves it, and returns 'solved', 'next',
+    'back', 'reset' or 'quit'. If replay_moves is a list, the LURD letter of each move is added
+    to it (and removed again if the move is undone)."""
     global current_image
+    if replay_moves is None:
+        replay_moves = []
     level_obj = levels[level_num]
-    map_obj = decorate_map(level_obj['map_obj'], level_obj['start_state']['player'])
-    game_state_obj = copy.deepcopy(level_obj['start_state'])
-    map_needs_redraw = True  # set to True to call draw_map()
+    map_obj = decorate_map(level_obj['map_obj'], level_obj['start_state']['player'],
+                           get_inside_mask(level_obj))
+    # The game state is kept as an immutable GameState (see star_state.py), so moving doesn't
+    # need to search a list of stars and resetting doesn't need to copy anything. game_state_obj
+    # is a dict view of it for draw_map_area().
+    level_grid = LevelGrid(level_obj)
+    game_state = level_grid.start_state()
+    game_state_obj = level_grid.to_game_state_obj(game_state)
+    history = MoveHistory()  # the moves the player can undo and redo
+    # Hints are found on a background thread (see star_hints.py), so the game keeps running
+    # while the solver searches.
+    hint_finder = HintFinder(level_grid)
+    hint_state = None  # the GameState the player asked for a hint for, or None
+    hint_drawn = (None, None)  # the hint text and (star xy, direction) arrow being shown
+    hint_surf = None
+    # The map is drawn straight onto the window, and only the tiles inside the window are drawn,
+    # so even a huge level doesn't need a Surface any bigger than the window. The walls, floors,
+    # decorations and goals never change during a level, so they are drawn once onto a
+    # window-sized background (and again only when the camera moves). After the first frame,
+    # only the tiles that change are redrawn, copied from the background with just the stars
+    # and player drawn over it.
+    background = None  # see draw_map_background()
+    background_topleft = None  # where the map's top left corner was when background was drawn
+    dirty_tiles = set()  # (x, y) of the tiles that need to be redrawn this frame
+    screen_needs_redraw = True  # set to True to redraw and update the entire window
+    step_surf = None
     level_surf = BASIC_FONT.render('Level %s of %s' % (level_num + 1, len(levels)),
                                    1, TEXT_COLOR)
     level_rect = level_surf.get_rect()
     level_rect.bottomleft = (20, WIN_HEIGHT - 35)
+    window_rect = DISPLAY_SURF.get_rect()
     map_width = len(map_obj) * TILE_WIDTH
     map_height = (len(map_obj[0]) - 1) * TILE_FLOOR_HEIGHT + TILE_HEIGHT
     MAX_CAM_X_PAN = abs(HALF_WIN_HEIGHT - int(map_height / 2)) + TILE_WIDTH
     MAX_CAM_Y_PAN = abs(HALF_WIN_WIDTH - int(map_width / 2)) + TILE_HEIGHT
 
+    hud_surf = None  # the profiling HUD, if it is shown
+    hud_time = 0  # when the HUD was last remade
+
     level_is_complete = False
     # Track how much the camera has moved:
     camera_offset_x = 0
@@ -145,15 +222,18 @@ def run_level(levels, level_num):
     camera_left = False
     camera_right = False
 
+    PROFILER.start_frame()  # don't count setting up the level as part of the first frame
     while True:  # main game loop
         # Reset these variables:
         player_move_to = None
+        history_move = None  # set to 'undo' or 'redo'
         key_pressed = False
 
         for event in pygame.event.get():  # event handling loop
             if event.type == QUIT:
                 # Player clicked the "X" at the corer of the window.
-                terminate()
+                hint_finder.cancel()
+                return 'quit'
 
             elif event.type == KEYDOWN:
                 # Handle key presses
@@ -178,21 +258,36 @@ def run_level(levels, level_num):
                     camera_down = True
 
                 elif event.key == K_n:
+                    hint_finder.cancel()
                     return 'next'
                 elif event.key == K_b:
+                    hint_finder.cancel()
                     return 'back'
 
                 elif event.key == K_ESCAPE:
-                    terminate()
+                    hint_finder.cancel()
+                    return 'quit'
                 elif event.key == K_BACKSPACE:
+                    hint_finder.cancel()
                     return 'reset'
+                elif event.key == K_u:
+                    history_move = 'undo'
+                elif event.key == K_r:
+                    history_move = 'redo'
+                elif event.key == K_h and not level_is_complete:
+                    # Show a hint for this position, starting a search for it if needed.
+                    hint_state = game_state
+                    hint_finder.start(game_state)
                 elif event.key == K_p:
                     # Change the player image to the next one.
                     current_image += 1
                     if current_image >= len(PLAYER_IMAGES):
                         # After the last player image, use the first one.
                         current_image = 0
-                    map_needs_redraw = True
+                    dirty_tiles.add(game_state_obj['player'])
+                elif event.key == K_F3:
+                    # Show or hide the profiling HUD.
+                    PROFILER.enabled = not PROFILER.enabled
 
             elif event.type == KEYUP:
                 # Unset the camera move mode.
@@ -205,171 +300,257 @@ def run_level(levels, level_num):
                 elif event.key == K_s:
                     camera_down = False
 
+            elif event.type == VIDEOEXPOSE:
+                # The window was covered up or resized, so all of it has to be drawn again.
+                screen_needs_redraw = True
+        PROFILER.mark('events')
+
         if player_move_to != None and not level_is_complete:
             # If the player pushed a key to move, make the move (if possible)
             # and push any stars that are pushable.
-            moved = make_move(map_obj, game_state_obj, player_move_to)
+            new_game_state = level_grid.move(game_state, player_move_to)
 
-            if moved:
+            if new_game_state is not None:
+                delta = level_grid.get_delta(game_state, new_game_state)
+                history.record(delta)
+                replay_moves.append(get_delta_lurd(level_grid, delta))
                 # increment the step counter.
-                game_state_obj['step_counter'] += 1
-                map_needs_redraw = True
+                game_state = new_game_state
+                game_state_obj = level_grid.to_game_state_obj(game_state,
+                                                              game_state_obj['step_counter'] + 1)
+                add_delta_tiles(level_grid, delta, dirty_tiles)
 
-            if is_level_finished(level_obj, game_state_obj):
+            if level_grid.is_solved(game_state):
                 # level is solved, we should show the "Solved!" image.
                 level_is_complete = True
                 key_pressed = False
-
-        DISPLAY_SURF.fill(BG_COLOR)
-
-        if map_needs_redraw:
-            map_surf = draw_map(map_obj, game_state_obj, level_obj['goals'])
-            map_needs_redraw = False
+                screen_needs_redraw = True
+
+        elif history_move is not None and not level_is_complete:
+            # Undo or redo a move. Undoing takes a step off the step counter.
+            if history_move == 'undo':
+                delta = history.undo()
+                if delta is not None:
+                    game_state = level_grid.undo_delta(game_state, delta)
+                    replay_moves.pop()
+                    step_change = -1
+            else:
+                delta = history.redo()
+                if delta is not None:
+                    game_state = level_grid.apply_delta(game_state, delta)
+                    replay_moves.append(get_delta_lurd(level_grid, delta))
+                    step_change = 1
+            if delta is not None:
+                game_state_obj = level_grid.to_game_state_obj(
+                    game_state, game_state_obj['step_counter'] + step_change)
+                add_delta_tiles(level_grid, delta, dirty_tiles)
+
+            if level_grid.is_solved(game_state):
+                level_is_complete = True
+                key_pressed = False
+                screen_needs_redraw = True
 
         if camera_up and camera_offset_y < MAX_CAM_X_PAN:
             camera_offset_y += CAM_MOVE_SPEED
+            screen_needs_redraw = True
         elif camera_down and camera_offset_y > -MAX_CAM_X_PAN:
             camera_offset_y -= CAM_MOVE_SPEED
+            screen_needs_redraw = True
         if camera_left and camera_offset_x < MAX_CAM_Y_PAN:
             camera_offset_x += CAM_MOVE_SPEED
+            screen_needs_redraw = True
         elif camera_right and camera_offset_x > -MAX_CAM_Y_PAN:
             camera_offset_x -= CAM_MOVE_SPEED
+            screen_needs_redraw = True
+
+        # dirty_rects will hold the parts of the window that have changed this frame.
+        dirty_rects = []
+
+        # Find where the map is in the window, based on the camera offset.
+        map_rect = get_map_rect(map_obj, camera_offset_x, camera_offset_y)
+        if map_rect.topleft != background_topleft:
+            # The camera moved (or the level just started), so the background has to be drawn
+            # again. Moving the camera always redraws the whole window anyway.
+            background = draw_map_background(map_obj, level_obj['goals'], map_rect.topleft)
+            background_topleft = map_rect.topleft
+
+        if hint_state is not None and (hint_state.stars != game_state.stars or
+                                       level_is_complete):
+            # A star moved, so the hint (or the search for it) is for the wrong position.
+            # Walking around doesn't change the next push, so the hint stays up for that.
+            hint_finder.cancel()
+            hint_state = None
+        hint_wanted = get_hint_display(hint_finder, hint_state)
+        if hint_wanted != hint_drawn:
+            # Redraw where the old hint was and where the new one goes.
+            for hint_text, hint_arrow in (hint_drawn, hint_wanted):
+                if hint_arrow is not None:
+                    dirty_tiles.add(hint_arrow[0])
+            if hint_surf is not None:
+                dirty_rects.append(hint_rect)
+            hint_drawn = hint_wanted
+            hint_surf = None
+            if hint_drawn[0] is not None:
+                hint_surf = BASIC_FONT.render(hint_drawn[0], 1, HINT_COLOR)
+                hint_rect = hint_surf.get_rect()
+                hint_rect.topleft = (20, 10)
+                dirty_rects.append(hint_rect)
+
+        if dirty_tiles:
+            # Only redraw the tiles that changed, and only update those parts of the window.
+            for x, y in dirty_tiles:
+                tile_rect = get_tile_rect(x, y, map_rect.topleft).clip(window_rect)
+                if tile_rect.width > 0 and tile_rect.height > 0:  # skip tiles off the window
+                    dirty_rects.append(tile_rect)
+            dirty_tiles.clear()
+
+        if step_surf is None or game_state_obj['step_counter'] != step_count_drawn:
+            # The step count text only has to be made again when the step count changes.
+            if step_surf is not None:
+                dirty_rects.append(step_rect)  # erase the old text
+            step_count_drawn = game_state_obj['step_counter']
+            step_surf = BASIC_FONT.render('Steps: %s' % (step_count_drawn), 1, TEXT_COLOR)
+            step_rect = step_surf.get_rect()
+            step_rect.bottomleft = (20, WIN_HEIGHT - 10)
+            dirty_rects.append(step_rect)
+
+        if PROFILER.enabled and time.perf_counter() - hud_time >= HUD_REFRESH_SECONDS:
+            # The HUD is only remade a couple of times a second, since remaking it every frame
+            # would mean redrawing part of the window every frame.
+            if hud_surf is not None:
+                dirty_rects.append(hud_rect)
+            hud_surf = make_profile_hud(*PROFILER.get_report())
+            hud_rect = hud_surf.get_rect()
+            hud_rect.topright = (WIN_WIDTH - 10, 10)
+            dirty_rects.append(hud_rect)
+            hud_time = time.perf_counter()
+        elif not PROFILER.enabled and hud_surf is not None:
+            dirty_rects.append(hud_rect)  # erase the HUD
+            hud_surf = None
+
+        if screen_needs_redraw:
+            dirty_rects = [window_rect]
+            screen_needs_redraw = False
+            redraw = FULL_REDRAW
+        elif dirty_rects:
+            redraw = PARTIAL_REDRAW
+        else:
+            redraw = NO_REDRAW
+        PROFILER.mark('logic')
+
+        # Draw everything in the parts of DISPLAY_SURF that changed. Setting the clip area
+        # makes Pygame skip drawing anything outside of it.
+        for rect in dirty_rects:
+            # Draw the tiles under this part of the window to the DISPLAY_SURF Surface object.
+            draw_map_over_background(DISPLAY_SURF, background, map_obj, game_state_obj,
+                                     level_obj['goals'], map_rect.topleft, rect)
+            PROFILER.count_map_draw()
+            PROFILER.mark('map')
+
+            DISPLAY_SURF.set_clip(rect)
+            if hint_drawn[1] is not None:
+                star_xy, direction = hint_drawn[1]
+                draw_hint_arrow(DISPLAY_SURF, get_tile_rect(star_xy[0], star_xy[1],
+                                                            map_rect.topleft), direction)
+            if hint_surf is not None:
+                DISPLAY_SURF.blit(hint_surf, hint_rect)
+            DISPLAY_SURF.blit(level_surf, level_rect)
+            DISPLAY_SURF.blit(step_surf, step_rect)
+
+            if level_is_complete:
+                # is solved, show the "Solved!" image until the player has pressed a key.
+                solved_rect = IMAGE_DICT['solved'].get_rect()
+                solved_rect.center = (HALF_WIN_WIDTH, HALF_WIN_HEIGHT)
+                DISPLAY_SURF.blit(IMAGE_DICT['solved'], solved_rect)
+            if hud_surf is not None:
+                DISPLAY_SURF.blit(hud_surf, hud_rect)
+            PROFILER.mark('blit')
+        DISPLAY_SURF.set_clip(None)
+
+        if level_is_complete and key_pressed:
+            hint_finder.cancel()
+            return 'solved'
+
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
+        PROFILER.mark('update')
+        # Waiting for the next frame lets the hint search run while the game has nothing to do.
+        FPS_CLOCK.tick(FPS)
+        PROFILER.mark('wait')
+        PROFILER.end_frame(redraw)
+
+
+def make_profile_hud(rows, notes):
+    """Returns a Surface with the profiler's report (from FrameProfiler.get_report()) on a
+    see-through background. The table's columns are lined up by their drawn widths, since the
+    HUD font might not be a monospace one."""
+    row_surfs = [[HUD_FONT.render(cell, 1, HUD_COLOR) for cell in row] for row in rows]
+    note_surfs = [HUD_FONT.render(note, 1, HUD_COLOR) for note in notes]
+    column_widths = [max(row[i].get_width() for row in row_surfs) + 12
+                     for i in range(len(row_surfs[0]))]
+    line_height = HUD_FONT.get_linesize()
+    hud_width = max([sum(column_widths)] + [note_surf.get_width() for note_surf in note_surfs])
+    hud_surf = pygame.Surface((hud_width + 10, line_height * (len(rows) + len(notes)) + 10),
+                              SRCALPHA)
+    hud_surf.fill(HUD_BG_COLOR)
+    top = 5
+    for row in row_surfs:
+        # The first column is the phase name, lined up on the left, and the numbers are lined
+        # up on the right.
+        hud_surf.blit(row[0], (5, top))
+        right = 5 + column_widths[0]
+        for i in range(1, len(row)):
+            right += column_widths[i]
+            hud_surf.blit(row[i], (right - row[i].get_width(), top))
+        top += line_height
+    for note_surf in note_surfs:
+        hud_surf.blit(note_surf, (5, top))
+        top += line_height
+    return hud_surf
+
+
+def get_hint_display(hint_finder, hint_state):
+    """Returns the (text, arrow) to show for the hint for hint_state, where arrow is the
+    (star xy, direction) of the push to point at, or None. Both are None if there is no hint to
+    show."""
+    if hint_state is None:
+        return (None, None)
+    hint = hint_finder.get_hint(hint_state)
+    if hint is None:
+        return ('Hint: thinking...', None)
+    elif hint == NO_SOLUTION:
+        return ('Hint: no solution from here', None)
+    elif hint == GAVE_UP:
+        return ('Hint: none found in time', None)
+    return ('Hint: push %s, %s to go' % (hint['direction'], hint['pushes']),
+            (hint['star'], hint['direction']))
+
+
+def draw_hint_arrow(surf, tile_rect, direction):
+    """Draws an arrow on the tile pointing the way the star on it should be pushed."""
+    center_x = tile_rect.centerx
+    center_y = tile_rect.top + TILE_ROW_HEIGHT  # about the middle of the top of the tile
+    size = 14
+    # The arrow's tip, and the two corners at its back, pointing right.
+    points = [(size, 0), (-size, -size), (-size, size)]
+    if direction == LEFT:
+        points = [(-x, y) for x, y in points]
+    elif direction == UP:
+        points = [(y, -x) for x, y in points]
+    elif direction == DOWN:
+        points = [(y, x) for x, y in points]
+    points = [(center_x + x, center_y + y) for x, y in points]
+    pygame.draw.polygon(surf, HINT_COLOR, points)
+    pygame.draw.polygon(surf, BLACK, points, 2)
+
+
+def add_delta_tiles(level_grid, delta, tiles):
+    """Adds the (x, y) of the tiles changed by a move delta (the player's old and new tiles, and
+    a pushed star's old and new tiles) to the tiles set."""
+    for cell in delta:
+        if cell is not None:
+            tiles.add(level_grid.xy(cell))
 
-        # Adjust map_surf's Rect object based on the camera offset.
-        map_surf_rect = map_surf.get_rect()
-        map_surf_rect.center = (HALF_WIN_WIDTH + camera_offset_x, HALF_WIN_HEIGHT + camera_offset_y)
-
-        # Draw map_surf to the DISPLAY_SURF Surface object.
-        DISPLAY_SURF.blit(map_surf, map_surf_rect)
-
-        DISPLAY_SURF.blit(level_surf, level_rect)
-        step_surf = BASIC_FONT.render('Steps: %s' % (game_state_obj['step_counter']), 1, TEXT_COLOR)
-        step_rect = step_surf.get_rect()
-        step_rect.bottomleft = (20, WIN_HEIGHT - 10)
-        DISPLAY_SURF.blit(step_surf, step_rect)
-
-        if level_is_complete:
-            # is solved, show the "Solved!" image until the player has pressed a key.
-            solved_rect = IMAGE_DICT['solved'].get_rect()
-            solved_rect.center = (HALF_WIN_WIDTH, HALF_WIN_HEIGHT)
-            DISPLAY_SURF.blit(IMAGE_DICT['solved'], solved_rect)
-
-            if key_pressed:
-                return 'solved'
-
-        pygame.display.update()
-        FPS_CLOCK.tick()
-
-
-def is_wall(map_obj, x, y):
-    """Returns True if the (x, y) position on the map is a wall, otherwise return False."""
-    if x < 0 or x >= len(map_obj) or y < 0 or y >= len(map_obj[x]):
-        return False  # x and y aren't actually on the map.
-    elif map_obj[x][y] in ('#', 'x'):
-        return True  # wall is blocking
-    return False
-
-
-def decorate_map(map_obj, startxy):
-    """Makes a copy of the given map object and modifies it.
-    Here is what is done to it:
-        * Walls that are corners are turned into corner pieces.
-        * The outside/inside floor tile distinction is make.
-        * Tree/rock decorations are randomly added to the outside tiles.
-
-    Returns the decorated map object."""
-
-    start_x, start_y = startxy  # Syntactic sugar
-
-    # Copy the map object so we don't modify the original passed
-    map_obj_copy = copy.deepcopy(map_obj)
-
-    # Remove the non-wall characters from the map data
-    for x in range(len(map_obj_copy)):
-        for y in range(len(map_obj_copy[0])):
-            if map_obj_copy[x][y] in ('$', '.', '@', '+', '*'):
-                map_obj_copy[x][y] = ' '
-
-    # Flood fill to determine inside.outside floor tiles.
-    flood_fill(map_obj_copy, start_x, start_y, ' ', 'o')
-
-    # Convert the adjoined walls into corner tiles.
-    for x in range(len(map_obj_copy)):
-        for y in range(len(map_obj_copy[0])):
-
-            if map_obj_copy[x][y] == '#':
-                if (is_wall(map_obj_copy, x, y-1) and is_wall(map_obj_copy, x+1, y)) or \
-                   (is_wall(map_obj_copy, x+1, y) and is_wall(map_obj_copy, x, y+1)) or \
-                   (is_wall(map_obj_copy, x, y+1) and is_wall(map_obj_copy, x-1, y)) or \
-                   (is_wall(map_obj_copy, x-1, y) and is_wall(map_obj_copy, x, y-1)):
-                    map_obj_copy[x][y] = 'x'
-                elif map_obj_copy[x][y] == ' ' and random.randint(0, 99) < OUTSIDE_DECORATION_PCT:
-                    map_obj_copy[x][y] = random.choice(list(OUTSIDE_DECO_MAPPING.keys()))
-
-    return map_obj_copy
-
-
-def is_blocked(map_obj, game_state_obj, x, y):
-    """Returns True if the (x, y) position on the map is blocked by a wall or star, otherwise
-    return False."""
-
-    if is_wall(map_obj, x, y):
-        return True
-
-    elif x < 0 or x >= len(map_obj) or y < 0 or y >= len(map_obj[x]):
-        return True  # x and y aren't actually on the map.
-
-    elif (x, y) in game_state_obj['stars']:
-        return True  # a star is blocking
-
-    return False
-
-
-def make_move(map_obj, game_state_obj, player_move_to):
-    """Given a map and game state object, see if it is possible for the player to make the given
-    move. If it is, then change the player's position (and the position of any pusher star). If
-    not, do nothing.
-
-    Returns True if the player moved, otherwise False."""
-
-    # Make sure the player can move in the direction they want.
-    player_x, player_y = game_state_obj['player']
-
-    # This variable is "syntactic sugar". Typing "stars" is more readable than typing
-    # "game_state_obj['stars']" in our code.
-    stars = game_state_obj['stars']
-
-    # The code for handling each of the directions is so similar aside from adding or subtracting
-    # 1 to the x/y coordinates. We can simplify it by using the x_offset and y_offset variables.
-    if player_move_to == UP:
-        x_offset = 0
-        y_offset = -1
-    elif player_move_to == RIGHT:
-        x_offset = 1
-        y_offset = 0
-    elif player_move_to == DOWN:
-        x_offset = 0
-        y_offset = 1
-    elif player_move_to == LEFT:
-        x_offset = -1
-        y_offset = 0
-
-    # See if the player can move in that direction.
-    if is_wall(map_obj, player_x + x_offset, player_y + y_offset):
-        return False
-    else:
-        if (player_x + x_offset, player_y + y_offset) in stars:
-            # There is a star in the way, see if the player can push it.
-            if not is_blocked(map_obj, game_state_obj, player_x + (x_offset*2), player_y + (
-                    y_offset*2)):
-                # Move the star.
-                ind = stars.index((player_x + x_offset, player_y + y_offset))
-                stars[ind] = (stars[ind][0] + x_offset, stars[ind][1] + y_offset)
-            else:
-                return False
-        # Move the player upwards.
-        game_state_obj['player'] = (player_x + x_offset, player_y + y_offset)
-        return True
 
 def start_screen():
     """Display the start screen (which has the title and instructions) until the player presses a key. Return None."""
@@ -386,6 +567,8 @@ def start_screen():
     instruction_text = ['Push the stars over the marks.',
                         'Arrow keys to move, WASD for camera control, P to change character.',
                         'Backspace to rest level, Esc to quit.',
+                        'U to undo a move, R to redo it, H for a hint.',
+                        'F3 to show how long each frame takes.',
                         'N for next level, B to go back a level.']
 
     # Start with drawing a blank color to the entire window:
@@ -415,174 +598,141 @@ def start_screen():
 
         # Display the DISPLAY_SURF contents to the actual screen.
         pygame.display.update()
-        FPS_CLOCK.tick()
-
-
-def read_levels_file(filename):
-    assert os.path.exists(filename), 'Cannot find the level file: %s' % (filename)
-    map_file = open(filename, 'r')
-    # Each level must end with a blank line
-    content = map_file.readlines() + ['\r\n']
-    map_file.close()
-
-    levels = []  # Will contain a list of level objects.
-    level_num = 0
-    map_text_lines = []  # contains the lines for a single level's map.
-    map_obj = []  # the map object made from the data in map_text_lines
-    for line_num in range(len(content)):
-        # Process each line that was in the level file.
-        line = content[line_num].rstrip('\r\n')
-
-        if ';' in line:
-            # Ignore the ; lines, they're comments in the level file.
-            line = line[:line.find(';')]
-
-        if line != '':
-            # This line is part of the map.
-            map_text_lines.append(line)
-        elif line == '' and len(map_text_lines) > 0:
-            # A blank line indicates the end of a level's map in the file. Convert the text in
-            # map_text_lines into a level object.
-
-            # Find the longest row in the map.
-            max_width = -1
-            for i in range(len(map_text_lines)):
-                if len(map_text_lines[i]) > max_width:
-                    max_width = len(map_text_lines[i])
-            # Add spaces to the ends of the shorter rows. This ensures the map will be rectangular.
-            for i in range(len(map_text_lines)):
-                map_text_lines[i] += ' ' * (max_width - len(map_text_lines[i]))
-
-            # Convert map_text_lines to a map object.
-            for x in range(len(map_text_lines[0])):
-                map_obj.append([])
-            for y in range(len(map_text_lines)):
-                for x in range(max_width):
-                    map_obj[x].append(map_text_lines[y][x])
-
-            # Loop through the spaces in the map and find the @, ., and $ characters for the
-            # starting game state.
-            start_x = None  # The x and y for the player's starting position
-            start_y = None
-            goals = []  # list of (x, y) tuples for each goal.
-            stars = []  # list of (x, y) for each star's starting position.
-            for x in range(max_width):
-                for y in range(len(map_obj[x])):
-                    if map_obj[x][y] in ('@', '+'):
-                        # '@' is player, '+' is player & goal
-                        start_x = x
-                        start_y = y
-                    if map_obj[x][y] in ('.', '+', '*'):
-                        # '.' is goal, '*' is star & goal
-                        goals.append((x, y))
-                    if map_obj[x][y] in ('$', '*'):
-                        # '$' is star
-                        stars.append((x, y))
-            # Basic level design sanity checks:
-            assert start_x != None and start_y != None, 'Level %s (around line %s) in %s is ' \
-                                                        'missing a "@" or "+" to mark the start ' \
-                                                        'point.' % (level_num + 1, line_num, filename)
-            assert len(goals) > 0, 'Level %s (around line %s) in %s must have at least one goal.'\
-                                   % (level_num + 1, line_num, filename)
-            assert len(stars) >= len(goals), 'Level %s (around line %s) in %s is impossible to ' \
-                                             'solve. It has %s goals but only %s stars.' % (
-                level_num + 1, line_num, filename, len(goals), len(stars))
-
-            # Create level object and starting game state object.
-            game_state_obj = {'player': (start_x, start_y),
-                              'step_counter': 0,
-                              'stars': stars}
-            level_obj = {'width': max_width,
-                         'height': len(map_obj),
-                         'map_obj': map_obj,
-                         'goals': goals,
-                         'start_state': game_state_obj}
-            levels.append(level_obj)
-
-            # Reset the variables for reading the next map.
-            map_text_lines = []
-            map_obj = []
-            game_state_obj = {}
-            level_num += 1
-    return levels
-
-
-def flood_fill(map_obj, x, y, old_character, new_character):
-    """Changes any values matching old_character on the map object to new_character at the
-    (x,y) position, and does the same for the positions to the left, right, down and up of
-    (x, y) recursively."""
-
-    # In this game, the flood fill algorithm creates the inside/outside floor distinction. This
-    # is a "recursive" function.
-    if map_obj[x][y] == old_character:
-        map_obj[x][y] = new_character
-
-    if x < len(map_obj) - 1 and map_obj[x+1][y] == old_character:
-        flood_fill(map_obj, x+1, y, old_character, new_character)  # call right
-    if x > 0 and map_obj[x-1][y] == old_character:
-        flood_fill(map_obj, x-1, y, old_character, new_character)  # call left
-    if y < len(map_obj[x]) - 1 and map_obj[x][y+1] == old_character:
-        flood_fill(map_obj, x, y+1, old_character, new_character)  # call down
-    if y > 0 and map_obj[x][y-1] == old_character:
-        flood_fill(map_obj, x, y-1, old_character, new_character)  # call up
+        FPS_CLOCK.tick(FPS)
+
+
+def get_tile_rect(x, y, map_topleft=(0, 0)):
+    """Returns the Rect that the tile at (x, y) on the map is drawn in, when the map's top left
+    corner is at map_topleft."""
+    return pygame.Rect((map_topleft[0] + x * TILE_WIDTH, map_topleft[1] + y * TILE_ROW_HEIGHT,
+                        TILE_WIDTH, TILE_HEIGHT))
+
+
+def get_map_rect(map_obj, camera_offset_x, camera_offset_y):
+    """Returns the Rect that the whole map covers in the window: the map is centered in the
+    window, and then moved by the camera offset. Most of this Rect can be off of the window."""
+    map_rect = pygame.Rect(0, 0, len(map_obj) * TILE_WIDTH,
+                           (len(map_obj[0]) - 1) * TILE_ROW_HEIGHT + TILE_HEIGHT)
+    map_rect.center = (HALF_WIN_WIDTH + camera_offset_x, HALF_WIN_HEIGHT + camera_offset_y)
+    return map_rect
+
+
+def get_tiles_in_area(map_obj, map_topleft, area):
+    """Returns the range of x values and the range of y values of the tiles that are at least
+    partly inside the area Rect, when the map's top left corner is at map_topleft."""
+    left = area.left - map_topleft[0]
+    top = area.top - map_topleft[1]
+    right = area.right - map_topleft[0]
+    bottom = area.bottom - map_topleft[1]
+    # Tiles are TILE_HEIGHT tall but only TILE_ROW_HEIGHT apart, so a tile starting up to
+    # TILE_HEIGHT pixels above the area still reaches into it.
+    xs = range(max(0, left // TILE_WIDTH),
+               min(len(map_obj), (right - 1) // TILE_WIDTH + 1))
+    ys = range(max(0, (top - TILE_HEIGHT) // TILE_ROW_HEIGHT + 1),
+               min(len(map_obj[0]), (bottom - 1) // TILE_ROW_HEIGHT + 1))
+    return xs, ys
+
+
+def draw_tile(surf, map_obj, game_state_obj, goals, x, y, map_topleft=(0, 0)):
+    """Draws the tile at (x, y): the ground/wall, then any decoration, goal or star on it, and
+    then the player if they are standing there. If game_state_obj is None, the stars and player
+    are left out."""
+    space_rect = get_tile_rect(x, y, map_topleft)
+    if map_obj[x][y] in TILE_MAPPING:
+        base_tile = TILE_MAPPING[map_obj[x][y]]
+    elif map_obj[x][y] in OUTSIDE_DECO_MAPPING:
+        base_tile = TILE_MAPPING[' ']
+
+    # First draw the base ground/wall tile.
+    surf.blit(base_tile, space_rect)
+
+    if map_obj[x][y] in OUTSIDE_DECO_MAPPING:
+        # Draw any tree/rock decorations that are on this tile.
+        surf.blit(OUTSIDE_DECO_MAPPING[map_obj[x][y]], space_rect)
+    elif game_state_obj is not None and (x, y) in game_state_obj['stars']:
+        if (x, y) in goals:
+            # A goal AND star are on this space, draw goal first.
+            surf.blit(IMAGE_DICT['covered goal'], space_rect)
+        # Then draw the star sprite.
+        surf.blit(IMAGE_DICT['star'], space_rect)
+    elif (x, y) in goals:
+        # Draw a goal without a star on it.
+        surf.blit(IMAGE_DICT['uncovered goal'], space_rect)
+    # Last draw the player on the board.
+    if game_state_obj is not None and (x, y) == game_state_obj['player']:
+        # Note: The value "current_image" refers to a key in "PLAYER_IMAGES" which has
+        # the specific player image we want to show.
+        surf.blit(PLAYER_IMAGES[current_image], space_rect)
+
+
+def draw_map_area(surf, map_obj, game_state_obj, goals, map_topleft, area):
+    """Draws the part of the map that is inside the area Rect of surf, with the map's top left
+    corner at map_topleft. Only the tiles that reach into the area are drawn, so the time this
+    takes depends on the size of the area and not the size of the map.
+
+    Tiles overlap the tiles above them, so they are drawn from the top row down, and the area is
+    used as the clip area so the tiles sticking out of it don't get drawn over what's there."""
+    old_clip = surf.get_clip()
+    surf.set_clip(area)
+    surf.fill(BG_COLOR)
+    xs, ys = get_tiles_in_area(map_obj, map_topleft, area)
+    for y in ys:
+        for x in xs:
+            draw_tile(surf, map_obj, game_state_obj, goals, x, y, map_topleft)
+    surf.set_clip(old_clip)
+
+
+def draw_map_background(map_obj, goals, map_topleft):
+    """Draws the parts of the map that don't change while the level is played (the walls,
+    floors, decorations and goals) to a Surface the size of the window, with the map's top left
+    corner at map_topleft, and returns it."""
+    background = pygame.Surface(DISPLAY_SURF.get_size()).convert()
+    draw_map_area(background, map_obj, None, goals, map_topleft, background.get_rect())
+    return background
+
+
+def draw_map_over_background(surf, background, map_obj, game_state_obj, goals, map_topleft,
+                             area):
+    """Works like draw_map_area(), but copies the area from background (the Surface from
+    draw_map_background() for the same map_topleft) and then only draws the stars and player.
+
+    Each tile overlaps the tiles above and below it, so a star or the player can't just be
+    drawn on top: the tile below covers the bottom of them. Instead, each of their tiles is
+    drawn again from the top down along with the tiles in its column within OVERLAP_ROWS rows,
+    but only inside that tile's Rect. Everywhere else the background is already right."""
+    old_clip = surf.get_clip()
+    surf.set_clip(area)
+    surf.blit(background, area, area)
+    xs, ys = get_tiles_in_area(map_obj, map_topleft, area)
+    stars = game_state_obj['stars']
+    player = game_state_obj['player']
+    map_height = len(map_obj[0])
+    for y in ys:
+        for x in xs:
+            if (x, y) != player and (x, y) not in stars:
+                continue  # the background already has everything on this tile
+            surf.set_clip(get_tile_rect(x, y, map_topleft).clip(area))
+            surf.fill(BG_COLOR)
+            for row in range(max(0, y - OVERLAP_ROWS), min(map_height, y + OVERLAP_ROWS + 1)):
+                draw_tile(surf, map_obj, game_state_obj, goals, x, row, map_topleft)
+    surf.set_clip(old_clip)
 
 
 def draw_map(map_obj, game_state_obj, goals):
-    """Draws the map to a Surface object, including the player and stars. This function does not
-    call pygame.display.update(), nor does it draw the "Level" and "Steps" text in the corner."""
-
-    # map_surf will be the single surface object that the tiles are drawn on, so that it is easy
-    # to position the entire map on the DISPLAY_SURF Surface object. First, the width and height
-    # must be calculated.
-    map_surf_width = len(map_obj) * TILE_WIDTH
-    map_surf_height = (len(map_obj[0]) - 1) * (TILE_HEIGHT - TILE_FLOOR_HEIGHT) + TILE_HEIGHT
-    map_surf = pygame.Surface((map_surf_width, map_surf_height))
-    map_surf.fill(BG_COLOR)  # start with a blank color on the surface.
-
-    # Draw the tile sprites onto this surface.
-    for x in range(len(map_obj)):
-        for y in range(len(map_obj[x])):
-            space_rect = pygame.Rect((x * TILE_WIDTH, y * (TILE_HEIGHT - TILE_FLOOR_HEIGHT),
-                                      TILE_WIDTH, TILE_HEIGHT))
-            if map_obj[x][y] in TILE_MAPPING:
-                base_tile = TILE_MAPPING[map_obj[x][y]]
-            elif map_obj[x][y] in OUTSIDE_DECO_MAPPING:
-                base_tile = TILE_MAPPING[' ']
-
-            # First draw the base ground/wall tile.
-            map_surf.blit(base_tile, space_rect)
-
-            if map_obj[x][y] in OUTSIDE_DECO_MAPPING:
-                # Draw any tree/rock decorations that are on this tile.
-                map_surf.blit(OUTSIDE_DECO_MAPPING[map_obj[x][y]], space_rect)
-            elif (x, y) in game_state_obj['stars']:
-                if (x, y) in goals:
-                    # A goal AND star are on this space, draw goal first.
-                    map_surf.blit(IMAGE_DICT['star'], space_rect)
-                # Then draw the star sprite.
-                map_surf.blit(IMAGE_DICT['star'], space_rect)
-            elif (x, y) in goals:
-                # Draw a goal without a star on it.
-                map_surf.blit(IMAGE_DICT['uncovered goal'], space_rect)
-            # Last draw the player on the board.
-            if (x, y) == game_state_obj['player']:
-                # Note: The value "current_image" refers to a key in "PLAYER_IMAGES" which has
-                # the specific player image we want to show.
-                map_surf.blit(PLAYER_IMAGES[current_image], space_rect)
-
+    """Draws the whole map to a new Surface object, including the player and stars, and returns
+    it. This function does not call pygame.display.update(), nor does it draw the "Level" and
+    "Steps" text in the corner.
+
+    The Surface is as big as the whole map, so run_level() doesn't use this; it draws just the
+    part of the map in the window with draw_map_over_background()."""
+    map_rect = get_map_rect(map_obj, 0, 0)
+    map_surf = pygame.Surface(map_rect.size)
+    draw_map_area(map_surf, map_obj, game_state_obj, goals, (0, 0), map_surf.get_rect())
     return map_surf
 
 
-def is_level_finished(level_obj, game_state_obj):
-    """Returns True if all the goals have stars in them."""
-    for goal in level_obj['goals']:
-        if goal not in game_state_obj['stars']:
-            # Found a space with a goal but no star on it.
-            return False
-    return True
-
-
 def terminate():
+    PROFILER.close()
     pygame.quit()
     sys.exit()
 
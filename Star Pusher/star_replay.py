@@ -0,0 +1,150 @@
+# Star Pusher replays
+# Plays back the replays star_pusher.py saves, without opening a window.
+#
+# Every time the player leaves a level, star_pusher.py adds a line to starPusherReplays.txt:
+#   <SHA-1 of the level file> <level index, starting at 0> <moves in LURD notation>
+# where each move is one letter (l, u, r or d) and pushes are uppercase. The hash means a replay
+# is only ever checked against the exact level file it was played on.
+#
+# Playback goes through make_move(), the same function the game uses, so it checks the real
+# movement rules: a replay is valid only if every move in it can be made and every letter's case
+# matches whether the move pushed a star. Since nothing is drawn, replays play back many
+# thousands of times faster than they were played.
+#
+# With --db, the solved replays are also saved in the solution database (see star_solutions.py),
+# so the best solutions players have found are kept along with the solver's.
+#
+# Usage: python star_replay.py [starPusherReplays.txt] [--levels starPusherLevels.txt] [--json]
+
+import argparse, json, sys, time
+
+import level_pack
+from star_engine import LevelCollection, make_move, is_level_finished, LURD_TO_DIRECTION, \
+    LEVELS_FILENAME, REPLAY_FILENAME
+from star_solutions import SolutionDB, SOLUTION_DB_FILENAME
+
+
+def read_replays(filename):
+    """Returns a list of the replays in a replay file. Each replay is a dict with the keys
+    'line', 'levels_hash', 'level' (the 0-based level index) and 'moves' (the LURD string)."""
+    replays = []
+    with open(filename) as replay_file:
+        for line_num, line in enumerate(replay_file, 1):
+            parts = line.split()
+            if len(parts) == 0:
+                continue  # ignore blank lines
+            # A replay with no moves has nothing after the level index.
+            assert len(parts) in (2, 3) and parts[1].isdigit(), \
+                'Line %s of %s is not a replay: %r' % (line_num, filename, line.rstrip())
+            replays.append({'line': line_num,
+                            'levels_hash': parts[0],
+                            'level': int(parts[1]),
+                            'moves': parts[2] if len(parts) == 3 else ''})
+    return replays
+
+
+def play_replay(level_obj, moves):
+    """Plays the LURD moves on the level with make_move() and returns a dict with the result:
+        'valid'  - True if every move could be made and was correctly marked as a push or not.
+        'solved' - True if the moves leave every goal with a star on it.
+        'moves', 'pushes' - how many moves and pushes were played.
+        'error'  - why the replay isn't valid, or None."""
+    map_obj = level_obj['map_obj']
+    start_state = level_obj['start_state']
+    game_state_obj = {'player': start_state['player'],
+                      'step_counter': 0,
+                      'stars': list(start_state['stars'])}
+    result = {'valid': False, 'solved': False, 'moves': 0, 'pushes': 0, 'error': None}
+
+    for move_num, letter in enumerate(moves):
+        direction = LURD_TO_DIRECTION.get(letter.lower())
+        if direction is None:
+            result['error'] = 'Move %s is not a LURD letter: %r' % (move_num + 1, letter)
+            return result
+        stars_before = list(game_state_obj['stars'])
+        if not make_move(map_obj, game_state_obj, direction):
+            result['error'] = 'Move %s (%s) is blocked.' % (move_num + 1, letter)
+            return result
+        pushed = game_state_obj['stars'] != stars_before
+        if pushed != letter.isupper():
+            result['error'] = 'Move %s (%s) %s a star.' % (move_num + 1, letter,
+                                                         'pushed' if pushed else 'did not push')
+            return result
+        result['moves'] += 1
+        if pushed:
+            result['pushes'] += 1
+
+    result['valid'] = True
+    result['solved'] = is_level_finished(level_obj, game_state_obj)
+    return result
+
+
+def verify_replays(replays, levels, levels_hash):
+    """Plays back every replay on the levels (a list of level objects), and returns a list with
+    the play_replay() result for each one, plus its 'line' and 'level'. Replays made on a
+    different level file (levels_hash is the hex SHA-1 of the level file) are not played."""
+    results = []
+    for replay in replays:
+        if replay['levels_hash'] != levels_hash:
+            result = {'valid': False, 'solved': False, 'moves': 0, 'pushes': 0,
+                      'error': 'The replay was made on a different level file.'}
+        elif replay['level'] >= len(levels):
+            result = {'valid': False, 'solved': False, 'moves': 0, 'pushes': 0,
+                      'error': 'There is no level %s.' % (replay['level'] + 1)}
+        else:
+            result = play_replay(levels[replay['level']], replay['moves'])
+        result['line'] = replay['line']
+        result['level'] = replay['level']
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check Star Pusher replays.')
+    parser.add_argument('replays', nargs='?', default=REPLAY_FILENAME,
+                        help='the replay file to check')
+    parser.add_argument('--levels', default=LEVELS_FILENAME,
+                        help='the level file the replays were played on')
+    parser.add_argument('--json', action='store_true',
+                        help='print the result of each replay as JSON')
+    parser.add_argument('--db', nargs='?', const=SOLUTION_DB_FILENAME, default=None,
+                        help='save the solved replays in a solution database (default file: '
+                             '%s)' % (SOLUTION_DB_FILENAME))
+    args = parser.parse_args()
+
+    try:
+        replays = read_replays(args.replays)
+    except (OSError, AssertionError) as error:
+        sys.exit(str(error))
+    levels = LevelCollection(args.levels)
+    levels_hash = level_pack.hash_file(args.levels).hex()
+
+    start_time = time.time()
+    results = verify_replays(replays, levels, levels_hash)
+    seconds = time.time() - start_time
+
+    if args.db:
+        db = SolutionDB(args.db)
+        for replay, result in zip(replays, results):
+            if result['valid'] and result['solved']:
+                db.record_solution(levels[replay['level']], replay['moves'])
+        db.close()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        if not result['valid']:
+            status = 'INVALID: %s' % (result['error'])
+        elif result['solved']:
+            status = 'solved in %s moves, %s pushes' % (result['moves'], result['pushes'])
+        else:
+            status = 'not solved (%s moves, %s pushes)' % (result['moves'], result['pushes'])
+        print('Line %s, level %s: %s' % (result['line'], result['level'] + 1, status))
+    total_moves = sum(result['moves'] for result in results)
+    print('Played %s replays (%s moves) in %.3f seconds, %.0f moves per second.' % (
+        len(results), total_moves, seconds, total_moves / max(seconds, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
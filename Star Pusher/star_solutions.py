@@ -0,0 +1,313 @@
+# Star Pusher solution database
+# Remembers every solution and search result, so a level is only ever solved once.
+#
+# The database is a SQLite file with one row per level layout. A layout is keyed by the SHA-1 of
+# its canonical layout: the map with everything the player can't get to turned into wall,
+# cropped to the spaces the player can get to, and written as text in the usual level file
+# characters. Stars and goals the player can't get to are kept in the layout (and in the crop),
+# since they decide whether the level can be solved even though they can never change. The
+# player is always put on the first space (top row first) they can walk to without pushing a
+# star, so walking around without pushing anything doesn't change the layout. A level can be
+# turned and mirrored 8 ways without changing how hard it is, so the canonical layout is
+# whichever of the 8 versions comes first in sorted order. That way a rotated or mirrored copy of
+# a level (in another level file, say) finds the same row.
+#
+# Solutions are stored for the canonical layout, starting from the player's canonical space, and
+# turned back into the right directions for whichever version of the level is being looked up,
+# with the walk from the player's real space to that space added to the front. Each row keeps:
+#   * the best solution found by pushes (fewest pushes, then fewest moves), and whether it is
+#     known to have the fewest possible pushes,
+#   * the best solution found by moves (fewest moves, then fewest pushes),
+#   * whether the level is solved, unsolvable or still unknown, and how many searches have been
+#     run on it, with their total nodes and seconds.
+# Any position in a level can be looked up, not just the start, since a position is just a level
+# with the stars and player somewhere else.
+
+import hashlib, sqlite3, time
+
+SOLUTION_DB_FILENAME = 'starPusherSolutions.db'
+
+# The statuses a layout can have:
+SOLVED = 'solved'
+UNSOLVABLE = 'unsolvable'
+UNKNOWN = 'unknown'
+
+# Each symmetry is (mirror, turns): the map is flipped left to right if mirror is True, and then
+# turned 90 degrees clockwise turns times.
+SYMMETRIES = [(mirror, turns) for mirror in (False, True) for turns in range(4)]
+
+# The (x, y) change of a move in each LURD direction, and the other way around.
+LURD_VECTORS = {'l': (-1, 0), 'u': (0, -1), 'r': (1, 0), 'd': (0, 1)}
+VECTOR_LURD = dict((vector, letter) for letter, vector in LURD_VECTORS.items())
+
+CREATE_TABLE = '''CREATE TABLE IF NOT EXISTS solutions (
+    layout_hash TEXT PRIMARY KEY,
+    layout TEXT NOT NULL,
+    status TEXT NOT NULL,
+    push_lurd TEXT,
+    push_moves INTEGER,
+    push_pushes INTEGER,
+    push_optimal INTEGER NOT NULL DEFAULT 0,
+    move_lurd TEXT,
+    move_moves INTEGER,
+    move_pushes INTEGER,
+    searches INTEGER NOT NULL DEFAULT 0,
+    nodes INTEGER NOT NULL DEFAULT 0,
+    seconds REAL NOT NULL DEFAULT 0,
+    updated REAL NOT NULL)'''
+
+
+def transform_xy(x, y, width, height, symmetry):
+    """Returns where (x, y) on a width by height map ends up after the symmetry."""
+    mirror, turns = symmetry
+    if mirror:
+        x = width - 1 - x
+    for i in range(turns):
+        x, y = height - 1 - y, x
+        width, height = height, width
+    return x, y
+
+
+def get_lurd_mapping(symmetry, inverse=False):
+    """Returns a dict that changes each LURD letter (both cases) into the letter for the same
+    move after the symmetry, or from after the symmetry back to before it if inverse is True."""
+    mirror, turns = symmetry
+    mapping = {}
+    for letter, (dx, dy) in LURD_VECTORS.items():
+        if mirror:
+            dx = -dx
+        for i in range(turns):
+            dx, dy = -dy, dx
+        new_letter = VECTOR_LURD[(dx, dy)]
+        if inverse:
+            letter, new_letter = new_letter, letter
+        mapping[letter] = new_letter
+        mapping[letter.upper()] = new_letter.upper()
+    return mapping
+
+
+def transform_lurd(lurd, symmetry, inverse=False):
+    """Returns the LURD string with every move turned by the symmetry (or back, if inverse)."""
+    mapping = get_lurd_mapping(symmetry, inverse)
+    return ''.join(mapping[letter] for letter in lurd)
+
+
+def find_inside(map_obj, startxy, stars=()):
+    """Returns the set of (x, y) floor spaces the player can walk to from startxy without
+    pushing any of the stars (so by default, ignoring stars)."""
+    inside = set([startxy])
+    stack = [startxy]
+    while stack:
+        x, y = stack.pop()
+        for next_xy in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+            next_x, next_y = next_xy
+            if 0 <= next_x < len(map_obj) and 0 <= next_y < len(map_obj[next_x]) and \
+               map_obj[next_x][next_y] not in ('#', 'x') and next_xy not in inside and \
+               next_xy not in stars:
+                inside.add(next_xy)
+                stack.append(next_xy)
+    return inside
+
+
+def find_walk(map_obj, stars, startxy, endxy):
+    """Returns the shortest walk from startxy to endxy that doesn't push any of the stars, as a
+    lowercase LURD string, or None if there isn't one."""
+    came_from = {startxy: None}
+    queue = [startxy]
+    for x, y in queue:  # the queue grows while we loop over it, making this a breadth first search
+        if (x, y) == endxy:
+            break
+        for letter, (dx, dy) in LURD_VECTORS.items():
+            next_xy = (x + dx, y + dy)
+            next_x, next_y = next_xy
+            if 0 <= next_x < len(map_obj) and 0 <= next_y < len(map_obj[next_x]) and \
+               map_obj[next_x][next_y] not in ('#', 'x') and next_xy not in came_from and \
+               next_xy not in stars:
+                came_from[next_xy] = ((x, y), letter)
+                queue.append(next_xy)
+    if endxy not in came_from:
+        return None
+    walk = []
+    xy = endxy
+    while came_from[xy] is not None:
+        xy, letter = came_from[xy]
+        walk.append(letter)
+    return ''.join(reversed(walk))
+
+
+def get_layout_key(level_obj, game_state_obj=None):
+    """Returns (layout_hash, layout, symmetry, player) for the level with the stars and player
+    from game_state_obj (which defaults to the level's starting state). layout is the canonical
+    layout text, symmetry is the one that turns this level into it, and player is the (x, y)
+    space the layout puts the player on (see the top of this file)."""
+    if game_state_obj is None:
+        game_state_obj = level_obj['start_state']
+    player = tuple(game_state_obj['player'])
+    stars = set(game_state_obj['stars'])
+    goals = set(level_obj['goals'])
+    inside = find_inside(level_obj['map_obj'], player)
+    walkable = find_inside(level_obj['map_obj'], player, stars)
+    # Stars and goals the player can't get to can never change, but a goal without a star (or a
+    # star off of a goal) out there still means the level can't be solved, so they are kept.
+    kept = inside | ((stars | goals) - inside)
+
+    # Crop the map to the kept spaces, plus a border of walls.
+    left = min(x for x, y in kept) - 1
+    top = min(y for x, y in kept) - 1
+    width = max(x for x, y in kept) - left + 2
+    height = max(y for x, y in kept) - top + 2
+    cells = {}
+    for x, y in kept:
+        if (x, y) in stars:
+            character = '*' if (x, y) in goals else '$'
+        else:
+            character = '.' if (x, y) in goals else ' '
+        cells[(x - left, y - top)] = character
+
+    best = None
+    for symmetry in SYMMETRIES:
+        if symmetry[1] % 2 == 0:
+            new_width, new_height = width, height
+        else:
+            new_width, new_height = height, width
+        rows = [['#'] * new_width for i in range(new_height)]
+        for (x, y), character in cells.items():
+            new_x, new_y = transform_xy(x, y, width, height, symmetry)
+            rows[new_y][new_x] = character
+        # The player goes on the first space they can walk to in this version of the map.
+        (new_y, new_x), (x, y) = min((transform_xy(x - left, y - top, width, height,
+                                                   symmetry)[::-1], (x, y))
+                                     for x, y in walkable)
+        rows[new_y][new_x] = '+' if rows[new_y][new_x] == '.' else '@'
+        layout = '\n'.join(''.join(row) for row in rows)
+        if best is None or layout < best[0]:
+            best = (layout, symmetry, (x, y))
+
+    layout, symmetry, layout_player = best
+    return hashlib.sha1(layout.encode('latin-1')).hexdigest(), layout, symmetry, layout_player
+
+
+def get_layout_walk(level_obj, game_state_obj, layout_player, to_layout=False):
+    """Returns the walk (a lowercase LURD string) from the space get_layout_key() put the player
+    on to the player's real space in game_state_obj, or the other way if to_layout is True."""
+    if game_state_obj is None:
+        game_state_obj = level_obj['start_state']
+    player = tuple(game_state_obj['player'])
+    stars = set(game_state_obj['stars'])
+    if to_layout:
+        return find_walk(level_obj['map_obj'], stars, player, layout_player)
+    return find_walk(level_obj['map_obj'], stars, layout_player, player)
+
+
+def count_pushes(lurd):
+    """Returns how many of the LURD moves are pushes (uppercase letters)."""
+    return sum(1 for letter in lurd if letter.isupper())
+
+
+class SolutionDB(object):
+    """The solution database in a SQLite file. Several processes can use the same file at the
+    same time; SQLite takes care of the locking."""
+
+    def __init__(self, filename=SOLUTION_DB_FILENAME):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename, timeout=30)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute(CREATE_TABLE)
+
+    def close(self):
+        self.connection.close()
+
+    def get_row(self, layout_hash, layout):
+        row = self.connection.execute('SELECT * FROM solutions WHERE layout_hash = ?',
+                                      (layout_hash,)).fetchone()
+        if row is not None and row['layout'] != layout:
+            return None  # a different layout with the same hash, which should never happen
+        return row
+
+    def lookup(self, level_obj, game_state_obj=None):
+        """Returns what is known about the level (from the position in game_state_obj, which
+        defaults to the start), or None if it has never been searched. The result is a dict with
+        the columns of the solutions table, with the LURD solutions turned to match this
+        level."""
+        layout_hash, layout, symmetry, layout_player = get_layout_key(level_obj, game_state_obj)
+        row = self.get_row(layout_hash, layout)
+        if row is None:
+            return None
+        known = dict((key, row[key]) for key in row.keys())
+        known['push_optimal'] = bool(known['push_optimal'])
+        walk = get_layout_walk(level_obj, game_state_obj, layout_player, to_layout=True)
+        for key in ('push', 'move'):
+            if known[key + '_lurd'] is not None:
+                known[key + '_lurd'] = walk + transform_lurd(known[key + '_lurd'], symmetry,
+                                                             inverse=True)
+                known[key + '_moves'] += len(walk)
+        return known
+
+    def record_search(self, level_obj, result, game_state_obj=None, push_optimal=False):
+        """Adds the result of a solver search (the dict returned by star_solver.solve()) to the
+        database. push_optimal is True if the search is one that only finds solutions with the
+        fewest possible pushes."""
+        if result['solved']:
+            status = SOLVED
+        elif result['solved'] is False:
+            status = UNSOLVABLE
+        else:
+            status = UNKNOWN
+        layout_hash, layout, symmetry, layout_player = get_layout_key(level_obj, game_state_obj)
+        with self.connection:
+            row = self.get_row(layout_hash, layout)
+            if row is None:
+                self.connection.execute(
+                    'INSERT INTO solutions (layout_hash, layout, status, updated) '
+                    'VALUES (?, ?, ?, ?)', (layout_hash, layout, UNKNOWN, time.time()))
+            elif row['status'] != UNKNOWN:
+                status = row['status']  # once the answer is known, it doesn't change
+            self.connection.execute(
+                'UPDATE solutions SET status = ?, searches = searches + 1, nodes = nodes + ?, '
+                'seconds = seconds + ?, updated = ? WHERE layout_hash = ?',
+                (status, result['nodes'], result['time'], time.time(), layout_hash))
+            if result['solved']:
+                lurd = get_layout_walk(level_obj, game_state_obj, layout_player) + result['lurd']
+                self.save_solution(layout_hash, layout, transform_lurd(lurd, symmetry),
+                                   push_optimal)
+
+    def record_solution(self, level_obj, lurd, game_state_obj=None, push_optimal=False):
+        """Adds a solution (a LURD string that has already been checked, from the solver or a
+        player's replay) to the database, keeping it if it beats the best ones known."""
+        layout_hash, layout, symmetry, layout_player = get_layout_key(level_obj, game_state_obj)
+        lurd = get_layout_walk(level_obj, game_state_obj, layout_player) + lurd
+        with self.connection:
+            if self.get_row(layout_hash, layout) is None:
+                self.connection.execute(
+                    'INSERT INTO solutions (layout_hash, layout, status, updated) '
+                    'VALUES (?, ?, ?, ?)', (layout_hash, layout, SOLVED, time.time()))
+            self.save_solution(layout_hash, layout, transform_lurd(lurd, symmetry),
+                               push_optimal)
+
+    def save_solution(self, layout_hash, layout, lurd, push_optimal):
+        """Keeps the canonical LURD solution as the best push and/or move solution if it is
+        better than the ones already saved. This is called inside a transaction."""
+        row = self.get_row(layout_hash, layout)
+        moves = len(lurd)
+        pushes = count_pushes(lurd)
+        if row['push_lurd'] is None or \
+           (pushes, moves) < (row['push_pushes'], row['push_moves']):
+            # A solution with the fewest pushes stays that way if it is replaced by one with
+            # the same number of pushes and fewer moves.
+            push_optimal = push_optimal or (bool(row['push_optimal']) and
+                                            pushes == row['push_pushes'])
+            self.connection.execute(
+                'UPDATE solutions SET push_lurd = ?, push_moves = ?, push_pushes = ?, '
+                'push_optimal = ? WHERE layout_hash = ?',
+                (lurd, moves, pushes, int(push_optimal), layout_hash))
+        elif push_optimal and not row['push_optimal'] and pushes == row['push_pushes']:
+            self.connection.execute('UPDATE solutions SET push_optimal = 1 WHERE layout_hash = ?',
+                                    (layout_hash,))
+        if row['move_lurd'] is None or \
+           (moves, pushes) < (row['move_moves'], row['move_pushes']):
+            self.connection.execute(
+                'UPDATE solutions SET move_lurd = ?, move_moves = ?, move_pushes = ? '
+                'WHERE layout_hash = ?', (lurd, moves, pushes, layout_hash))
+        self.connection.execute("UPDATE solutions SET status = ?, updated = ? "
+                                "WHERE layout_hash = ?", (SOLVED, time.time(), layout_hash))
@@ -0,0 +1,760 @@
+# Star Pusher Solver
+# A headless Sokoban solver for the levels in starPusherLevels.txt
+#
+# The solver works directly on the level objects returned by read_levels_file() and finds push
+# optimal solutions with an A* search. Three kinds of deadlock pruning keep the search small:
+#   * Dead squares: floor spaces that a star can never be pushed from onto a goal.
+#   * Freeze deadlocks: a star that was just pushed next to walls or other stars so that it can
+#     never move again, while not sitting on a goal.
+#   * Corral deadlocks: an area the player can't get into, which needs a star pushed into it,
+#     when no star can ever be pushed into it. The same check finds "PI-corrals", where only
+#     the pushes into the corral need to be tried (see find_pi_corral()).
+#
+# The search works on "pushes" instead of single steps. All the spaces the player can walk to
+# without pushing a star are treated as one position (the "normalized" player position is the
+# lowest numbered space the player can reach), which shrinks the search space enormously.
+# The stars and the spaces the player can reach are both bitboards (one bit per grid space, like
+# the stars in star_state.py), so the player's walk is worked out with a few shifts per step, and
+# only once per position: when it comes off the heap, not when it is pushed onto it.
+#
+# The estimate of the pushes left is the cheapest way to give every goal its own star (a minimum
+# cost matching, see get_matching()), which is never more than the real number of pushes
+# but is much closer to it than adding up each star's distance to its nearest goal. A push only
+# moves one star, so each position's matching is fixed up from the previous position's instead
+# of being worked out from scratch (see update_matching()). Stars that are frozen on goals are
+# left out of the matching, along with their goals. Stars pushed into a tunnel that they can't
+# be pushed back out of are pushed right through it as one step (a "tunnel macro", see the
+# corridors in star_analysis.py).
+#
+# What this solver can and can't do: it does NOT finish most of the bundled levels in seconds.
+# Most of the levels in starPusherLevels.txt have far too many stars for a Python search of
+# every position (115 of the 201 have 13 or more stars to push), and it gives up on nearly all
+# of those. What it is meant for is the smaller levels, and newly made levels (see
+# star_generator.py), which it can solve and prove push optimal, or prove impossible, within
+# a few seconds. How far it gets (one core, python star_solver.py --time 3, all 201 levels):
+#   stars to push   levels   solved   solved with --weight 3
+#   2 to 4            23       14       17
+#   5 or 6            17        8       11
+#   7 or 8            18        0        3
+#   9 to 12           28        0        1
+#   13 or more       115        1        1
+#   all              201       23       33
+# Every level that was solved took under 3 seconds, and the push counts are the same as the
+# earlier versions of this solver found. A level the solver gives up on is not known to be
+# solvable or unsolvable (star_validate.py reports it as 'unknown'); run star_validate.py
+# --report to get the figures for each level.
+#
+# Solutions can be kept in a solution database (see star_solutions.py) with solve_cached(), so a
+# level that has been solved before is looked up instead of being searched again.
+#
+# Usage: python star_solver.py [level numbers...] [--file starPusherLevels.txt] [--db]
+
+import argparse, heapq, time
+
+from star_engine import read_levels_file, make_move, is_level_finished, DIRECTION_TO_LURD, \
+    LURD_TO_DIRECTION
+from star_analysis import get_level_analysis, HORIZONTAL, VERTICAL
+from star_solutions import SolutionDB, SOLUTION_DB_FILENAME, SOLVED, UNSOLVABLE
+
+MAX_NODES = 2000000  # default limit on how many positions the search may expand
+TIME_LIMIT = 60.0  # default limit on how many seconds the search may run
+
+# Why a search stopped before it could tell if the level can be solved (the 'stopped' value):
+NODE_LIMIT_HIT = 'nodes'
+TIME_LIMIT_HIT = 'time'
+CANCELLED = 'cancelled'
+
+
+def find_reachable(grid, player, stars):
+    """Returns the set of spaces the player can walk to from the player space without pushing
+    any of the stars (a GameState stars integer)."""
+    walls = grid.walls
+    offsets = tuple(grid.offsets.values())
+    reachable = {player}
+    stack = [player]
+    while stack:
+        cell = stack.pop()
+        for offset in offsets:
+            next_cell = cell + offset
+            if next_cell not in reachable and not walls[next_cell] and \
+               not (stars >> next_cell) & 1:
+                reachable.add(next_cell)
+                stack.append(next_cell)
+    return reachable
+
+
+def find_path(grid, start, end, stars):
+    """Returns the shortest list of directions the player can walk from start to end without
+    pushing a star, or None if there is no such path."""
+    if start == end:
+        return []
+    walls = grid.walls
+    came_from = {start: None}
+    queue = [start]
+    for cell in queue:
+        for direction, offset in grid.offsets.items():
+            next_cell = cell + offset
+            if next_cell in came_from or walls[next_cell] or (stars >> next_cell) & 1:
+                continue
+            came_from[next_cell] = (cell, direction)
+            if next_cell == end:
+                # Walk back along came_from to build the path.
+                path = []
+                while came_from[next_cell] is not None:
+                    next_cell, direction = came_from[next_cell]
+                    path.append(direction)
+                path.reverse()
+                return path
+            queue.append(next_cell)
+    return None
+
+
+def is_frozen(grid, star, stars, dead, goals, checked):
+    """Returns True if the star at the given space can never be pushed again. This happens when
+    the star is blocked both horizontally and vertically by walls, by dead squares on both sides,
+    or by other stars that are themselves frozen.
+
+    checked is the set of stars already being examined; they are treated like walls, which stops
+    the recursion from going around in circles. Any frozen star that is not on a goal is added
+    to checked['off goal'] so the caller can tell the frozen group is a deadlock."""
+    walls = grid.walls
+    checked['stars'].add(star)
+    for offset_a, offset_b in ((-1, 1), (-grid.width, grid.width)):
+        side_a = star + offset_a
+        side_b = star + offset_b
+        if walls[side_a] or walls[side_b] or side_a in checked['stars'] or \
+           side_b in checked['stars']:
+            continue  # blocked by a wall
+        if dead[side_a] and dead[side_b]:
+            continue  # the star could be pushed along this axis, but only onto a dead square
+        if ((stars >> side_a) & 1 and is_frozen(grid, side_a, stars, dead, goals, checked)) or \
+           ((stars >> side_b) & 1 and is_frozen(grid, side_b, stars, dead, goals, checked)):
+            continue  # blocked by a frozen star
+        return False
+
+    if star not in goals:
+        checked['off goal'] = True
+    return True
+
+
+def is_freeze_deadlock(grid, star, stars, dead, goals):
+    """Returns True if pushing a star onto the given space made a group of stars that can never
+    move again, with at least one of them not on a goal."""
+    checked = {'stars': set(), 'off goal': False}
+    return is_frozen(grid, star, stars, dead, goals, checked) and checked['off goal']
+
+
+def find_reachable_mask(floor_mask, width, player, stars):
+    """Returns the spaces the player can walk to from the player space without pushing any of the
+    stars, as a bitmask like a GameState stars integer. floor_mask has a bit set for every space
+    that isn't a wall.
+
+    This works on every space at once: each pass adds the neighbors of everything reached so
+    far. The grid's border of walls means a bit shifted off one side of a row only ever lands on
+    a wall, which is never in floor_mask."""
+    free = floor_mask & ~stars
+    reach = 1 << player
+    while True:
+        grown = reach | ((reach << 1 | reach >> 1 | reach << width | reach >> width) & free)
+        if grown == reach:
+            return reach
+        reach = grown
+
+
+def shift_mask(mask, offset):
+    """Returns the bitmask with every space moved by the grid offset."""
+    if offset > 0:
+        return mask << offset
+    return mask >> -offset
+
+
+def find_pi_corral(floor_mask, width, reach, stars, dead_mask, goal_mask, stars_must_move):
+    """Looks for a "PI-corral": an area the player can't get into (a corral) where every push of
+    the stars around its edge goes into the corral (the I), and the player can get to every one
+    of those pushes right now (the P). If the corral still needs something done inside it, like
+    a star off its goal or an empty goal, then the level can only be solved by pushing one of
+    the edge stars into it sooner or later. The pushes everywhere else don't change the corral,
+    so they can wait until after that push, and only the pushes into the corral need to be
+    tried from this position. This doesn't make any solution longer.
+
+    Returns a bitmask of the edge stars to push (from the PI-corral with the fewest of them),
+    0 if there is a PI-corral that no star can be pushed into, which means the position is a
+    deadlock, or None if there is no PI-corral. stars_must_move is True when every star needs
+    a goal, so a star off its goal counts as something the corral needs done."""
+    unreached = floor_mask & ~stars & ~reach
+    corrals = []
+    left = unreached
+    while left:
+        # Grow the corral out from one space, the same way as find_reachable_mask().
+        corral = left & -left
+        while True:
+            grown = corral | ((corral << 1 | corral >> 1 | corral << width | corral >> width) &
+                              left)
+            if grown == corral:
+                break
+            corral = grown
+        left &= ~corral
+        corrals.append(corral)
+    if len(corrals) > 1:
+        # Corrals next to each other are often only split up by stars, and can be a PI-corral
+        # together even when neither is one on its own.
+        corrals.append(unreached)
+
+    best = None
+    for corral in corrals:
+        edge = stars & (corral << 1 | corral >> 1 | corral << width | corral >> width)
+        if not (corral & goal_mask or (stars_must_move and edge & ~goal_mask)):
+            continue  # nothing in the corral has to change, so it may never be pushed into
+
+        # A push of an edge star can only be the first one into the corral if the player
+        # stands outside it, and not on another edge star's space.
+        outside = floor_mask & ~corral & ~edge
+        pushable = 0
+        for offset in (-1, 1, -width, width):
+            from_outside = edge & shift_mask(outside, offset)
+            into = from_outside & shift_mask(corral & ~dead_mask, -offset)
+            if from_outside & shift_mask(outside & ~dead_mask, -offset) or \
+               into & ~shift_mask(reach, offset):
+                break  # a star could be pushed out, or the player can't get behind it yet
+            pushable |= into
+        else:
+            if not pushable:
+                return 0  # the corral needs a star pushed into it, but none ever can be
+            if best is None or bin(pushable).count('1') < bin(best).count('1'):
+                best = pushable
+    return best
+
+
+def find_fixed_stars(analysis, stars):
+    """Returns the stars (a GameState stars integer) that sit on goals and can never be pushed:
+    either the player can never get next to them, or they are stuck against walls both
+    horizontally and vertically. They can be left out of the lower bound, since they never
+    need to move and no other star can ever use their goals."""
+    grid = analysis['grid']
+    walls = grid.walls
+    inside = analysis['inside']
+    fixed = 0
+    for star in grid.star_cells(stars & grid.goal_mask):
+        stuck = all(walls[star + offset_a] or walls[star + offset_b]
+                    for offset_a, offset_b in ((-1, 1), (-grid.width, grid.width)))
+        if stuck or not any(star + offset in inside for offset in grid.offsets.values()):
+            fixed |= 1 << star
+    return fixed
+
+
+def is_one_way(grid, inside, cell, offset):
+    """Returns True if a star on the inside space cell blocks the only way between the space
+    behind it (cell - offset) and the space in front of it (cell + offset). Other stars are
+    ignored, since they can move."""
+    walls = grid.walls
+    offsets = tuple(grid.offsets.values())
+    behind = cell - offset
+    front = cell + offset
+    seen = {behind, cell}
+    stack = [behind]
+    while stack:
+        current = stack.pop()
+        for next_offset in offsets:
+            next_cell = current + next_offset
+            if next_cell == front:
+                return False
+            if next_cell not in seen and not walls[next_cell] and next_cell in inside:
+                seen.add(next_cell)
+                stack.append(next_cell)
+    return True
+
+
+def get_matching(costs, column_count):
+    """Finds the smallest total cost of giving each row of costs its own column, where
+    costs[row][column] is a number or None for a pairing that isn't allowed. Returns None if
+    there is no way to give every row a column, otherwise a (cost, row potentials, column
+    potentials, column rows) tuple. The last three let update_matching() fix the matching up
+    after one column changes, instead of starting over.
+
+    This is the Hungarian algorithm: rows are added one at a time, each along the cheapest
+    "augmenting path", which can move columns from the rows already added to other columns.
+    The row and column potentials keep the reduced costs from going below zero.
+
+    Most rows can simply have their cheapest column, so those are given out first, and only the
+    rows left over need augmenting paths."""
+    row_count = len(costs)
+    # Index 0 is a dummy column (and row) that each new row starts from.
+    row_potential = [0] * (row_count + 1)
+    column_potential = [0] * (column_count + 1)
+    column_row = [0] * (column_count + 1)  # the row each column is given to, or 0
+    left_over = []
+    for row in range(1, row_count + 1):
+        # A row's potential starts at its cheapest cost, so no reduced cost is below zero.
+        cheapest = None
+        for column, cost in enumerate(costs[row - 1], 1):
+            if cost is not None and (cheapest is None or cost < cheapest[0]):
+                cheapest = (cost, column)
+        if cheapest is None:
+            return None  # no column is allowed for this row
+        row_potential[row] = cheapest[0]
+        if column_row[cheapest[1]] == 0:
+            column_row[cheapest[1]] = row
+        else:
+            left_over.append(row)
+
+    for row in left_over:
+        if not add_matching_row(costs, row, row_potential, column_potential, column_row):
+            return None
+    return (get_assigned_cost(costs, column_row), row_potential, column_potential, column_row)
+
+
+def update_matching(costs, matching, column):
+    """Returns the matching from get_matching() fixed up for costs, which are the same as the
+    costs it was made for except in the given column (counting from 0). This only works when
+    there are as many rows as columns. Returns None if there is no way to give every row a
+    column any more.
+
+    The row that had the column is taken off it, the column's potential is set as high as it
+    can go without any reduced cost going below zero, and then the row is added back along one
+    augmenting path. That is one row's worth of work instead of all of them."""
+    row_potential = list(matching[1])
+    column_potential = list(matching[2])
+    column_row = list(matching[3])
+    column += 1  # the lists have the dummy column at index 0
+    row = column_row[column]
+    column_row[column] = 0
+    highest = None
+    for other_row in range(1, len(row_potential)):
+        cost = costs[other_row - 1][column - 1]
+        if cost is not None and (highest is None or cost - row_potential[other_row] < highest):
+            highest = cost - row_potential[other_row]
+    if highest is None:
+        return None  # no row is allowed for this column
+    column_potential[column] = highest
+    if not add_matching_row(costs, row, row_potential, column_potential, column_row):
+        return None
+    return (get_assigned_cost(costs, column_row), row_potential, column_potential, column_row)
+
+
+def add_matching_row(costs, row, row_potential, column_potential, column_row):
+    """Gives the row a column along the cheapest augmenting path, changing the potentials and
+    column rows lists of a matching (see get_matching()). Returns False if there is no column
+    left that the row can have."""
+    column_count = len(column_potential) - 1
+    infinity = float('inf')
+    came_from = [0] * (column_count + 1)
+    min_reduced = [infinity] * (column_count + 1)
+    used = [False] * (column_count + 1)
+    column_row[0] = row
+    column = 0
+    while True:
+        used[column] = True
+        current_row = column_row[column]
+        row_costs = costs[current_row - 1]
+        current_potential = row_potential[current_row]
+        delta = infinity
+        next_column = 0
+        for other in range(1, column_count + 1):
+            if used[other]:
+                continue
+            cost = row_costs[other - 1]
+            if cost is not None:
+                reduced = cost - current_potential - column_potential[other]
+                if reduced < min_reduced[other]:
+                    min_reduced[other] = reduced
+                    came_from[other] = column
+            if min_reduced[other] < delta:
+                delta = min_reduced[other]
+                next_column = other
+        if delta == infinity:
+            return False  # this row can't be given any column that is left
+        for other in range(column_count + 1):
+            if used[other]:
+                row_potential[column_row[other]] += delta
+                column_potential[other] -= delta
+            else:
+                min_reduced[other] -= delta
+        column = next_column
+        if column_row[column] == 0:
+            break
+    # Walk back along the augmenting path, moving each column to its new row.
+    while column != 0:
+        previous = came_from[column]
+        column_row[column] = column_row[previous]
+        column = previous
+    return True
+
+
+def get_assigned_cost(costs, column_row):
+    """Returns the total cost of the rows' columns in a matching's column rows list."""
+    return sum(costs[row - 1][column - 1] for column, row in enumerate(column_row)
+               if column > 0 and row > 0)
+
+
+def solve(level_obj, start_state=None, max_nodes=MAX_NODES, time_limit=TIME_LIMIT, weight=1,
+          cancel_event=None):
+    """Searches for a solution to the level, starting from start_state (a game_state_obj, which
+    defaults to the level's starting state).
+
+    cancel_event can be a threading.Event; the search stops soon after it is set, as if it had
+    run out of time. This lets a search on another thread be cancelled.
+
+    When weight is 1 the search is a true A* search and the solution has the fewest possible
+    pushes. Larger weights make the search greedier: it finds solutions much faster, but they
+    might use more pushes than needed.
+
+    Returns a dict with the result of the search:
+        'solved' - True if a solution was found, False if the level is impossible, or None if
+                   the search ran out of nodes or time before it could tell.
+        'stopped' - when 'solved' is None, NODE_LIMIT_HIT, TIME_LIMIT_HIT or CANCELLED for
+                    what stopped the search, otherwise None.
+        'solution' - the solution as a list of UP/DOWN/LEFT/RIGHT values for make_move().
+        'lurd' - the solution as a LURD string (uppercase letters are pushes).
+        'moves', 'pushes' - the number of moves and pushes in the solution.
+        'nodes' - how many positions the search expanded.
+        'time' - how many seconds the search took."""
+    start_time = time.time()
+    if start_state is None:
+        start_state = level_obj['start_state']
+
+    # The push distances and dead squares are worked out once per level (see star_analysis.py).
+    analysis = get_level_analysis(level_obj)
+    grid = analysis['grid']
+    width = grid.width
+    directions = tuple(grid.offsets.items())
+    goals = grid.goals
+    goal_mask = grid.goal_mask
+    goal_distances = analysis['goal_distances']
+    dead = analysis['dead']
+    nearest_goal = analysis['nearest_goal']
+
+    floor_mask = 0
+    dead_mask = 0  # the dead squares that aren't goals
+    for cell in range(grid.size):
+        if not grid.walls[cell]:
+            floor_mask |= 1 << cell
+            if dead[cell] and cell not in goals:
+                dead_mask |= 1 << cell
+
+    result = {'solved': None, 'stopped': None, 'solution': None, 'lurd': None, 'moves': None,
+              'pushes': None, 'nodes': 0, 'time': 0.0}
+
+    start = grid.from_game_state_obj(start_state)
+    if start.stars & dead_mask:
+        # A star starts out somewhere it can never be pushed from onto a goal.
+        result['solved'] = False
+        result['time'] = time.time() - start_time
+        return result
+
+    # Stars stuck on goals for good are left out of the lower bound, along with their goals.
+    fixed = find_fixed_stars(analysis, start.stars)
+    open_goal_distances = [distances for goal, distances in zip(analysis['goals'],
+                                                                goal_distances)
+                           if not (fixed >> goal) & 1]
+    one_star_per_goal = len(start_state['stars']) == len(goals)
+
+    # The lower bound on the number of pushes left: every goal needs its own star, so the
+    # cheapest way of giving each goal a different star (by push distance) can never cost more
+    # than the real pushes. Each position's matching is kept as a (stars, matching) pair, with
+    # the stars in the same order as the matching's columns, so that after a push only the
+    # pushed star's column has changed and update_matching() can fix the matching up. A None
+    # matching means the goals can't all get a star, so the position is a deadlock.
+    def get_costs(star_cells):
+        return [[distances[star] for star in star_cells] for distances in open_goal_distances]
+
+    def get_pushed_matching(previous_matching, push):
+        # Returns the (stars, matching) pair for the position after the push.
+        star_cells, matching = previous_matching
+        star, direction, push_count = push
+        column = star_cells.index(star)
+        star_cells = list(star_cells)
+        star_cells[column] = star + grid.offsets[direction] * push_count
+        if one_star_per_goal:
+            return star_cells, update_matching(get_costs(star_cells), matching, column)
+        return star_cells, get_matching(get_costs(star_cells), len(star_cells))
+
+    def get_quick_bound(stars):
+        # A quicker, weaker lower bound that is kept up to date push by push: each star's
+        # distance to its nearest goal (which is 0 when there are more stars than goals).
+        if not one_star_per_goal:
+            return 0
+        return sum(nearest_goal[star] for star in grid.star_cells(stars))
+
+    start_cells = list(grid.star_cells(start.stars & ~fixed))
+    start_matching = (start_cells, get_matching(get_costs(start_cells), len(start_cells)))
+    if start_matching[1] is None:
+        result['solved'] = False
+        result['time'] = time.time() - start_time
+        return result
+
+    # Tunnel macros: a star pushed along a tunnel (a space with walls on both sides) that is
+    # the only way between the spaces behind and in front of it can never be pushed back out,
+    # so it has to go on through the tunnel at some point. Nothing else can get past it in the
+    # meantime, so it is pushed on right away, all the way to the end of the tunnel or to a
+    # goal, as one step of the search. (With more stars than goals a star could be left in the
+    # tunnel for good, so macros are only used when the numbers match.)
+    tunnels = analysis['tunnels']
+    inside = analysis['inside']
+    tunnel_kinds = dict((offset, HORIZONTAL if offset in (-1, 1) else VERTICAL)
+                        for direction, offset in directions)
+    one_way = {}  # (space, offset) -> is_one_way() for it
+
+    # Positions are only compared once they come off the heap, with the player moved to the
+    # lowest numbered space they can reach, so the walk around each position is only worked
+    # out once. came_from maps each of these positions to (previous position, (star space
+    # pushed, direction pushed, how many times it was pushed)).
+    came_from = {}
+    best_pushes = {}  # (stars, player space) -> fewest pushes found so far to that position
+    # Each heap entry is (estimated total pushes, estimate of the pushes left, counter, pushes,
+    # stars, player space, previous position, push, matching, quick). Ties are broken by the
+    # estimate of the pushes left, so positions closer to being solved are tried first, and
+    # then by the counter without comparing the rest.
+    # When quick is True the matching is still the previous position's, and the estimate may
+    # only be get_quick_bound(). The full matching is only worked out for positions that come
+    # off the heap, and if its cost is higher the position goes back on the heap with it. The
+    # costs are also kept in matching_costs, since the same stars come up again and again with
+    # the player in different places.
+    matching_costs = {}  # stars integer -> the matching's cost for those stars, or None
+    counter = 0
+    start_h = start_matching[1][0]
+    open_heap = [(start_h * weight, start_h, counter, 0, start.stars, start.player, None, None,
+                  start_matching, False)]
+    nodes = 0
+    solution_key = None
+
+    while open_heap:
+        f, h, _, pushes, stars, player, previous, push, matching, quick = \
+            heapq.heappop(open_heap)
+
+        if quick and stars not in matching_costs:
+            matching = get_pushed_matching(matching, push)
+            matching_costs[stars] = None if matching[1] is None else matching[1][0]
+            quick = False
+        if previous is not None:
+            full_h = matching_costs[stars]
+            if full_h is None:
+                continue  # some goal can't get a star any more
+            if full_h > h:
+                counter += 1
+                heapq.heappush(open_heap, (pushes + weight * full_h, full_h, counter, pushes,
+                                           stars, player, previous, push, matching, quick))
+                continue
+
+        reach = find_reachable_mask(floor_mask, width, player, stars)
+        key = (stars, (reach & -reach).bit_length() - 1)
+        if key in came_from:
+            continue  # this position was already reached with as few pushes
+        came_from[key] = None if previous is None else (previous, push)
+
+        if stars & goal_mask == goal_mask:
+            solution_key = key
+            break
+
+        nodes += 1
+        if nodes > max_nodes:
+            result['stopped'] = NODE_LIMIT_HIT
+            break
+        if nodes % 100 == 0:
+            if time.time() - start_time > time_limit:
+                result['stopped'] = TIME_LIMIT_HIT
+                break
+            if cancel_event is not None and cancel_event.is_set():
+                result['stopped'] = CANCELLED
+                break
+
+        if quick:
+            matching = get_pushed_matching(matching, push)
+
+        # Only the stars around a PI-corral need to be pushed, if there is one.
+        corral_stars = find_pi_corral(floor_mask, width, reach, stars, dead_mask, goal_mask,
+                                      one_star_per_goal)
+        if corral_stars == 0:
+            continue  # a corral that can never be finished
+        pushed_stars = stars if corral_stars is None else corral_stars
+
+        # The spaces a star can be pushed onto: empty floor that isn't a dead square.
+        targets = floor_mask & ~stars & ~dead_mask
+        quick_h = get_quick_bound(stars)
+        for direction, offset in directions:
+            # The player must stand behind the star, and the space in front must be open.
+            movable = pushed_stars & shift_mask(reach, offset) & shift_mask(targets, -offset)
+            tunnel_kind = tunnel_kinds[offset]
+            while movable:
+                lowest_bit = movable & -movable
+                movable ^= lowest_bit
+                star = lowest_bit.bit_length() - 1
+                push_to = star + offset
+                push_count = 1
+                while one_star_per_goal and tunnels[push_to] == tunnel_kind and \
+                        push_to not in goals and (targets >> (push_to + offset)) & 1:
+                    if (push_to, offset) not in one_way:
+                        one_way[(push_to, offset)] = is_one_way(grid, inside, push_to, offset)
+                    if not one_way[(push_to, offset)]:
+                        break
+                    push_to += offset
+                    push_count += 1
+                new_stars = stars ^ lowest_bit ^ (1 << push_to)
+                if is_freeze_deadlock(grid, push_to, new_stars, dead, goals):
+                    continue
+
+                # The player ends up behind where the star was pushed to.
+                new_player = push_to - offset
+                new_pushes = pushes + push_count
+                if best_pushes.get((new_stars, new_player), new_pushes + 1) <= new_pushes:
+                    continue
+                best_pushes[(new_stars, new_player)] = new_pushes
+                if one_star_per_goal:
+                    new_h = quick_h - nearest_goal[star] + nearest_goal[push_to]
+                else:
+                    new_h = 0
+                counter += 1
+                heapq.heappush(open_heap, (new_pushes + weight * new_h, new_h, counter,
+                                           new_pushes, new_stars, new_player, key,
+                                           (star, direction, push_count), matching, True))
+
+    result['nodes'] = nodes
+    if solution_key is not None:
+        solution = build_solution(grid, came_from, solution_key, start)
+        result['solved'] = True
+        result['solution'] = solution
+        result['lurd'] = solution_to_lurd(level_obj, start_state, solution)
+        result['moves'] = len(solution)
+        result['pushes'] = sum(1 for letter in result['lurd'] if letter.isupper())
+    elif not open_heap:
+        result['solved'] = False  # every position was tried
+    result['time'] = time.time() - start_time
+    return result
+
+
+def solve_cached(db, level_obj, start_state=None, max_nodes=MAX_NODES, time_limit=TIME_LIMIT,
+                 weight=1, cancel_event=None):
+    """Works like solve(), but looks the level up in the SolutionDB first, and saves the result
+    of any search it has to run. The returned dict also has 'cached', which is True if the
+    answer came from the database.
+
+    A saved solution is only used if it is known to have the fewest pushes, or if weight isn't 1
+    (so the caller didn't ask for the fewest pushes anyway). It is checked with make_move()
+    before it is returned."""
+    start_time = time.time()
+    known = db.lookup(level_obj, start_state)
+    if known is not None:
+        result = {'solved': None, 'stopped': None, 'solution': None, 'lurd': None,
+                  'moves': None, 'pushes': None, 'nodes': 0, 'time': 0.0, 'cached': True}
+        if known['status'] == UNSOLVABLE:
+            # The layout keeps every star and goal, even ones the player can't get to, so a
+            # layout that can't be solved means this level can't be either.
+            result['solved'] = False
+            result['time'] = time.time() - start_time
+            return result
+        if known['status'] == SOLVED and (known['push_optimal'] or weight != 1) and \
+           verify_solution(level_obj, known['push_lurd'], start_state):
+            result['solved'] = True
+            result['lurd'] = known['push_lurd']
+            result['solution'] = [LURD_TO_DIRECTION[letter.lower()] for letter in result['lurd']]
+            result['moves'] = known['push_moves']
+            result['pushes'] = known['push_pushes']
+            result['time'] = time.time() - start_time
+            return result
+
+    result = solve(level_obj, start_state, max_nodes, time_limit, weight, cancel_event)
+    if cancel_event is None or not cancel_event.is_set():
+        db.record_search(level_obj, result, start_state, push_optimal=weight == 1)
+    result['cached'] = False
+    return result
+
+
+def build_solution(grid, came_from, solution_key, start):
+    """Turns the chain of pushes stored in came_from into the full list of moves, including the
+    walking the player does between pushes."""
+    pushes = []
+    key = solution_key
+    while came_from[key] is not None:
+        key, push = came_from[key]
+        pushes.append(push)
+    pushes.reverse()
+
+    solution = []
+    state = start
+    for star, direction, push_count in pushes:
+        offset = grid.offsets[direction]
+        solution.extend(find_path(grid, state.player, star - offset, state.stars))
+        for i in range(push_count):  # a tunnel macro pushes the same star several times
+            solution.append(direction)
+            state = grid.push(state, star, offset)
+            star += offset
+    return solution
+
+
+def solution_to_lurd(level_obj, start_state, solution):
+    """Replays the solution with make_move() and returns it as a LURD string, where the pushes
+    are uppercase letters."""
+    game_state_obj = {'player': start_state['player'],
+                      'step_counter': 0,
+                      'stars': list(start_state['stars'])}
+    lurd = []
+    for direction in solution:
+        stars_before = list(game_state_obj['stars'])
+        make_move(level_obj['map_obj'], game_state_obj, direction)
+        letter = DIRECTION_TO_LURD[direction]
+        if game_state_obj['stars'] != stars_before:
+            letter = letter.upper()
+        lurd.append(letter)
+    return ''.join(lurd)
+
+
+def verify_solution(level_obj, solution, start_state=None):
+    """Returns True if playing the solution (a list of directions or a LURD string) with
+    make_move() solves the level."""
+    if start_state is None:
+        start_state = level_obj['start_state']
+    game_state_obj = {'player': start_state['player'],
+                      'step_counter': 0,
+                      'stars': list(start_state['stars'])}
+    for direction in solution:
+        direction = LURD_TO_DIRECTION.get(direction.lower(), direction)
+        if not make_move(level_obj['map_obj'], game_state_obj, direction):
+            return False
+    return is_level_finished(level_obj, game_state_obj)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Solve Star Pusher levels.')
+    parser.add_argument('levels', nargs='*', type=int,
+                        help='level numbers to solve, starting at 1 (default: all of them)')
+    parser.add_argument('--file', default='starPusherLevels.txt', help='the level file to read')
+    parser.add_argument('--nodes', type=int, default=MAX_NODES,
+                        help='the most positions to search per level')
+    parser.add_argument('--time', type=float, default=TIME_LIMIT,
+                        help='the most seconds to search per level')
+    parser.add_argument('--weight', type=float, default=1,
+                        help='greater than 1 finds solutions faster, but not always the shortest')
+    parser.add_argument('--db', nargs='?', const=SOLUTION_DB_FILENAME, default=None,
+                        help='look up and save solutions in a solution database (default file: '
+                             '%s)' % (SOLUTION_DB_FILENAME))
+    args = parser.parse_args()
+
+    levels = read_levels_file(args.file)
+    level_nums = args.levels or range(1, len(levels) + 1)
+    db = SolutionDB(args.db) if args.db else None
+    for level_num in level_nums:
+        if db is not None:
+            result = solve_cached(db, levels[level_num - 1], max_nodes=args.nodes,
+                                  time_limit=args.time, weight=args.weight)
+        else:
+            result = solve(levels[level_num - 1], max_nodes=args.nodes, time_limit=args.time,
+                           weight=args.weight)
+        if result.get('cached'):
+            status = 'found in the solution database: '
+        else:
+            status = ''
+        if result['solved']:
+            status += 'solved in %s moves, %s pushes' % (result['moves'], result['pushes'])
+        elif result['solved'] is False:
+            status += 'impossible'
+        elif result['stopped'] == NODE_LIMIT_HIT:
+            status += 'gave up at the node limit'
+        else:
+            status += 'gave up at the time limit'
+        print('Level %s: %s (%s nodes, %.2f seconds)' % (level_num, status, result['nodes'],
+                                                         result['time']))
+        if result['solved']:
+            print('  ' + result['lurd'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+# Star Pusher compact game states
+# A small, immutable game state type for searching, undo and replays.
+#
+# The game_state_obj dicts used by star_pusher.py keep the stars in a list of (x, y) tuples, so
+# finding a star means scanning the whole list and saving a state means a copy.deepcopy(). Here a
+# game state is instead:
+#   * the player's space, as a single number (an index into the level's grid),
+#   * the stars, as the bits of one integer (bit i is set if there is a star on space i),
+#   * a Zobrist hash of the two, which is updated with two XORs on every move.
+# Checking for a star is a single bit test, a move builds a new state without copying any lists,
+# and states can go straight into sets and dicts. Hashing a state just returns its Zobrist hash,
+# but comparing two states (and each move's XOR) still works on the whole stars integer, which
+# has a bit for every space on the grid, so those costs grow with the size of the level.
+#
+# The rules here (LevelGrid.move()) and in star_engine.make_move() must stay the same. Both use
+# star_engine.is_floor() to decide which spaces can be walked on, so spaces off the edge of the
+# map are walls to both.
+#
+# Moves can also be stored as small "deltas" (where the player and any pushed star moved from and
+# to), which is all a MoveHistory needs to undo and redo them.
+
+import random
+
+from star_engine import UP, DOWN, LEFT, RIGHT, is_floor
+
+ZOBRIST_SEED = 20120503  # fixed so hashes are the same every time the game runs
+
+
+class GameState(tuple):
+    """An immutable (player, stars, zobrist) game state. Use a LevelGrid to make and move
+    these, since the numbers only make sense for the level they came from."""
+    __slots__ = ()
+
+    def __new__(cls, player, stars, zobrist):
+        return tuple.__new__(cls, (player, stars, zobrist))
+
+    @property
+    def player(self):
+        return self[0]
+
+    @property
+    def stars(self):
+        return self[1]
+
+    @property
+    def zobrist(self):
+        return self[2]
+
+    def __hash__(self):
+        # The Zobrist hash is already a good hash of the state, so there's no need to hash the
+        # (possibly very large) stars integer again.
+        return self[2]
+
+
+class StarView(object):
+    """A read-only view of a GameState's stars that works like the list of (x, y) tuples in a
+    game_state_obj, but with O(1) "in" checks."""
+    __slots__ = ('grid', 'bits')
+
+    def __init__(self, grid, bits):
+        self.grid = grid
+        self.bits = bits
+
+    def __contains__(self, xy):
+        x, y = xy
+        if x < 0 or x >= self.grid.map_width or y < 0 or y >= self.grid.map_height:
+            return False  # x and y aren't actually on the map.
+        return (self.bits >> self.grid.index(xy)) & 1 == 1
+
+    def __iter__(self):
+        for cell in self.grid.star_cells(self.bits):
+            yield self.grid.xy(cell)
+
+    def __len__(self):
+        return bin(self.bits).count('1')
+
+
+class LevelGrid(object):
+    """The walls, goals and Zobrist keys of one level, flattened into lists indexed by space.
+
+    The grid has a border of walls added around the map, so nothing ever has to check if a space
+    is off of the map. (Like make_move(), this treats spaces off the map as walls.) Map position (x, y) is grid index (y + 1) * width + (x + 1)."""
+
+    def __init__(self, level_obj):
+        map_obj = level_obj['map_obj']
+        self.level_obj = level_obj
+        self.map_width = len(map_obj)
+        self.map_height = len(map_obj[0])
+        self.width = self.map_width + 2
+        self.height = self.map_height + 2
+        self.size = self.width * self.height
+
+        self.walls = [True] * self.size
+        for x in range(self.map_width):
+            for y in range(self.map_height):
+                if is_floor(map_obj, x, y):
+                    self.walls[self.index((x, y))] = False
+
+        # The offsets that move one space in each direction.
+        self.offsets = {UP: -self.width, DOWN: self.width, LEFT: -1, RIGHT: 1}
+
+        self.goals = frozenset(self.index(goal) for goal in level_obj['goals'])
+        self.goal_mask = 0
+        for goal in self.goals:
+            self.goal_mask |= 1 << goal
+
+        # One random 64-bit number for the player and one for a star on each space. A state's
+        # hash is the XOR of the numbers for everything in it.
+        rand = random.Random(ZOBRIST_SEED)
+        self.player_keys = [rand.getrandbits(64) for i in range(self.size)]
+        self.star_keys = [rand.getrandbits(64) for i in range(self.size)]
+
+    def index(self, xy):
+        """Returns the grid index for the (x, y) map position."""
+        return (xy[1] + 1) * self.width + (xy[0] + 1)
+
+    def xy(self, index):
+        """Returns the (x, y) map position for the grid index."""
+        return index % self.width - 1, index // self.width - 1
+
+    def star_cells(self, stars):
+        """Yields the grid index of every star in the stars integer, from lowest to highest."""
+        while stars:
+            lowest_bit = stars & -stars
+            yield lowest_bit.bit_length() - 1
+            stars ^= lowest_bit
+
+    def make_state(self, player, star_cells):
+        """Returns a GameState with the player and stars on the given grid indexes."""
+        stars = 0
+        zobrist = self.player_keys[player]
+        for cell in star_cells:
+            stars |= 1 << cell
+            zobrist ^= self.star_keys[cell]
+        return GameState(player, stars, zobrist)
+
+    def start_state(self):
+        """Returns the level's starting GameState."""
+        return self.from_game_state_obj(self.level_obj['start_state'])
+
+    def from_game_state_obj(self, game_state_obj):
+        """Returns the GameState for a game_state_obj dict."""
+        return self.make_state(self.index(game_state_obj['player']),
+                               [self.index(star) for star in game_state_obj['stars']])
+
+    def to_game_state_obj(self, state, step_counter=0):
+        """Returns a game_state_obj dict for the GameState, so it can be used with draw_map(),
+        is_level_finished() and the rest of the code that expects one. The stars are a StarView,
+        not a list, so they can't be changed through the dict."""
+        return {'player': self.xy(state.player),
+                'step_counter': step_counter,
+                'stars': StarView(self, state.stars)}
+
+    def has_star(self, state, cell):
+        """Returns True if there is a star on the grid index."""
+        return (state.stars >> cell) & 1 == 1
+
+    def move(self, state, direction):
+        """Works like make_move() but on a GameState: returns the GameState after the player
+        moves in the direction (pushing a star if there is one in the way), or None if the
+        player can't move that way."""
+        offset = self.offsets[direction]
+        player = state.player
+        move_to = player + offset
+        if self.walls[move_to]:
+            return None
+        stars = state.stars
+        zobrist = state.zobrist ^ self.player_keys[player] ^ self.player_keys[move_to]
+        if (stars >> move_to) & 1:
+            # There is a star in the way, see if the player can push it.
+            push_to = move_to + offset
+            if self.walls[push_to] or (stars >> push_to) & 1:
+                return None
+            stars ^= (1 << move_to) | (1 << push_to)
+            zobrist ^= self.star_keys[move_to] ^ self.star_keys[push_to]
+        return GameState(move_to, stars, zobrist)
+
+    def push(self, state, star, offset):
+        """Returns the GameState after the star on the grid index is pushed by offset, with the
+        player left standing where the star was. This doesn't check if the push is possible."""
+        push_to = star + offset
+        return GameState(star, state.stars ^ ((1 << star) | (1 << push_to)),
+                         state.zobrist ^ self.player_keys[state.player] ^
+                         self.player_keys[star] ^ self.star_keys[star] ^ self.star_keys[push_to])
+
+    def with_player(self, state, player):
+        """Returns the GameState with the player moved to another grid index and the same
+        stars. This doesn't check if the player can walk there."""
+        return GameState(player, state.stars,
+                         state.zobrist ^ self.player_keys[state.player] ^ self.player_keys[player])
+
+    def is_solved(self, state):
+        """Returns True if every goal has a star on it."""
+        return state.stars & self.goal_mask == self.goal_mask
+
+    def get_delta(self, state, new_state):
+        """Returns the delta for a single move from state to new_state: a tuple of
+        (player_from, player_to, star_from, star_to) grid indexes, where star_from and star_to
+        are None if the move didn't push a star."""
+        player_from = state.player
+        player_to = new_state.player
+        if state.stars == new_state.stars:
+            return (player_from, player_to, None, None)
+        # A pushed star was where the player moved to, and moved one more space the same way.
+        return (player_from, player_to, player_to, player_to + (player_to - player_from))
+
+    def apply_delta(self, state, delta):
+        """Returns the GameState after making the move described by delta."""
+        player_from, player_to, star_from, star_to = delta
+        stars = state.stars
+        zobrist = state.zobrist ^ self.player_keys[player_from] ^ self.player_keys[player_to]
+        if star_from is not None:
+            stars ^= (1 << star_from) | (1 << star_to)
+            zobrist ^= self.star_keys[star_from] ^ self.star_keys[star_to]
+        return GameState(player_to, stars, zobrist)
+
+    def undo_delta(self, state, delta):
+        """Returns the GameState from before the move described by delta was made."""
+        player_from, player_to, star_from, star_to = delta
+        return self.apply_delta(state, (player_to, player_from, star_to, star_from))
+
+
+class MoveHistory(object):
+    """The undo and redo lists for a level. Each move is remembered as a delta (see
+    LevelGrid.get_delta()), so every move costs the same small amount of memory no matter how
+    big the level is, and there is no limit on how far back the player can undo."""
+
+    def __init__(self):
+        self.undo_deltas = []
+        self.redo_deltas = []
+
+    def record(self, delta):
+        """Remembers a move the player just made. Making a new move forgets the moves that
+        could have been redone."""
+        self.undo_deltas.append(delta)
+        if self.redo_deltas:
+            self.redo_deltas = []
+
+    def undo(self):
+        """Returns the delta of the last move to undo, or None if there is nothing to undo."""
+        if not self.undo_deltas:
+            return None
+        delta = self.undo_deltas.pop()
+        self.redo_deltas.append(delta)
+        return delta
+
+    def redo(self):
+        """Returns the delta of the last undone move to make again, or None if there is
+        nothing to redo."""
+        if not self.redo_deltas:
+            return None
+        delta = self.redo_deltas.pop()
+        self.undo_deltas.append(delta)
+        return delta
@@ -0,0 +1,180 @@
+# Star Pusher level validator
+# Checks every level in one or more level files, using all of the computer's CPU cores.
+#
+# For each level this checks:
+#   * the same things read_levels_file() checks (a start point, at least one goal, enough stars),
+#   * that the player can walk to every star and goal (except stars already on goals),
+#   * that the level can be solved, by running the solver with a node and time budget,
+#   * the fewest pushes needed to solve it, and the moves used by that solution.
+# The results are written to a CSV or JSON report. With --db, levels are looked up in a solution
+# database (see star_solutions.py) before they are solved, and new results are saved to it, so
+# checking the same levels again doesn't solve them again.
+#
+# Usage: python star_validate.py starPusherLevels.txt [more level files...] --report report.csv
+
+import argparse, concurrent.futures, csv, json, os, sys, time
+
+from star_engine import LevelCollection
+from star_analysis import get_level_analysis
+from star_solver import solve, solve_cached, MAX_NODES, TIME_LIMIT, NODE_LIMIT_HIT
+from star_solutions import SolutionDB, SOLUTION_DB_FILENAME
+
+REPORT_FIELDS = ['file', 'level', 'status', 'message', 'width', 'height', 'stars', 'goals',
+                 'pushes', 'moves', 'nodes', 'seconds', 'cached', 'solution']
+
+# The statuses a level can have in the report:
+SOLVED = 'solved'  # the solver found a solution
+UNSOLVABLE = 'unsolvable'  # the solver proved there is no solution
+UNKNOWN = 'unknown'  # the solver ran out of nodes or time
+INVALID = 'invalid'  # the level breaks one of the level file rules
+UNREACHABLE = 'unreachable'  # the player can't walk to some of the stars or goals
+
+# Each worker process keeps the LevelCollection for each file it has opened, so the file is only
+# scanned once per process, and likewise for the solution database.
+worker_collections = {}
+worker_dbs = {}
+
+
+def validate_level(filename, level_num, max_nodes, time_limit, db_filename=None):
+    """Checks one level and returns a dict with the fields in REPORT_FIELDS. This runs in a
+    worker process. If db_filename is given, the solution database in that file is used."""
+    start_time = time.time()
+    result = dict.fromkeys(REPORT_FIELDS, '')
+    result['file'] = filename
+    result['level'] = level_num + 1
+
+    if filename not in worker_collections:
+        worker_collections[filename] = LevelCollection(filename, cache_size=1)
+    try:
+        level_obj = worker_collections[filename][level_num]
+    except AssertionError as error:
+        # The level broke one of the checks in parse_level().
+        result['status'] = INVALID
+        result['message'] = str(error)
+        return result
+
+    result['width'] = len(level_obj['map_obj'])
+    result['height'] = len(level_obj['map_obj'][0])
+    result['stars'] = len(level_obj['start_state']['stars'])
+    result['goals'] = len(level_obj['goals'])
+
+    # Stars that already sit on goals are fine anywhere, even in a walled-off part of the map
+    # that is only there for decoration, since they never have to be pushed. Only the empty goals
+    # and the stars that still have to be pushed must be reachable.
+    analysis = get_level_analysis(level_obj)
+    grid = analysis['grid']
+    goals = set(level_obj['goals'])
+    stars = set(level_obj['start_state']['stars'])
+    unreachable = sorted(xy for xy in goals ^ stars if grid.index(xy) not in analysis['inside'])
+    if unreachable:
+        result['status'] = UNREACHABLE
+        result['message'] = 'The player cannot reach the stars or goals at %s.' % (
+            ', '.join('(%s, %s)' % xy for xy in unreachable))
+        result['seconds'] = round(time.time() - start_time, 3)
+        return result
+
+    if db_filename is None:
+        solution = solve(level_obj, max_nodes=max_nodes, time_limit=time_limit)
+    else:
+        if db_filename not in worker_dbs:
+            worker_dbs[db_filename] = SolutionDB(db_filename)
+        solution = solve_cached(worker_dbs[db_filename], level_obj, max_nodes=max_nodes,
+                                time_limit=time_limit)
+        result['cached'] = solution['cached']
+    result['nodes'] = solution['nodes']
+    if solution['solved']:
+        result['status'] = SOLVED
+        result['pushes'] = solution['pushes']
+        result['moves'] = solution['moves']
+        result['solution'] = solution['lurd']
+    elif solution['solved'] is False:
+        result['status'] = UNSOLVABLE
+        result['message'] = 'No solution exists.'
+    else:
+        result['status'] = UNKNOWN
+        if solution['stopped'] == NODE_LIMIT_HIT:
+            result['message'] = 'The solver hit the node limit after %s nodes.' % (
+                solution['nodes'])
+        else:
+            result['message'] = 'The solver ran out of time after %.1f seconds (%s nodes).' % (
+                solution['time'], solution['nodes'])
+    result['seconds'] = round(time.time() - start_time, 3)
+    return result
+
+
+def validate_files(filenames, workers=None, max_nodes=MAX_NODES, time_limit=TIME_LIMIT,
+                   progress=None, db_filename=None):
+    """Checks every level in the level files across a pool of worker processes, and returns
+    the list of result dicts in file and level order. progress, if given, is called with each
+    result as soon as it is ready. db_filename is the solution database to use, if any."""
+    jobs = []
+    for filename in filenames:
+        # Scanning the file for level boundaries is quick; the parsing happens in the workers.
+        for level_num in range(len(LevelCollection(filename))):
+            jobs.append((filename, level_num))
+
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(validate_level, filename, level_num, max_nodes, time_limit,
+                                   db_filename) for filename, level_num in jobs]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results[(result['file'], result['level'])] = result
+            if progress is not None:
+                progress(result)
+    return [results[(filename, level_num + 1)] for filename, level_num in jobs]
+
+
+def write_report(results, report_filename):
+    """Writes the results to a JSON file if report_filename ends with .json, otherwise to a CSV
+    file."""
+    if report_filename.lower().endswith('.json'):
+        with open(report_filename, 'w') as report_file:
+            json.dump(results, report_file, indent=2)
+    else:
+        with open(report_filename, 'w', newline='') as report_file:
+            writer = csv.DictWriter(report_file, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check every level in Star Pusher level files.')
+    parser.add_argument('files', nargs='+', help='the level files to check')
+    parser.add_argument('--report', default='level_report.csv',
+                        help='the file to write the results to (.csv or .json)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='how many processes to use (default: one per CPU core)')
+    parser.add_argument('--nodes', type=int, default=MAX_NODES,
+                        help='the most positions to search per level')
+    parser.add_argument('--time', type=float, default=TIME_LIMIT,
+                        help='the most seconds to search per level')
+    parser.add_argument('--db', nargs='?', const=SOLUTION_DB_FILENAME, default=None,
+                        help='look up and save solutions in a solution database (default file: '
+                             '%s)' % (SOLUTION_DB_FILENAME))
+    args = parser.parse_args()
+
+    for filename in args.files:
+        if not os.path.exists(filename):
+            sys.exit('Cannot find the level file: %s' % (filename))
+
+    def show_progress(result):
+        print('%s level %s: %s %s' % (result['file'], result['level'], result['status'],
+                                      result['message']))
+
+    start_time = time.time()
+    results = validate_files(args.files, args.workers, args.nodes, args.time, show_progress,
+                             args.db)
+    write_report(results, args.report)
+
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    print('Checked %s levels in %.1f seconds: %s' % (
+        len(results), time.time() - start_time,
+        ', '.join('%s %s' % (count, status) for status, count in sorted(counts.items()))))
+    print('Report written to %s' % (args.report))
+
+
+if __name__ == '__main__':
+    main()